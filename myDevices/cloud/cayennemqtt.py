@@ -1,15 +1,38 @@
+import random
+import ssl
 import time
-from json import loads, decoder
-from ssl import PROTOCOL_TLSv1_2
+from json import dumps, loads, decoder
+from math import isfinite
+from threading import Event, RLock, Thread
 import paho.mqtt.client as mqtt
 from myDevices.utils.logger import debug, error, exception, info, logJson, warn
 
 # Topics
 DATA_TOPIC = 'data/json'
+DATA_MSGPACK_TOPIC = 'data/msgpack'
+DATA_CBOR_TOPIC = 'data/cbor'
 COMMAND_TOPIC = 'cmd'
 COMMAND_JSON_TOPIC = 'cmd.json'
 COMMAND_RESPONSE_TOPIC = 'response'
+COMMAND_JSON_RESPONSE_TOPIC = 'response.json'
 JOBS_TOPIC = 'jobs.json'
+RULES_TOPIC = 'rules.json'
+
+# Connection states
+STATE_DISCONNECTED = 'disconnected'
+STATE_CONNECTING = 'connecting'
+STATE_CONNECTED = 'connected'
+STATE_BACKOFF = 'backoff'
+
+RECONNECT_MIN_DELAY = 1 #seconds
+RECONNECT_MAX_DELAY = 300 #seconds
+
+CA_CERTS = '/etc/ssl/certs/ca-certificates.crt'
+
+# Default QoS for each topic, topics not listed use QoS 0
+DEFAULT_QOS = {DATA_TOPIC: 1, COMMAND_RESPONSE_TOPIC: 1, COMMAND_JSON_RESPONSE_TOPIC: 1}
+DEFAULT_WINDOW = 10 #maximum number of unacknowledged messages
+DEFAULT_RETRANSMITS = 3 #maximum number of times an unacknowledged message is resent after reconnecting
 
 # Data Channels
 SYS_HARDWARE_MAKE = 'sys:hw:make'
@@ -20,6 +43,8 @@ SYS_NET = 'sys:net'
 SYS_STORAGE = 'sys:storage'
 SYS_RAM = 'sys:ram'
 SYS_CPU = 'sys:cpu'
+SYS_THERMAL = 'sys:thermal'
+SYS_PROCESS = 'sys:proc'
 SYS_I2C = 'sys:i2c'
 SYS_SPI = 'sys:spi'
 SYS_UART = 'sys:uart'
@@ -32,11 +57,15 @@ AGENT_VERSION = 'agent:version'
 AGENT_DEVICES = 'agent:devices'
 AGENT_MANAGE = 'agent:manage'
 AGENT_SCHEDULER = 'agent:scheduler'
+AGENT_RULES = 'agent:rules'
+AGENT_MQTT = 'agent:mqtt'
+AGENT_QUEUE = 'agent:queue'
 DEV_SENSOR = 'dev'
 
 # Channel Suffixes
 IP = 'ip'
 SPEEDTEST = 'speedtest'
+LATENCY = 'latency'
 SSID = 'ssid'
 USAGE = 'usage'
 CAPACITY = 'capacity'
@@ -44,6 +73,18 @@ LOAD = 'load'
 TEMPERATURE = 'temp'
 VALUE = 'value'
 FUNCTION = 'function'
+RX_RATE = 'rxrate'
+TX_RATE = 'txrate'
+RX_PACKETS = 'rxpackets'
+TX_PACKETS = 'txpackets'
+ERRORS = 'errors'
+DROPS = 'drops'
+SIGNAL = 'signal'
+QUALITY = 'quality'
+BITRATE = 'bitrate'
+FAILURES = 'failures'
+RECONNECT_TIME = 'reconnecttime'
+DEPTH = 'depth'
 
 
 class DataChannel:
@@ -88,6 +129,269 @@ class DataChannel:
             data_list.append(data)
             
 
+class SessionContext(ssl.SSLContext):
+    """SSL context that offers the last TLS session for a host when connecting to it again,
+    so reconnects can resume the session instead of doing a full handshake."""
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT, *args, **kwargs):
+        return super().__new__(cls, protocol, *args, **kwargs)
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        """Initialize the context with no saved sessions"""
+        self.sessions = {}
+        self.minimum_version = ssl.TLSVersion.TLSv1_2
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        """Wrap a socket, using the saved session for server_hostname if there is one"""
+        if kwargs.get('session') is None:
+            kwargs['session'] = self.sessions.get(kwargs.get('server_hostname'))
+        return super().wrap_socket(sock, *args, **kwargs)
+
+    def save_session(self, hostname, sock):
+        """Save the session of a connected socket for resuming later connections to hostname"""
+        if isinstance(sock, ssl.SSLSocket) and sock.session:
+            self.sessions[hostname] = sock.session
+
+
+class JSONSerializer:
+    """Serializer that encodes data packets as a JSON list of channel dicts.
+
+    Only the value of a channel usually changes between packets, so the JSON before and after the value
+    is cached for each channel and the encoded value is spliced in between. Channels like GPIO pins
+    only switch between a few int or str values, so the complete JSON of the last few of those values
+    is cached too, making most items a dict lookup. The output is the same as dumps().
+    """
+    topic = DATA_TOPIC
+    fragment_keys = frozenset(('channel', 'value', 'type', 'unit', 'name'))
+    max_values = 8 #maximum number of encoded values cached per channel
+    requires_ack = False #True if the last encoded packet must be published with QoS 1 or higher
+
+    def __init__(self):
+        """Initialize an empty fragment cache"""
+        self.fragments = {}
+
+    def encode(self, data):
+        """Return the encoded data packet."""
+        items = []
+        for item in data:
+            # The keys in order and the values of the keys other than channel and value identify the cached JSON
+            static = (tuple(item), item.get('type'), item.get('unit'), item.get('name'))
+            entry = self.fragments.get(item['channel'])
+            if entry is None or entry[0] != static:
+                entry = self.fragment(item, static)
+            static, prefix, suffix, texts = entry
+            if prefix is None:
+                items.append(dumps(item))
+                continue
+            value = item['value']
+            value_type = type(value)
+            # Only exact int and str values are cached, bools and floats can compare equal to ints
+            if value_type is int or value_type is str:
+                text = texts.get(value)
+                if text is None:
+                    text = prefix + dumps(value) + suffix
+                    if len(texts) < self.max_values:
+                        texts[value] = text
+                items.append(text)
+            elif value_type is float and isfinite(value):
+                items.append(prefix + float.__repr__(value) + suffix)
+            else:
+                items.append(prefix + dumps(value) + suffix)
+        return '[' + ', '.join(items) + ']'
+
+    def fragment(self, item, static):
+        """Cache and return the (static, prefix, suffix, texts) entry for an item's channel, prefix is None if the item cannot be cached."""
+        keys = list(item)
+        if 'value' not in item or not self.fragment_keys.issuperset(keys):
+            entry = (static, None, None, None)
+        else:
+            index = keys.index('value')
+            pairs = ['{}: {}'.format(dumps(key), dumps(item[key])) for key in keys]
+            prefix = '{' + ''.join(pair + ', ' for pair in pairs[:index]) + '"value": '
+            suffix = ''.join(', ' + pair for pair in pairs[index + 1:]) + '}'
+            entry = (static, prefix, suffix, {})
+        self.fragments[item['channel']] = entry
+        return entry
+
+    def reset(self):
+        """Reset any per-connection state, called when a new connection is made."""
+        pass
+
+
+class CompactSerializer(JSONSerializer):
+    """Base class for binary serializers that use a per-connection channel dictionary.
+
+    Each item is encoded as a list. The first time a channel is sent on a connection, or when its
+    type, unit or name change, the item announces the channel: [id, value, channel, type, unit, name],
+    with trailing None fields left out. After that only [id, value] is sent. Channel IDs are only valid
+    on the connection they were announced on, so the dictionary is cleared on each connection and packets
+    resent after a reconnect must be encoded again. Packets with announcements set requires_ack so they
+    are published with QoS 1, since the compact items sent after them cannot be resolved without them.
+    """
+
+    def __init__(self):
+        """Initialize an empty channel dictionary"""
+        self.channels = {}
+        self.announced = set()
+
+    def compact(self, data):
+        """Return data as a list of compact items, announcing new or changed channels."""
+        items = []
+        self.requires_ack = False
+        for item in data:
+            static = (item['channel'], item.get('type'), item.get('unit'), item.get('name'))
+            entry = self.channels.get(static[0])
+            if entry is None or entry[1] != static:
+                channel_id = entry[0] if entry else len(self.channels)
+                self.channels[static[0]] = (channel_id, static)
+                self.announced.discard(channel_id)
+            else:
+                channel_id = entry[0]
+            if channel_id in self.announced:
+                items.append([channel_id, item['value']])
+            else:
+                announcement = [channel_id, item['value']] + list(static)
+                while announcement[-1] is None:
+                    announcement.pop()
+                items.append(announcement)
+                self.announced.add(channel_id)
+                self.requires_ack = True
+        return items
+
+    def reset(self):
+        """Clear the channel dictionary so all channels are announced again with new IDs on the new connection."""
+        self.channels = {}
+        self.announced = set()
+
+
+class MessagePackSerializer(CompactSerializer):
+    """Serializer that encodes compact data packets with MessagePack, requires the msgpack package."""
+    topic = DATA_MSGPACK_TOPIC
+
+    def __init__(self):
+        import msgpack
+        self.packb = msgpack.packb
+        CompactSerializer.__init__(self)
+
+    def encode(self, data):
+        return self.packb(self.compact(data), use_bin_type=True)
+
+
+class CBORSerializer(CompactSerializer):
+    """Serializer that encodes compact data packets with CBOR, requires the cbor2 package."""
+    topic = DATA_CBOR_TOPIC
+
+    def __init__(self):
+        import cbor2
+        self.dumps = cbor2.dumps
+        CompactSerializer.__init__(self)
+
+    def encode(self, data):
+        return self.dumps(self.compact(data))
+
+
+SERIALIZERS = {'json': JSONSerializer, 'msgpack': MessagePackSerializer, 'cbor': CBORSerializer}
+
+
+def get_serializer(name):
+    """Return a new serializer for the named encoding, falling back to JSON if it is unknown or its package is not installed."""
+    try:
+        return SERIALIZERS[name.lower()]()
+    except KeyError:
+        error('Unknown encoding {}, using JSON'.format(name))
+    except ImportError as ex:
+        error('Encoding {} is not available, using JSON: {}'.format(name, ex))
+    return JSONSerializer()
+
+
+class InFlightWindow:
+    """Class for tracking published QoS 1 and 2 messages until they are acknowledged.
+
+    Unacknowledged messages are resent by the window owner after reconnecting, the window keeps the
+    topic and unencoded message of each one so they can be published again on the new connection.
+    The on_release callback is called with the message ID and True when a message is acknowledged,
+    or False when it is dropped after being retransmitted max_retransmits times.
+    """
+
+    def __init__(self, size=DEFAULT_WINDOW, max_retransmits=DEFAULT_RETRANSMITS, on_release=None):
+        """Initialize an empty window"""
+        self.size = size
+        self.max_retransmits = max_retransmits
+        self.on_release = on_release
+        self.mutex = RLock()
+        self.messages = {}
+
+    def __len__(self):
+        return len(self.messages)
+
+    def is_full(self):
+        """Return True if no more messages should be published until some are acknowledged"""
+        return len(self.messages) >= self.size
+
+    def add(self, message_info, topic=None, message=None, retransmits=0):
+        """Track a message using the MQTTMessageInfo returned when it was published.
+
+        topic and message are the topic and message to publish again if the message is not acknowledged
+        before the connection is lost, retransmits is the number of times it has already been resent.
+        """
+        with self.mutex:
+            self.messages[message_info.mid] = [message_info, retransmits, topic, message]
+
+    def collect(self):
+        """Release the acknowledged messages and return how many there were"""
+        with self.mutex:
+            acknowledged = [mid for mid, message in self.messages.items() if message[0].is_published()]
+            for mid in acknowledged:
+                del self.messages[mid]
+        for mid in acknowledged:
+            self.release(mid, True)
+        return len(acknowledged)
+
+    def reset(self):
+        """Remove the unacknowledged messages after reconnecting and return the ones to resend.
+
+        Messages that have reached max_retransmits are dropped. The others are returned in the order they
+        were published as a list of (topic, message, retransmits) tuples, retransmits including this resend.
+        """
+        self.collect()
+        with self.mutex:
+            dropped = []
+            resend = []
+            for mid, (message_info, retransmits, topic, message) in self.messages.items():
+                if retransmits >= self.max_retransmits:
+                    dropped.append(mid)
+                else:
+                    resend.append((topic, message, retransmits + 1))
+            self.messages = {}
+        for mid in dropped:
+            self.release(mid, False)
+        return resend
+
+    def release(self, mid, delivered):
+        """Call the release callback for a message"""
+        if self.on_release:
+            try:
+                self.on_release(mid, delivered)
+            except:
+                exception('In-flight release callback failed')
+
+
+TLS_CONTEXTS = {}
+
+
+def get_tls_context(ca_certs=CA_CERTS):
+    """Return the shared TLS context for a CA bundle, creating it the first time.
+
+    Loading the CA bundle is expensive on small boards so the context is only built once and
+    reused for every connection."""
+    context = TLS_CONTEXTS.get(ca_certs)
+    if context is None:
+        context = SessionContext()
+        context.load_verify_locations(ca_certs)
+        TLS_CONTEXTS[ca_certs] = context
+    return context
+
+
 class CayenneMQTTClient:
     """Cayenne MQTT Client class.
     
@@ -96,20 +400,44 @@ class CayenneMQTTClient:
     Standard usage:
     * Set on_message callback, if you are receiving data.
     * Connect to Cayenne using the begin() function.
-    * Call loop() at intervals (or loop_forever() once) to perform message processing.
+    * Call loop() at intervals (or loop_start() once) to perform message processing and reconnect with backoff.
     * Send data to Cayenne using write functions: virtualWrite(), celsiusWrite(), etc.
     * Receive and process data from Cayenne in the on_message callback.
 
     The on_message callback can be used by creating a function and assigning it to CayenneMQTTClient.on_message member.
     The callback function should have the following signature: on_message(topic, message)
     If it exists this callback is used as the default message handler.
+
+    Connection state changes can be monitored by adding a callback with add_state_callback().
     """
     client = None
     root_topic = ""
     connected = False
     on_message = None
+
+    def __init__(self):
+        """Initialize the connection state and metrics"""
+        self.state = STATE_DISCONNECTED
+        self.state_callbacks = []
+        self.mutex = RLock()
+        self.stopping = Event()
+        self.thread = None
+        self.next_attempt = 0
+        self.failed_attempts = 0
+        self.failures = 0
+        self.reconnects = 0
+        self.disconnect_time = None
+        self.reconnect_time = None
+        self.hostname = None
+        self.port = None
+        self.username = None
+        self.password = None
+        self.clientid = None
+        self.tls_context = None
+        self.session_reused = False
+        self.topics = {}
     
-    def begin(self, username, password, clientid, hostname='mqtt.mydevices.com', port=8883):
+    def begin(self, username, password, clientid, hostname='mqtt.mydevices.com', port=8883, tls_context=None):
         """Initializes the client and connects to Cayenne.
         
         username is the Cayenne username.
@@ -117,17 +445,95 @@ class CayenneMQTTClient:
         clientid is the Cayennne client ID for the device.
         hostname is the MQTT broker hostname.
         port is the MQTT broker port.
+        tls_context is the SessionContext to use for TLS, by default the shared context for the system CA bundle.
         """
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.clientid = clientid
         self.root_topic = 'v1/{}/things/{}'.format(username, clientid)
-        self.client = mqtt.Client(client_id=clientid, clean_session=True, userdata=self)
+        self.topics = {}
+        if port != 1883:
+            self.tls_context = tls_context or get_tls_context()
+        info('Connecting to {}:{}'.format(hostname, port))
+        self.attempt_connect()
+
+    def create_client(self):
+        """Create the paho client for a new connection attempt."""
+        self.client = mqtt.Client(client_id=self.clientid, clean_session=True, userdata=self)
         self.client.on_connect = self.connect_callback
         self.client.on_disconnect = self.disconnect_callback
         self.client.on_message = self.message_callback
-        self.client.username_pw_set(username, password)
-        if port != 1883:
-            self.client.tls_set(ca_certs='/etc/ssl/certs/ca-certificates.crt', tls_version=PROTOCOL_TLSv1_2)
-        self.client.connect(hostname, port, 60)
-        info('Connecting to {}:{}'.format(hostname, port))
+        self.client.username_pw_set(self.username, self.password)
+        if self.tls_context:
+            self.client.tls_set_context(self.tls_context)
+        self.client.connect_async(self.hostname, self.port, 60)
+
+    def add_state_callback(self, callback):
+        """Add a function to call with the new state when the connection state changes.
+
+        callback should have the signature callback(state), where state is one of the STATE_* constants.
+        """
+        with self.mutex:
+            self.state_callbacks.append(callback)
+
+    def set_state(self, state):
+        """Set the connection state and call the state callbacks if it has changed."""
+        with self.mutex:
+            if state == self.state:
+                return
+            self.state = state
+            callbacks = list(self.state_callbacks)
+        debug('Connection state: {}'.format(state))
+        for callback in callbacks:
+            try:
+                callback(state)
+            except:
+                exception('Connection state callback failed')
+
+    def get_metrics(self):
+        """Return a dict with the connection state, the number of failed connection attempts
+        since the last successful connection, the total number of connection failures, the
+        number of reconnects, the time in seconds the last reconnect took and whether the
+        last connection resumed a previous TLS session."""
+        with self.mutex:
+            return {'state': self.state, 'failed_attempts': self.failed_attempts, 'failures': self.failures,
+                    'reconnects': self.reconnects, 'reconnect_time': self.reconnect_time, 'session_reused': self.session_reused}
+
+    @staticmethod
+    def get_backoff_delay(attempts):
+        """Return the delay in seconds before the next connection attempt.
+
+        The delay doubles with each failed attempt up to RECONNECT_MAX_DELAY, with the
+        upper half randomized so devices don't all reconnect at the same time after an outage.
+        """
+        delay = min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** min(attempts - 1, 16))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def attempt_connect(self):
+        """Try to connect to the broker, scheduling a retry with backoff if it fails.
+
+        Each attempt uses a new paho client, so messages that were not acknowledged on the lost connection
+        are not resent by paho. The owner of the in-flight window resends them once connected instead.
+        """
+        self.set_state(STATE_CONNECTING)
+        try:
+            self.create_client()
+            self.client.reconnect()
+        except Exception as ex:
+            error('Connect failed: {}'.format(ex))
+            self.connection_failed()
+
+    def connection_failed(self):
+        """Schedule the next connection attempt after a failed attempt or a lost connection."""
+        with self.mutex:
+            self.failed_attempts += 1
+            self.failures += 1
+            delay = self.get_backoff_delay(self.failed_attempts)
+            self.next_attempt = time.time() + delay
+        info('Reconnecting in {:.1f} seconds, failed attempts: {}'.format(delay, self.failed_attempts))
+        self.set_state(STATE_BACKOFF)
 
     def connect_callback(self, client, userdata, flags, rc):
         """The callback for when the client connects to the server.
@@ -146,14 +552,29 @@ class CayenneMQTTClient:
                 4 : 'bad user name or password',
                 5 : 'not authorized',
             }
-            raise Exception("Connection failed, " + broker_errors.get(rc, "result code " + str(rc)))
+            # The client closes the connection after a refused CONNACK so the disconnect callback schedules the retry
+            error("Connection failed, " + broker_errors.get(rc, "result code " + str(rc)))
         else:
             info("Connected with result code "+str(rc))
             self.connected = True
+            if self.tls_context:
+                # TLS 1.3 session tickets arrive after the handshake so the session is saved once the CONNACK has been read
+                sock = client.socket()
+                self.session_reused = getattr(sock, 'session_reused', False)
+                self.tls_context.save_session(self.hostname, sock)
+                debug('TLS session reused: {}'.format(self.session_reused))
+            with self.mutex:
+                if self.disconnect_time is not None:
+                    self.reconnect_time = time.time() - self.disconnect_time
+                    self.reconnects += 1
+                    info('Reconnected after {:.1f} seconds'.format(self.reconnect_time))
+                self.disconnect_time = None
+                self.failed_attempts = 0
             # Subscribing in on_connect() means that if we lose the connection and
             # reconnect then subscriptions will be renewed.
             client.subscribe(self.get_topic_string(COMMAND_TOPIC, True))
             client.subscribe(self.get_topic_string(COMMAND_JSON_TOPIC, False))
+            self.set_state(STATE_CONNECTED)
 
     def disconnect_callback(self, client, userdata, rc):
         """The callback for when the client disconnects from the server.
@@ -164,14 +585,15 @@ class CayenneMQTTClient:
         """
         info("Disconnected with result code "+str(rc))
         self.connected = False
-        reconnected = False
-        while not reconnected:
-            try:
-                self.client.reconnect()
-                reconnected = True
-            except:
-                print("Reconnect failed, retrying")
-                time.sleep(5)
+        if rc == mqtt.MQTT_ERR_SUCCESS or self.state == STATE_DISCONNECTED:
+            # Disconnect was requested
+            self.set_state(STATE_DISCONNECTED)
+            return
+        with self.mutex:
+            if self.state == STATE_CONNECTED:
+                self.disconnect_time = time.time()
+        # Reconnecting is done by the loop so this callback doesn't block the network thread
+        self.connection_failed()
 
     def transform_command(self, command, payload=[], channel=[]):
         """Transform a command message into an object.
@@ -198,13 +620,17 @@ class CayenneMQTTClient:
 
         client is the client instance for this callback.
         userdata is the private user data as set in Client() or userdata_set().
-        msg is the received message.
+        msg is the received message. A JSON array of commands on the cmd.json topic is passed to on_message as a list.
         """
         try:
             message = {}
             if msg.topic[-len(COMMAND_JSON_TOPIC):] == COMMAND_JSON_TOPIC:
                 message = loads(msg.payload.decode())
-                self.transform_command(message)
+                if isinstance(message, list):
+                    for command in message:
+                        self.transform_command(command)
+                else:
+                    self.transform_command(message)
             else:
                 self.transform_command(message, msg.payload.decode().split(','), msg.topic.split('/')[-1].split(';'))
             debug('message_callback: {}'.format(message))
@@ -218,39 +644,73 @@ class CayenneMQTTClient:
         
         topic: the topic substring
         append_wildcard: if True append the single level topics wildcard (+)"""
-        if append_wildcard:
-            return '{}/{}/+'.format(self.root_topic, topic)
-        else:            
-            return '{}/{}'.format(self.root_topic, topic)
+        topic_string = self.topics.get((topic, append_wildcard))
+        if topic_string is None:
+            if append_wildcard:
+                topic_string = '{}/{}/+'.format(self.root_topic, topic)
+            else:
+                topic_string = '{}/{}'.format(self.root_topic, topic)
+            self.topics[(topic, append_wildcard)] = topic_string
+        return topic_string
 
     def disconnect(self):
         """Disconnect from Cayenne.
         """
+        self.set_state(STATE_DISCONNECTED)
         self.client.disconnect()
 
     def loop(self, timeout=1.0):
         """Process Cayenne messages.
         
         This should be called regularly to ensure Cayenne messages are sent and received.
+        If the connection has been lost it reconnects once the backoff delay has passed.
         
         timeout: The time in seconds to wait for incoming/outgoing network
           traffic before timing out and returning.
         """
-        self.client.loop(timeout)
+        if self.state == STATE_DISCONNECTED:
+            self.stopping.wait(timeout)
+            return
+        if self.state == STATE_BACKOFF:
+            delay = self.next_attempt - time.time()
+            if delay > 0:
+                self.stopping.wait(min(delay, timeout))
+            else:
+                self.attempt_connect()
+            return
+        rc = self.client.loop(timeout)
+        if rc != mqtt.MQTT_ERR_SUCCESS and self.state in (STATE_CONNECTING, STATE_CONNECTED):
+            # The socket was closed without the disconnect callback being called
+            self.connection_failed()
+
+    def loop_forever(self):
+        """Process Cayenne messages until loop_stop() is called."""
+        while not self.stopping.is_set():
+            try:
+                self.loop()
+            except:
+                exception('MQTT loop error')
+                self.stopping.wait(1)
     
     def loop_start(self):
         """This is part of the threaded client interface. Call this once to
         start a new thread to process network traffic. This provides an
         alternative to repeatedly calling loop() yourself.
         """
-        self.client.loop_start()
+        self.stopping.clear()
+        self.thread = Thread(target=self.loop_forever, name='mqtt')
+        self.thread.daemon = True
+        self.thread.start()
 
     def loop_stop(self):
         """This is part of the threaded client interface. Call this once to
         stop the network thread previously created with loop_start(). This call
         will block until the network thread finishes.
         """
-        self.client.loop_stop()
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
 
     def publish_packet(self, topic, packet, qos=0, retain=False):
         """Publish a packet.
@@ -259,9 +719,12 @@ class CayenneMQTTClient:
         packet: JSON packet to publish.
         qos: quality of service level to use.
         retain: if True, the message will be set as the "last known good"/retained message for the topic.
+
+        Returns the MQTTMessageInfo for the message, for QoS > 0 its is_published() method returns True once it has been acknowledged.
         """
-        debug('Publish to {}'.format(self.get_topic_string(topic)))
-        self.client.publish(self.get_topic_string(topic), packet, qos, retain)
+        topic_string = self.get_topic_string(topic)
+        debug('Publish to {}'.format(topic_string))
+        return self.client.publish(topic_string, packet, qos, retain)
 
     def publish_response(self, msg_id, error_message=None):
         """Send a command response to Cayenne.
@@ -5,7 +5,7 @@ It also responds messages from the server, to set actuator values, change system
 """
 
 from json import dumps, loads
-from threading import Thread, Event
+from threading import Thread, Event, local
 from time import strftime, localtime, tzset, time, sleep
 from queue import Queue, Empty
 from myDevices import __version__
@@ -14,6 +14,7 @@ from myDevices.utils.logger import exception, info, warn, error, debug, logJson
 from myDevices.sensors import sensors
 from myDevices.system.hardware import Hardware
 from myDevices.cloud.scheduler import SchedulerEngine
+from myDevices.cloud.rules import RulesEngine
 from myDevices.cloud.updater import Updater
 from myDevices.system.systemconfig import SystemConfig
 from myDevices.utils.daemon import Daemon
@@ -23,8 +24,10 @@ from myDevices.utils.subprocess import executeCommand
 # from hashlib import sha256
 from myDevices.cloud.apiclient import CayenneApiClient
 import myDevices.cloud.cayennemqtt as cayennemqtt
+from myDevices.cloud.outboundqueue import OutboundQueue, LANE_RESPONSE, LANE_EVENT, LANE_SYSTEM, LANE_BULK
 
 GENERAL_SLEEP_THREAD = 0.20
+POWER_COMMAND_TIMEOUT = 10 #seconds to wait for the response to a power command to be sent before executing it
 
 
 def GetTime():
@@ -105,19 +108,24 @@ class WriterThread(Thread):
             try:
                 if self.cloudClient.exiting.wait(GENERAL_SLEEP_THREAD):
                     return
-                if self.cloudClient.mqttClient.connected == False:
-                    info('WriterThread mqttClient not connected')
+                if not self.cloudClient.mqttConnected.is_set():
+                    continue
+                if self.cloudClient.reconnected.is_set():
+                    self.cloudClient.reconnected.clear()
+                    self.cloudClient.ResendPackets()
+                self.cloudClient.inFlight.collect()
+                if self.cloudClient.inFlight.is_full():
                     continue
                 got_packet = False
                 topic, message = self.cloudClient.DequeuePacket()
                 if topic or message:
                     got_packet = True
                 try:
-                    if message or topic == cayennemqtt.JOBS_TOPIC:
+                    if message or topic in (cayennemqtt.JOBS_TOPIC, cayennemqtt.RULES_TOPIC):
                         # debug('WriterThread, topic: {} {}'.format(topic, message))
-                        if not isinstance(message, str):
-                            message = dumps(message)
-                        self.cloudClient.mqttClient.publish_packet(topic, message)
+                        if self.cloudClient.PublishPacket(topic, message):
+                            # The packet is marked done when it is acknowledged
+                            got_packet = False
                         message = None
                 except:
                     exception("WriterThread publish packet error")    
@@ -171,6 +179,13 @@ class CloudServerClient:
         self.password = self.config.get('Agent', 'Password', None)
         self.clientId = self.config.get('Agent', 'ClientID', None)
         self.connected = False
+        self.mqttConnected = Event()
+        self.reconnected = Event()
+        self.inFlight = cayennemqtt.InFlightWindow(self.config.getInt('Agent', 'InFlightWindow', cayennemqtt.DEFAULT_WINDOW),
+                                                   self.config.getInt('Agent', 'MaxRetransmits', cayennemqtt.DEFAULT_RETRANSMITS),
+                                                   self.OnPacketReleased)
+        self.serializer = cayennemqtt.get_serializer(self.config.get('Agent', 'Encoding', 'json'))
+        self.batch = local()
         self.exiting = Event()
 
     def __del__(self):
@@ -195,8 +210,10 @@ class CloudServerClient:
                 return
             self.schedulerEngine = SchedulerEngine(self, 'client_scheduler')
             self.sensorsClient = sensors.SensorsClient()
+            self.rulesEngine = RulesEngine(self)
+            self.sensorsClient.SetRulesEngine(self.rulesEngine)
             self.readQueue = Queue()
-            self.writeQueue = Queue()
+            self.writeQueue = OutboundQueue(self.config)
             self.hardware = Hardware()
             self.oSInfo = OSInfo()
             self.count = 10000
@@ -213,6 +230,7 @@ class CloudServerClient:
             self.updater.start()
             events = self.schedulerEngine.get_scheduled_events()
             self.EnqueuePacket(events, cayennemqtt.JOBS_TOPIC)
+            self.EnqueuePacket(self.rulesEngine.get_rules(), cayennemqtt.RULES_TOPIC)
             # self.sentHistoryData = {}
             # self.historySendFails = 0
             # self.historyThread = Thread(target=self.SendHistoryData)
@@ -239,8 +257,13 @@ class CloudServerClient:
         self.Disconnect()
         info('Client shut down')
 
-    def OnDataChanged(self, data):
-        """Enqueue a packet containing changed system data to send to the server"""
+    def OnDataChanged(self, data, lane=LANE_EVENT):
+        """Enqueue a packet containing changed system data to send to the server
+
+        Args:
+            data: List of channel data dicts
+            lane: Outbound queue lane, LANE_EVENT for real-time changes or LANE_BULK for periodic snapshots
+        """
         try:
             if len(data) > 15:
                 items = [{item['channel']:item['value']} for item in data if not item['channel'].startswith(cayennemqtt.SYS_GPIO)]
@@ -262,7 +285,7 @@ class CloudServerClient:
         except:
             info('Send changed data')
             pass
-        self.EnqueuePacket(data)
+        self.EnqueuePacket(data, lane=lane)
 
     def SendSystemInfo(self):
         """Enqueue a packet containing system info to send to the server"""
@@ -273,6 +296,14 @@ class CloudServerClient:
             cayennemqtt.DataChannel.add(currentSystemInfo, cayennemqtt.AGENT_VERSION, value=self.config.get('Agent', 'Version', __version__))
             cayennemqtt.DataChannel.add(currentSystemInfo, cayennemqtt.SYS_POWER_RESET, value=0)
             cayennemqtt.DataChannel.add(currentSystemInfo, cayennemqtt.SYS_POWER_HALT, value=0)
+            metrics = self.mqttClient.get_metrics()
+            cayennemqtt.DataChannel.add(currentSystemInfo, cayennemqtt.AGENT_MQTT, suffix=cayennemqtt.FAILURES, value=metrics['failures'])
+            if metrics['reconnect_time'] is not None:
+                cayennemqtt.DataChannel.add(currentSystemInfo, cayennemqtt.AGENT_MQTT, suffix=cayennemqtt.RECONNECT_TIME, value=round(metrics['reconnect_time'], 1), unit='s')
+            for lane, lane_metrics in self.writeQueue.GetMetrics().items():
+                cayennemqtt.DataChannel.add(currentSystemInfo, cayennemqtt.AGENT_QUEUE, lane, cayennemqtt.DEPTH, lane_metrics['depth'])
+                cayennemqtt.DataChannel.add(currentSystemInfo, cayennemqtt.AGENT_QUEUE, lane, cayennemqtt.LATENCY, round(lane_metrics['latency'] * 1000), unit='ms')
+                cayennemqtt.DataChannel.add(currentSystemInfo, cayennemqtt.AGENT_QUEUE, lane, cayennemqtt.DROPS, lane_metrics['dropped'])
             config = SystemConfig.getConfig()
             if config:
                 channel_map = {'I2C': cayennemqtt.SYS_I2C, 'SPI': cayennemqtt.SYS_SPI, 'Serial': cayennemqtt.SYS_UART,
@@ -289,7 +320,7 @@ class CloudServerClient:
                 if data:
                     self.systemInfo = currentSystemInfo
                     info('Send system info: {}'.format([{item['channel']:item['value']} for item in data]))
-                    self.EnqueuePacket(data)
+                    self.EnqueuePacket(data, lane=LANE_SYSTEM)
         except Exception:
             exception('SendSystemInfo unexpected error')
 
@@ -327,25 +358,75 @@ class CloudServerClient:
                 raise SystemExit
  
     def Connect(self):
-        """Connect to the server"""
+        """Connect to the server
+
+        The MQTT client keeps retrying with backoff if the connection fails or is lost."""
         self.connected = False
-        count = 0
-        while self.connected == False and count < 30 and not self.exiting.is_set():
-            try:
-                self.mqttClient = cayennemqtt.CayenneMQTTClient()
-                self.mqttClient.on_message = self.OnMessage
-                self.mqttClient.begin(self.username, self.password, self.clientId, self.HOST, self.PORT)
-                self.mqttClient.loop_start()
-                self.connected = True
-            except OSError as oserror:
-                Daemon.OnFailure('cloud', oserror.errno)
-                error('Connect failed: ' + str(self.HOST) + ':' + str(self.PORT) + ' Error:' + str(oserror))
-                if self.exiting.wait(30):
-                    # If we are exiting return immediately
-                    return self.connected
-                count += 1
+        try:
+            self.mqttClient = cayennemqtt.CayenneMQTTClient()
+            self.mqttClient.on_message = self.OnMessage
+            self.mqttClient.add_state_callback(self.OnConnectionStateChanged)
+            self.mqttClient.begin(self.username, self.password, self.clientId, self.HOST, self.PORT)
+            self.mqttClient.loop_start()
+            self.connected = True
+        except Exception as ex:
+            error('Connect failed: ' + str(self.HOST) + ':' + str(self.PORT) + ' Error:' + str(ex))
         return self.connected
 
+    def OnConnectionStateChanged(self, state):
+        """Track whether the MQTT client is connected so the writer only sends when it is"""
+        info('Connection state changed: {}'.format(state))
+        if state == cayennemqtt.STATE_CONNECTED:
+            Daemon.Reset('cloud')
+            # The writer thread resends the unacknowledged packets before sending new ones
+            self.reconnected.set()
+            self.mqttConnected.set()
+        else:
+            self.mqttConnected.clear()
+
+    def PublishPacket(self, topic, message, retransmits=0):
+        """Encode and publish a packet, returns True if it is tracked in the in-flight window until it is acknowledged
+
+        Args:
+            topic: Topic to publish to
+            message: Packet to publish, a list of data channels or a str
+            retransmits: Number of times the packet has already been resent
+        """
+        qos = self.GetQoS(topic)
+        publish_topic, packet = topic, message
+        if topic == cayennemqtt.DATA_TOPIC and not isinstance(message, str):
+            publish_topic, packet = self.serializer.topic, self.serializer.encode(message)
+            if self.serializer.requires_ack:
+                qos = max(qos, 1)
+        elif not isinstance(message, str):
+            packet = dumps(message)
+        message_info = self.mqttClient.publish_packet(publish_topic, packet, qos)
+        if qos:
+            self.inFlight.add(message_info, topic, message, retransmits)
+        return qos > 0
+
+    def ResendPackets(self):
+        """Resend the packets that were not acknowledged before the connection was lost"""
+        self.serializer.reset()
+        for topic, message, retransmits in self.inFlight.reset():
+            debug('Resending packet on {}, retransmit {}'.format(topic, retransmits))
+            try:
+                if self.PublishPacket(topic, message, retransmits):
+                    continue
+            except:
+                exception('Error resending packet')
+            self.writeQueue.task_done()
+
+    def GetQoS(self, topic):
+        """Return the QoS to publish a topic with, set in the [QoS] section of the config"""
+        return int(self.config.get('QoS', topic, cayennemqtt.DEFAULT_QOS.get(topic, 0)))
+
+    def OnPacketReleased(self, mid, delivered):
+        """Mark an in-flight packet as done once it has been acknowledged or dropped"""
+        if not delivered:
+            error('Packet {} dropped after {} retransmits'.format(mid, self.inFlight.max_retransmits))
+        self.writeQueue.task_done()
+
     def Disconnect(self):
         """Disconnect from the server"""
         Daemon.Reset('cloud')
@@ -394,7 +475,48 @@ class CloudServerClient:
                 return False
         except Empty:
             return False
-        self.ExecuteMessage(messageObject)
+        if isinstance(messageObject, list):
+            self.ExecuteBatch(messageObject)
+        else:
+            self.ExecuteMessage(messageObject)
+
+    def ExecuteBatch(self, messages):
+        """Execute a list of command messages and send one response listing the result of each command
+
+        Consecutive GPIO value writes are applied as a group until a command on one of their pins that is not a
+        value write, so commands on the same channel keep their order. The other commands are executed in order.
+        Power commands are executed last, once the batch response is queued.
+        """
+        info('ExecuteBatch: {} commands'.format(len(messages)))
+        power_commands = []
+        gpio_writes = []
+        self.batch.responses = []
+        try:
+            for message in messages:
+                channel = message.get('channel', '')
+                if channel in (cayennemqtt.SYS_POWER_RESET, cayennemqtt.SYS_POWER_HALT):
+                    power_commands.append(message)
+                    continue
+                if channel.startswith(cayennemqtt.SYS_GPIO) and message.get('suffix', 'value') in ('value', ''):
+                    gpio_writes.append(message)
+                    continue
+                if gpio_writes and channel in [write['channel'] for write in gpio_writes]:
+                    self.ProcessGpioWrites(gpio_writes)
+                    gpio_writes = []
+                try:
+                    self.ExecuteMessage(message)
+                except Exception as ex:
+                    # Commands raising an error have already queued their response
+                    debug('ExecuteBatch command error: {}'.format(ex))
+            if gpio_writes:
+                self.ProcessGpioWrites(gpio_writes)
+        finally:
+            responses = self.batch.responses
+            self.batch.responses = None
+        if responses:
+            self.EnqueuePacket(responses, cayennemqtt.COMMAND_JSON_RESPONSE_TOPIC)
+        for message in power_commands:
+            self.ExecuteMessage(message)
 
     def ExecuteMessage(self, message):
         """Execute an action described in a message object
@@ -419,6 +541,8 @@ class CloudServerClient:
             result = self.ProcessAgentCommand(message)
         elif channel == cayennemqtt.AGENT_SCHEDULER:
             result = self.ProcessSchedulerCommand(message)
+        elif channel == cayennemqtt.AGENT_RULES:
+            result = self.ProcessRulesCommand(message)
         else:
             info('Unknown message')
         return result
@@ -436,7 +560,8 @@ class CloudServerClient:
                 data = []
                 cayennemqtt.DataChannel.add(data, message['channel'], value=1)
                 self.EnqueuePacket(data)
-                self.writeQueue.join()
+                if not self.writeQueue.join(POWER_COMMAND_TIMEOUT):
+                    warn('Power command packets not sent after {} seconds'.format(POWER_COMMAND_TIMEOUT))
                 info('Calling execute: {}'.format(commands[message['channel']]))
                 output, result = executeCommand(commands[message['channel']])
                 debug('ProcessPowerCommand: {}, result: {}, output: {}'.format(message, result, output))
@@ -513,6 +638,27 @@ class CloudServerClient:
         self.EnqueueCommandResponse(message, error)
         return error == None
 
+    def ProcessGpioWrites(self, messages):
+        """Process a group of GPIO value commands, writing all the values before reading the pins back
+
+        Returns: True if all commands were processed, False otherwise."""
+        writes = []
+        for message in messages:
+            try:
+                writes.append((message, int(message['channel'].replace(cayennemqtt.SYS_GPIO + ':', '')), int(message['payload'])))
+            except Exception as ex:
+                self.EnqueueCommandResponse(message, '{}: {}'.format(type(ex).__name__, ex))
+        try:
+            results = self.sensorsClient.GpioWriteGroup([(channel, value) for message, channel, value in writes])
+            errors = ['GPIO command failed' if result == 'failure' else None for result in results]
+        except Exception as ex:
+            results = ['failure'] * len(writes)
+            errors = ['{}: {}'.format(type(ex).__name__, ex)] * len(writes)
+        debug('ProcessGpioWrites results: {}'.format(results))
+        for (message, channel, value), error in zip(writes, errors):
+            self.EnqueueCommandResponse(message, error)
+        return len(writes) == len(messages) and 'failure' not in results
+
     def ProcessSensorCommand(self, message):
         """Process sensor command
         
@@ -547,10 +693,17 @@ class CloudServerClient:
                 result = self.sensorsClient.EditSensor(payload['sensorId'], payload['description'], payload['class'], payload['args'])
             elif message['suffix'] == 'delete':
                 result = self.sensorsClient.RemoveSensor(payload['sensorId'])
+            elif message['suffix'] == 'bulk':
+                changes = [(change['action'], change['sensorId'], change.get('description'), change.get('class'), change.get('args')) for change in payload]
+                results = self.sensorsClient.ApplySensorChanges(changes)
+                failed = [change[1] for change, changed in zip(changes, results) if not changed]
+                result = not failed
+                if failed:
+                    error = 'Device command failed: {}'.format(', '.join(failed))
             else:
                 error = 'Unknown device command: {}'.format(message['suffix'])
             debug('ProcessDeviceCommand result: {}'.format(result))
-            if result is False:
+            if result is False and not error:
                 error = 'Device command failed'
         except Exception as ex:
             error = '{}: {}'.format(type(ex).__name__, ex)
@@ -582,6 +735,31 @@ class CloudServerClient:
         self.EnqueueCommandResponse(message, error)
         return error == None
 
+    def ProcessRulesCommand(self, message):
+        """Process command to add/edit/remove a local rule
+
+        Returns: True if command was processed, False otherwise."""
+        error = None
+        result = None
+        try:
+            if message['suffix'] == 'add':
+                result = self.rulesEngine.add_rule(message['payload'])
+            elif message['suffix'] == 'edit':
+                result = self.rulesEngine.update_rule(message['payload'])
+            elif message['suffix'] == 'delete':
+                result = self.rulesEngine.remove_rule(message['payload'])
+            elif message['suffix'] == 'get':
+                self.EnqueuePacket(self.rulesEngine.get_rules(), cayennemqtt.RULES_TOPIC)
+            else:
+                error = 'Unknown rules command: {}'.format(message['suffix'])
+            debug('ProcessRulesCommand result: {}'.format(result))
+            if result is False:
+                error = 'Rules command failed'
+        except Exception as ex:
+            error = '{}: {}'.format(type(ex).__name__, ex)
+        self.EnqueueCommandResponse(message, error)
+        return error == None
+
     def EnqueueCommandResponse(self, message, error):
         """Send response after processing a command message"""
         if not 'cmdId' in message:
@@ -593,12 +771,34 @@ class CloudServerClient:
         else:
             response = 'ok,{}'.format(message['cmdId'])
         info(response)
+        responses = getattr(self.batch, 'responses', None)
+        if responses is not None:
+            # Responses to batched commands are sent together once the batch is done
+            responses.append(response)
+            return
         self.EnqueuePacket(response, cayennemqtt.COMMAND_RESPONSE_TOPIC)
 
-    def EnqueuePacket(self, message, topic=cayennemqtt.DATA_TOPIC):
-        """Enqueue a message packet to send to the server"""
+    def EnqueuePacket(self, message, topic=cayennemqtt.DATA_TOPIC, lane=None):
+        """Enqueue a message packet to send to the server
+
+        Args:
+            message: Packet to send
+            topic: Topic to publish the packet to
+            lane: Outbound queue lane, by default command responses use LANE_RESPONSE, jobs LANE_SYSTEM and data LANE_EVENT
+        """
+        if lane is None:
+            lane = {cayennemqtt.COMMAND_RESPONSE_TOPIC: LANE_RESPONSE, cayennemqtt.COMMAND_JSON_RESPONSE_TOPIC: LANE_RESPONSE,
+                    cayennemqtt.JOBS_TOPIC: LANE_SYSTEM, cayennemqtt.RULES_TOPIC: LANE_SYSTEM}.get(topic, LANE_EVENT)
+        if lane == LANE_EVENT and topic == cayennemqtt.DATA_TOPIC and isinstance(message, list):
+            # Events overtake queued system info and snapshots, so remove their older values of the same channels
+            channels = {item['channel'] for item in message}
+            def remove_channels(packet):
+                if packet[0] != cayennemqtt.DATA_TOPIC or not isinstance(packet[1], list):
+                    return packet
+                return (packet[0], [item for item in packet[1] if item['channel'] not in channels])
+            self.writeQueue.update(remove_channels, (LANE_SYSTEM, LANE_BULK))
         packet = (topic, message)
-        self.writeQueue.put(packet)
+        self.writeQueue.put(packet, lane)
 
     def DequeuePacket(self):
         """Dequeue a message packet to send to the server"""
@@ -1,21 +1,84 @@
 """
 This module provides a class for testing download speed
+
+The test file is streamed into a reusable buffer and discarded, so nothing is written to storage.
+Throughput is measured in intervals and the test stops early once the interval rates converge.
 """
 from datetime import datetime, timedelta
-from os import path, remove
 from urllib import request, error
 from myDevices.utils.logger import exception, info, warn, error, debug
-from time import sleep
+from time import monotonic, sleep
 from random import randint
 from socket import error as socket_error
 from myDevices.utils.daemon import Daemon
 from myDevices.utils.threadpool import ThreadPool
 
 defaultUrl = "https://updates.mydevices.com/test/10MB.zip"
-download_path = "/etc/myDevices/test"
 mb = 1024*1024
 #in seconds download Rate = 24 hours
 defaultDownloadRate = 24*60*60
+defaultMaxBytes = 10*mb
+defaultMaxTime = 15 #seconds
+timeout = 30 #seconds
+chunkSize = 64*1024
+#seconds per throughput measurement interval
+interval = 0.5
+#number of consecutive interval rates that must be within the tolerance of their mean to stop early
+convergenceIntervals = 4
+tolerance = 0.1
+
+
+def measureDownload(url, maxBytes=defaultMaxBytes, maxTime=defaultMaxTime, buffer=None, interval=interval, tolerance=tolerance):
+    """Download up to maxBytes from url, discarding the data, and return the measured speed
+
+    Args:
+        url: URL of the test file
+        maxBytes: Maximum number of bytes to download, requested as a byte range
+        maxTime: Maximum number of seconds to download for
+        buffer: Reusable bytearray to read into
+        interval: Seconds per throughput measurement interval
+        tolerance: Maximum deviation of the interval rates from their mean, as a fraction of the mean, to stop early
+
+    Returns:
+        Dict with the download speed in megabits per second, the time to first byte in milliseconds,
+        the number of bytes downloaded and whether the interval rates converged, e.g.
+        {'speed': 48.2, 'ttfb': 35.1, 'bytes': 3145728, 'converged': True}
+    """
+    if buffer is None:
+        buffer = bytearray(chunkSize)
+    view = memoryview(buffer)
+    test_request = request.Request(url, headers={'Range': 'bytes=0-{}'.format(maxBytes - 1)})
+    start = monotonic()
+    with request.urlopen(test_request, timeout=timeout) as response:
+        ttfb = monotonic() - start
+        start = interval_start = monotonic()
+        total = interval_bytes = 0
+        rates = []
+        converged = False
+        # The server may ignore the range, so the size cap is also enforced here
+        while total < maxBytes:
+            count = response.readinto(view[:min(len(view), maxBytes - total)])
+            if not count:
+                break
+            total += count
+            interval_bytes += count
+            now = monotonic()
+            if now - interval_start >= interval:
+                rates.append(interval_bytes / (now - interval_start))
+                interval_start = now
+                interval_bytes = 0
+                recent = rates[-convergenceIntervals:]
+                if len(recent) == convergenceIntervals:
+                    mean = sum(recent) / convergenceIntervals
+                    converged = all(abs(rate - mean) <= mean * tolerance for rate in recent)
+                    if converged:
+                        break
+            if now - start >= maxTime:
+                break
+        elapsed = monotonic() - start
+    rate = mean if converged else total / elapsed if elapsed > 0 else 0
+    return {'speed': rate / mb * 8, 'ttfb': ttfb * 1000, 'bytes': total, 'converged': converged}
+
 
 class DownloadSpeed():
     """Class for checking download speed"""
@@ -23,12 +86,14 @@ class DownloadSpeed():
     def __init__(self, config):
         """Initialize variables and start download speed test"""
         self.downloadSpeed = None
+        self.latency = None
         self.testTime = None
         self.isRunning = False
-        self.Start()
+        self.buffer = bytearray(chunkSize)
         self.config = config
         #add a random delay to the start of download 
         self.delay = randint(0, 100)
+        self.Start()
 
     def Start(self):
         """Start download speed thread"""
@@ -47,20 +112,18 @@ class DownloadSpeed():
         return True
 
     def TestDownload(self):
-        """Test download speed by retrieving a file"""
+        """Test download speed by streaming a file"""
         try:
             info('Executing regular download test for network speed')
             url = self.config.get('Agent', 'DownloadSpeedTestUrl', defaultUrl)
-            debug(url + ' ' + download_path)
-            a = datetime.now()
-            request.urlretrieve(url, download_path)
-            b = datetime.now()
-            request.urlcleanup()
-            c = b - a
-            if path.exists(download_path):
-                size = path.getsize(download_path)/mb
-                self.downloadSpeed = size/c.total_seconds() * 8 #Convert to megabits per second
-                remove(download_path)
+            maxBytes = self.config.getInt('Agent', 'DownloadSpeedTestMaxBytes', defaultMaxBytes)
+            maxTime = self.config.getInt('Agent', 'DownloadSpeedTestMaxTime', defaultMaxTime)
+            debug(url)
+            result = measureDownload(url, maxBytes, maxTime, self.buffer)
+            debug('Download test result: {}'.format(result))
+            if result['bytes']:
+                self.downloadSpeed = result['speed']
+                self.latency = result['ttfb']
                 return True
         except socket_error as serr:
             error ('TestDownload:' + str(serr))
@@ -86,6 +149,10 @@ class DownloadSpeed():
             self.Start()
         return self.downloadSpeed
 
+    def getLatency(self):
+        """Return the time to first byte of the last download speed test in milliseconds"""
+        return self.latency
+
 def Test():
     from myDevices.utils.config import Config    
     testDownload = DownloadSpeed(Config('/etc/myDevices/AppSettings.ini'))
@@ -0,0 +1,208 @@
+"""
+This module provides a multi-lane queue for packets waiting to be sent to the server. Command responses
+are always sent first, the remaining lanes share the connection by weight so a backlog of bulk data
+cannot hold up real-time events. Each lane has a depth limit and a policy for what to drop when it is full.
+
+Lanes are configured in the app settings, in sections named [Lane:<lane name>]:
+
+    [Lane:bulk]
+    Weight = 1
+    MaxDepth = 10
+    Drop = oldest
+"""
+from collections import deque
+from queue import Empty
+from threading import Condition, Lock
+from time import time
+from myDevices.utils.logger import warn
+
+LANE_RESPONSE = 'response' #command responses
+LANE_EVENT = 'event' #real-time changes, e.g. GPIO and digital sensor events
+LANE_SYSTEM = 'system' #periodic system info and scheduler jobs
+LANE_BULK = 'bulk' #periodic snapshots of all channels
+DROP_OLDEST = 'oldest'
+DROP_NEWEST = 'newest'
+SECTION = 'Lane'
+
+
+class Lane():
+    """Settings, packets and counters for a lane"""
+
+    def __init__(self, name, weight=1, max_depth=100, drop=DROP_OLDEST, strict=False):
+        """Initialize the lane
+
+        Args:
+            name: Lane name
+            weight: Share of the sends when other lanes also have packets waiting
+            max_depth: Maximum number of packets waiting in the lane
+            drop: DROP_OLDEST to drop the oldest packet when the lane is full, DROP_NEWEST to drop the new packet
+            strict: True if the lane is always sent before the weighted lanes
+        """
+        self.name = name
+        self.weight = weight
+        self.max_depth = max_depth
+        self.drop = drop
+        self.strict = strict
+        self.packets = deque()
+        self.credit = 0
+        self.sent = 0
+        self.dropped = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+
+DEFAULT_LANES = (Lane(LANE_RESPONSE, max_depth=100, strict=True),
+                 Lane(LANE_EVENT, weight=4, max_depth=100),
+                 Lane(LANE_SYSTEM, weight=2, max_depth=20),
+                 Lane(LANE_BULK, weight=1, max_depth=10))
+
+
+class OutboundQueue():
+    """Queue of packets sent by strict priority and weighted fair sharing between lanes
+
+    Like queue.Queue, task_done() must be called for each packet returned by get() and join() blocks until
+    all packets have been processed. Dropped packets are marked done when they are dropped.
+    """
+
+    def __init__(self, config=None, lanes=DEFAULT_LANES):
+        """Initialize the lanes from the defaults and the config
+
+        Args:
+            config: Config object containing [Lane:<name>] sections, or None to use the defaults
+            lanes: Default lanes, strict lanes are served in the order given
+        """
+        self.mutex = Lock()
+        self.not_empty = Condition(self.mutex)
+        self.all_tasks_done = Condition(self.mutex)
+        self.unfinished_tasks = 0
+        self.lanes = {}
+        for lane in lanes:
+            self.lanes[lane.name] = Lane(lane.name, lane.weight, lane.max_depth, lane.drop, lane.strict)
+            if config:
+                self.ReadLane(config, self.lanes[lane.name])
+        self.default = lanes[-1].name
+
+    def ReadLane(self, config, lane):
+        """Update lane with the settings from its config section"""
+        section = '{}:{}'.format(SECTION, lane.name)
+        lane.weight = max(1, config.getInt(section, 'Weight', lane.weight))
+        lane.max_depth = max(1, config.getInt(section, 'MaxDepth', lane.max_depth))
+        lane.drop = config.get(section, 'Drop', lane.drop).lower()
+
+    def put(self, packet, lane=None):
+        """Add a packet to a lane, dropping a packet if the lane is full
+
+        Args:
+            packet: Packet to queue
+            lane: Lane name, the lowest priority lane is used if it is None or unknown
+        """
+        with self.mutex:
+            lane = self.lanes.get(lane) or self.lanes[self.default]
+            if len(lane.packets) >= lane.max_depth:
+                lane.dropped += 1
+                if lane.drop == DROP_NEWEST:
+                    warn('Outbound {} lane full, dropping new packet'.format(lane.name))
+                    return
+                warn('Outbound {} lane full, dropping oldest packet'.format(lane.name))
+                lane.packets.popleft()
+                self.unfinished_tasks -= 1
+            lane.packets.append((time(), packet))
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        """Remove and return the next packet to send
+
+        Args:
+            block: If True wait until a packet is available, otherwise raise Empty if there are no packets
+            timeout: Maximum time to wait in seconds, raises Empty if no packet is available by then
+        """
+        with self.not_empty:
+            if block and not self.not_empty.wait_for(self.qsize, timeout):
+                raise Empty
+            lane = self.NextLane()
+            if lane is None:
+                raise Empty
+            enqueue_time, packet = lane.packets.popleft()
+            latency = time() - enqueue_time
+            lane.sent += 1
+            lane.latency += latency
+            lane.max_latency = max(lane.max_latency, latency)
+            return packet
+
+    def NextLane(self):
+        """Return the lane to send from next, or None if all lanes are empty
+
+        Strict lanes are served first. The other lanes use smooth weighted round robin, each waiting lane gains
+        its weight in credit and the lane with the most credit is served and pays the total weight of the waiting lanes.
+        """
+        waiting = [lane for lane in self.lanes.values() if lane.packets]
+        for lane in waiting:
+            if lane.strict:
+                return lane
+        if not waiting:
+            return None
+        for lane in waiting:
+            lane.credit += lane.weight
+        lane = max(waiting, key=lambda lane: lane.credit)
+        lane.credit -= sum(lane.weight for lane in waiting)
+        return lane
+
+    def update(self, function, lanes):
+        """Replace each packet waiting in lanes with the result of function(packet)"""
+        with self.mutex:
+            for name in lanes:
+                lane = self.lanes[name]
+                lane.packets = deque((enqueue_time, function(packet)) for enqueue_time, packet in lane.packets)
+
+    def task_done(self):
+        """Mark a packet returned by get() as processed"""
+        with self.all_tasks_done:
+            if self.unfinished_tasks <= 0:
+                raise ValueError('task_done() called too many times')
+            self.unfinished_tasks -= 1
+            if self.unfinished_tasks == 0:
+                self.all_tasks_done.notify_all()
+
+    def join(self, timeout=None):
+        """Block until all queued packets have been processed or dropped
+
+        Args:
+            timeout: Maximum time to wait in seconds, None to wait indefinitely
+
+        Returns:
+            True if all packets were processed, False if the timeout expired first
+        """
+        with self.all_tasks_done:
+            return self.all_tasks_done.wait_for(lambda: not self.unfinished_tasks, timeout)
+
+    def qsize(self):
+        """Return the number of packets waiting in all lanes"""
+        return sum(len(lane.packets) for lane in self.lanes.values())
+
+    def empty(self):
+        """Return True if no packets are waiting"""
+        return self.qsize() == 0
+
+    def GetMetrics(self):
+        """Return a dict of lane metrics and reset the latency and drop counters
+
+        Latencies are the average and maximum time in seconds packets sent since the previous call spent in the queue.
+
+        Returned dict example::
+
+            {
+                'response': {'depth': 0, 'sent': 2, 'dropped': 0, 'latency': 0.01, 'max_latency': 0.02},
+                'bulk': {'depth': 3, 'sent': 10, 'dropped': 1, 'latency': 4.2, 'max_latency': 9.5}
+            }
+        """
+        metrics = {}
+        with self.mutex:
+            for lane in self.lanes.values():
+                metrics[lane.name] = {'depth': len(lane.packets), 'sent': lane.sent, 'dropped': lane.dropped,
+                                      'latency': lane.latency / lane.sent if lane.sent else 0.0, 'max_latency': lane.max_latency}
+                lane.sent = 0
+                lane.dropped = 0
+                lane.latency = 0.0
+                lane.max_latency = 0.0
+        return metrics
@@ -0,0 +1,183 @@
+"""
+This module provides a local rules engine that runs actions when sensor readings match a rule's conditions,
+so reactions like turning on a relay when a temperature gets too high happen immediately and also work offline.
+
+A rule is a dict like this, actions use the same format as scheduler actions:
+
+    {
+        'id': 'fan-on',
+        'conditions': [{'channel': 'dev:temp1', 'operator': '>', 'value': 30}],
+        'actions': [{'channel': 'sys:gpio:17;value', 'value': 1}]
+    }
+
+A rule fires when all of its conditions become true, it fires again only after its conditions have stopped matching.
+"""
+import operator
+from json import dumps, loads
+from sqlite3 import connect
+from threading import RLock
+
+from myDevices.utils.logger import debug, error, exception, info
+
+OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '==': operator.eq, '!=': operator.ne}
+
+
+class Rule():
+    """Class for a rule compiled into per-channel predicates"""
+
+    def __init__(self, rule):
+        """Compile the rule conditions, raises ValueError if the rule is invalid
+
+        rule: the rule dict"""
+        if not rule.get('id'):
+            raise ValueError('No id specified for rule: {}'.format(rule))
+        if not rule.get('conditions') or not rule.get('actions'):
+            raise ValueError('Rule {} needs conditions and actions'.format(rule['id']))
+        self.rule = rule
+        self.predicates = [(condition['channel'], self.compile(condition)) for condition in rule['conditions']]
+        self.channels = {channel for channel, predicate in self.predicates}
+        self.values = {}
+        self.active = False
+
+    @staticmethod
+    def compile(condition):
+        """Return a function that returns True if a value matches the condition
+
+        condition: dict with the channel, operator and value to compare with"""
+        try:
+            compare = OPERATORS[condition['operator']]
+            operand = condition['value']
+        except KeyError as ex:
+            raise ValueError('Invalid rule condition {}: missing or unknown {}'.format(condition, ex))
+        numeric = isinstance(operand, (int, float)) and not isinstance(operand, bool)
+
+        def predicate(value):
+            try:
+                return compare(float(value) if numeric else value, operand)
+            except (TypeError, ValueError):
+                return False
+        return predicate
+
+    def update(self, channel, value):
+        """Update the last value of a channel used by the rule"""
+        self.values[channel] = value
+
+    def evaluate(self):
+        """Return True if the rule should fire, i.e. all conditions have just become true"""
+        matched = all(channel in self.values and predicate(self.values[channel]) for channel, predicate in self.predicates)
+        fire = matched and not self.active
+        self.active = matched
+        return fire
+
+
+class RulesEngine():
+    """Class that evaluates rules on new sensor readings and runs their actions"""
+
+    def __init__(self, client, path='/etc/myDevices/agent.db'):
+        """Initialize the rules engine and load the saved rules
+
+        client: the client running the rule actions
+        path: path of the database the rules are saved in"""
+        self.connection = connect(path, check_same_thread=False)
+        self.cursor = self.connection.cursor()
+        self.cursor.execute('CREATE TABLE IF NOT EXISTS rules (id TEXT PRIMARY KEY, rule TEXT)')
+        self.mutex = RLock()
+        self.client = client
+        self.rules = {}
+        self.index = {}
+        self.load_rules()
+
+    def __del__(self):
+        """Delete rules engine object"""
+        try:
+            self.connection.close()
+        except:
+            exception('Error deleting RulesEngine')
+
+    def load_rules(self):
+        """Load saved rules from the database"""
+        with self.mutex:
+            self.cursor.execute('SELECT * FROM rules')
+            for row in self.cursor.fetchall():
+                try:
+                    self.rules[row[0]] = Rule(loads(row[1]))
+                except (KeyError, ValueError) as ex:
+                    error('Invalid saved rule: {}'.format(ex))
+            self.build_index()
+
+    def build_index(self):
+        """Rebuild the index of rules by channel"""
+        index = {}
+        for rule in self.rules.values():
+            for channel in rule.channels:
+                index.setdefault(channel, []).append(rule)
+        self.index = index
+
+    def add_rule(self, rule):
+        """Add a rule, or replace the existing rule with the same id
+
+        rule: the rule to add"""
+        debug('Add rule')
+        try:
+            compiled = Rule(rule)
+            with self.mutex:
+                self.cursor.execute('REPLACE INTO rules VALUES (?,?)', (rule['id'], dumps(rule)))
+                self.connection.commit()
+                self.rules[rule['id']] = compiled
+                self.build_index()
+        except:
+            exception('Failed to add rule')
+            return False
+        return True
+
+    def update_rule(self, rule):
+        """Update an existing rule
+
+        rule: the rule to update"""
+        debug('Update rule')
+        with self.mutex:
+            if rule.get('id') not in self.rules:
+                debug('Rule with id = {} not found'.format(rule.get('id')))
+                return False
+            return self.add_rule(rule)
+
+    def remove_rule(self, rule):
+        """Remove a rule
+
+        rule: the rule to remove, only its id is used"""
+        debug('Remove rule')
+        try:
+            with self.mutex:
+                if self.rules.pop(rule['id'], None) is None:
+                    return False
+                self.cursor.execute('DELETE FROM rules WHERE id = ?', (rule['id'],))
+                self.connection.commit()
+                self.build_index()
+        except:
+            exception('Failed to remove rule')
+            return False
+        return True
+
+    def get_rules(self):
+        """Return a list of all rules"""
+        with self.mutex:
+            return [rule.rule for rule in self.rules.values()]
+
+    def evaluate(self, data):
+        """Evaluate the rules for the channels in data and run the actions of the rules that fire
+
+        data: list of channel data dicts"""
+        fired = []
+        with self.mutex:
+            updated = {}
+            for item in data:
+                for rule in self.index.get(item['channel'], ()):
+                    rule.update(item['channel'], item['value'])
+                    updated[rule.rule['id']] = rule
+            fired = [rule for rule in updated.values() if rule.evaluate()]
+        for rule in fired:
+            info('Rule {} fired'.format(rule.rule['id']))
+            for action in rule.rule['actions']:
+                if self.client.RunAction(action) == False:
+                    error('Failed to execute rule action: {}'.format(action))
+        return len(fired)
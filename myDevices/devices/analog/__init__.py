@@ -12,6 +12,9 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+from array import array
+from threading import RLock
+from time import time
 from myDevices.decorators.rest import request, response
 from myDevices.utils.types import toint, M_JSON
 from myDevices.devices import instance
@@ -19,11 +22,19 @@ from myDevices.utils.logger import info
 
 
 class ADC():
+    # Maximum age in seconds of a channel scan that can be reused by analogReadSampled
+    SAMPLE_MAX_AGE = 1.0
+
     def __init__(self, channelCount, resolution, vref):
         self._analogCount = channelCount
         self._analogResolution = resolution
         self._analogMax = 2**resolution - 1
         self._analogRef = vref
+        self._analogValues = array('l', [0] * channelCount)
+        self._analogSampleChannels = set()
+        self._analogSampleTime = 0
+        self._analogSampleScan = 0
+        self._analogSampleLock = RLock()
     
     def __family__(self):
         return "ADC"
@@ -54,6 +65,55 @@ class ADC():
     
     def __analogRead__(self, channel, diff):
         raise NotImplementedError
+
+    def __analogReadAll__(self, channels):
+        # Chips that can convert several channels in one bus transaction should override this
+        for channel in channels:
+            self._analogValues[channel] = self.__analogRead__(channel, False)
+
+    def addSampleChannel(self, channel):
+        self.checkAnalogChannel(channel)
+        with self._analogSampleLock:
+            if channel not in self._analogSampleChannels:
+                # The last scan does not include the new channel
+                self._analogSampleChannels.add(channel)
+                self._analogSampleTime = 0
+
+    def analogSample(self, maxAge=None):
+        """Scan all sampled channels if the last scan is older than maxAge and return the values array"""
+        if maxAge is None:
+            maxAge = self.SAMPLE_MAX_AGE
+        with self._analogSampleLock:
+            now = time()
+            if now - self._analogSampleTime >= maxAge:
+                channels = sorted(self._analogSampleChannels) or range(self._analogCount)
+                self.__analogReadAll__(channels)
+                self._analogSampleTime = now
+                self._analogSampleScan += 1
+        return self._analogValues
+
+    def analogReadSampled(self, channel, maxAge=None):
+        self.checkAnalogChannel(channel)
+        with self._analogSampleLock:
+            if self._analogSampleChannels and channel not in self._analogSampleChannels:
+                # Channels read without being registered are added to the scan, rescanning so the value is not stale
+                self._analogSampleChannels.add(channel)
+                maxAge = 0
+            return self.analogSample(maxAge)[channel]
+
+    def analogReadSampledFloat(self, channel, maxAge=None):
+        return self.analogReadSampled(channel, maxAge) / float(self._analogMax)
+
+    def analogReadSampledVolt(self, channel, maxAge=None):
+        if self._analogRef == 0:
+            raise NotImplementedError
+        return self.analogReadSampledFloat(channel, maxAge) * self._analogRef
+
+    def analogReadSampledScan(self, channel, value_type=None, maxAge=None):
+        # Return the sampled value of a channel and the number of the scan it is from, so callers can tell new samples apart
+        read_functions = {'float': self.analogReadSampledFloat, 'volt': self.analogReadSampledVolt}
+        with self._analogSampleLock:
+            return read_functions.get(value_type, self.analogReadSampled)(channel, maxAge), self._analogSampleScan
     
     @response("%d")
     def analogRead(self, channel, diff=False):
@@ -70,26 +130,28 @@ class ADC():
             raise NotImplementedError
         return self.analogReadFloat(channel, diff) * self._analogRef
     
+    def __analogScanAll__(self):
+        with self._analogSampleLock:
+            self.__analogReadAll__(range(self._analogCount))
+            self._analogSampleTime = time()
+            self._analogSampleScan += 1
+            return list(self._analogValues)
+
     @response(contentType=M_JSON)
     def analogReadAll(self):
-        values = {}
-        for i in range(self._analogCount):
-            values[i] = self.analogRead(i)
-        return values
+        return dict(enumerate(self.__analogScanAll__()))
             
     @response(contentType=M_JSON)
     def analogReadAllFloat(self):
-        values = {}
-        for i in range(self._analogCount):
-            values[i] = float("%.2f" % self.analogReadFloat(i))
-        return values
+        scale = float(self._analogMax)
+        return {i: round(value / scale, 2) for i, value in enumerate(self.__analogScanAll__())}
     
     @response(contentType=M_JSON)
     def analogReadAllVolt(self):
-        values = {}
-        for i in range(self._analogCount):
-            values[i] = float("%.2f" % self.analogReadVolt(i))
-        return values
+        if self._analogRef == 0:
+            raise NotImplementedError
+        scale = self._analogRef / float(self._analogMax)
+        return {i: round(value * scale, 2) for i, value in enumerate(self.__analogScanAll__())}
 
     def read(self, channel, value_type=None, diff=False):
         read_functions = {'float': self.analogReadFloat, 'volt': self.analogReadVolt}
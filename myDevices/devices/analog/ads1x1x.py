@@ -34,8 +34,11 @@ class ADS1X1X(ADC, I2C):
         ADC.__init__(self, channelCount, resolution, 4.096)
         self._analogMax = 2**(resolution-1)
         self.name = name
+        # Register buffers reused by every read, they are only used while the bus is held
+        self._config = bytearray(2)
+        self._value = bytearray(2)
         
-        config = self.readRegisters(self.CONFIG, 2)
+        config = self.readRegistersInto(self.CONFIG, self._config)
         
         mode = 0 # continuous
         config[0] &= ~self.CONFIG_MODE_MASK
@@ -51,16 +54,18 @@ class ADS1X1X(ADC, I2C):
         return "%s(slave=0x%02X)" % (self.name, self.slave)
         
     def __analogRead__(self, channel, diff=False):
-        config = self.readRegisters(self.CONFIG, 2)
-        config[0] &= ~self.CONFIG_CHANNEL_MASK
-        if diff:
-            config[0] |= channel << 4
-        else:
-            config[0] |= (channel + 4) << 4
-        self.writeRegisters(self.CONFIG, config)
-        sleep(0.001)
-        d = self.readRegisters(self.VALUE, 2)
-        value = (d[0] << 8 | d[1]) >> (16-self._analogResolution)
+        # Hold the bus from selecting the channel until its conversion is read, so another thread cannot switch channels
+        with self.adapter.transaction(self.slave):
+            config = self.readRegistersInto(self.CONFIG, self._config)
+            config[0] &= ~self.CONFIG_CHANNEL_MASK
+            if diff:
+                config[0] |= channel << 4
+            else:
+                config[0] |= (channel + 4) << 4
+            self.writeRegisters(self.CONFIG, config)
+            sleep(0.001)
+            d = self.readRegistersInto(self.VALUE, self._value)
+            value = (d[0] << 8 | d[1]) >> (16-self._analogResolution)
         return signInteger(value, self._analogResolution)
 
 
@@ -0,0 +1,75 @@
+"""
+This module provides a filter stage for smoothing noisy analog sensor readings.
+"""
+
+
+class RingBuffer():
+    """Fixed-size buffer that overwrites the oldest value when full"""
+
+    def __init__(self, size):
+        """Initialize a buffer holding at most size values"""
+        self.values = [0.0] * size
+        self.size = size
+        self.count = 0
+        self.index = 0
+
+    def append(self, value):
+        """Add a value, returning the value it replaced or None if the buffer was not full"""
+        replaced = self.values[self.index] if self.count == self.size else None
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        return replaced
+
+    def items(self):
+        """Return the buffered values"""
+        return self.values[:self.count]
+
+
+class AnalogFilter():
+    """Median, moving average and EWMA filter with a deadband on the reported value
+
+    Each stage is disabled by its default argument, so AnalogFilter() passes values through unchanged.
+    """
+
+    def __init__(self, average=1, median=1, ewma=0, deadband=0):
+        """Initialize the filter
+
+        Args:
+            average: Number of values in the moving average
+            median: Number of values to take the median of, to reject spikes
+            ewma: Smoothing factor in (0, 1] of the exponentially weighted moving average, 0 to disable
+            deadband: Minimum difference from the last reported value for a new value to be reported
+        """
+        if not 0 <= ewma <= 1:
+            raise ValueError("EWMA factor %f out of range [0..1]" % ewma)
+        self.median = RingBuffer(median) if median > 1 else None
+        self.average = RingBuffer(average) if average > 1 else None
+        self.averageSum = 0.0
+        self.ewma = ewma
+        self.ewmaValue = None
+        self.deadband = deadband
+        self.reported = None
+
+    def update(self, value):
+        """Add a new value and return the filtered value to report"""
+        if self.median:
+            self.median.append(value)
+            values = sorted(self.median.items())
+            middle = len(values) // 2
+            value = values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+        if self.average:
+            replaced = self.average.append(value)
+            if self.average.index == 0:
+                # Recompute the sum each time the buffer wraps so float rounding errors do not accumulate
+                self.averageSum = sum(self.average.items())
+            else:
+                self.averageSum += value - (replaced or 0)
+            value = self.averageSum / self.average.count
+        if self.ewma:
+            if self.ewmaValue is not None:
+                value = self.ewmaValue + self.ewma * (value - self.ewmaValue)
+            self.ewmaValue = value
+        if self.reported is None or abs(value - self.reported) >= self.deadband:
+            self.reported = value
+        return self.reported
@@ -15,14 +15,20 @@
 from myDevices.decorators.rest import request, response
 from myDevices.utils.types import toint
 from myDevices.devices import instance
+from myDevices.devices.analog.filter import AnalogFilter
 from myDevices.utils.logger import info
 from myDevices.plugins.manager import PluginManager
 
 class AnalogSensor():
-    def __init__(self, adc, channel):
+    def __init__(self, adc, channel, oversample=1, average=1, median=1, ewma=0, deadband=0):
         self.adcname = adc
         self.channel = toint(channel)
         self.adc = None
+        # Filter settings are device args, so they are persisted in devices.json along with adc and channel
+        self.oversample = max(1, toint(oversample))
+        self.filterArgs = {'average': toint(average), 'median': toint(median), 'ewma': float(ewma), 'deadband': float(deadband)}
+        self.filters = {}
+        self.filterScans = {}
         self.pluginManager = PluginManager()
         self.setADCInstance()
 
@@ -37,60 +43,81 @@ class AnalogSensor():
             self.adc = instance.deviceInstance(self.adcname)
             if not self.adc:
                 self.adc = self.pluginManager.get_plugin_by_id(self.adcname)
+            elif hasattr(self.adc, 'addSampleChannel'):
+                # Sensors on the same ADC share one scan of all their channels per poll
+                self.adc.addSampleChannel(self.channel)
 
-    @response("%d")
-    def read(self):
-        self.setADCInstance()
+    def __readSample__(self, value_type=None):
+        # Return the value and the number of the ADC scan it is from, None for plugin ADCs, which are read on each call
         try:
-            value = self.adc.analogRead(self.channel)
+            return self.adc.analogReadSampledScan(self.channel, value_type)
         except:
-            value = getattr(self.adc['instance'], self.adc['read'])(self.channel)
-        return value
+            if value_type:
+                return getattr(self.adc['instance'], self.adc['read'])(self.channel, value_type), None
+            return getattr(self.adc['instance'], self.adc['read'])(self.channel), None
+
+    def __readOversample__(self, value_type=None):
+        # Additional samples convert only this channel instead of rescanning all the sampled channels
+        try:
+            return self.adc.read(self.channel, value_type)
+        except:
+            return self.__readSample__(value_type)[0]
+
+    def __readFiltered__(self, value_type=None):
+        self.setADCInstance()
+        if value_type not in self.filters:
+            self.filters[value_type] = AnalogFilter(**self.filterArgs)
+        analog_filter = self.filters[value_type]
+        value, scan = self.__readSample__(value_type)
+        if scan is not None and scan == self.filterScans.get(value_type):
+            # The filter is only updated with new samples, reads of the same scan, e.g. from REST requests, command
+            # echoes and rules, return the filtered value so they do not change the smoothing
+            return analog_filter.reported
+        self.filterScans[value_type] = scan
+        if self.oversample > 1:
+            for i in range(1, self.oversample):
+                value += self.__readOversample__(value_type)
+            value /= float(self.oversample)
+        return analog_filter.update(value)
+
+    @response("%d")
+    def read(self):
+        return int(round(self.__readFiltered__()))
     
     @response("%.2f")
     def readFloat(self):
-        self.setADCInstance()
-        try:
-            value = self.adc.analogReadFloat(self.channel)
-        except:
-            value = getattr(self.adc['instance'], self.adc['read'])(self.channel, 'float')
-        return value
+        return self.__readFiltered__('float')
     
     @response("%.2f")
     def readVolt(self):
-        self.setADCInstance()
-        try:
-            value = self.adc.analogReadVolt(self.channel)
-        except:
-            value = getattr(self.adc['instance'], self.adc['read'])(self.channel, 'volt')
-        return value
+        return self.__readFiltered__('volt')
 
 
 class Photoresistor(AnalogSensor):
-    def __init__(self, adc, channel):
-        AnalogSensor.__init__(self, adc, channel)
+    def __init__(self, adc, channel, **kwargs):
+        AnalogSensor.__init__(self, adc, channel, **kwargs)
 
     def __str__(self):
         return "Photoresistor"
             
 class Thermistor(AnalogSensor):
-    def __init__(self, adc, channel):
-        AnalogSensor.__init__(self, adc, channel)
+    def __init__(self, adc, channel, **kwargs):
+        AnalogSensor.__init__(self, adc, channel, **kwargs)
 
     def __str__(self):
         return "Thermistor"
     
 class DistanceSensor(AnalogSensor):
-    def __init__(self, adc, channel):
+    def __init__(self, adc, channel, **kwargs):
         info('DistanceSensor init {} {}'.format(adc, channel))
-        AnalogSensor.__init__(self, adc, channel)
+        AnalogSensor.__init__(self, adc, channel, **kwargs)
 
     def __str__(self):
         return "DistanceSensor"
     
 class LoadSensor(AnalogSensor):
-    def __init__(self, adc, channel):
-        AnalogSensor.__init__(self, adc, channel)
+    def __init__(self, adc, channel, **kwargs):
+        AnalogSensor.__init__(self, adc, channel, **kwargs)
 
     def __str__(self):
         return "LoadSensor"
@@ -12,8 +12,9 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+from array import array
 from myDevices.utils.types import toint
-from myDevices.devices.i2c import I2C
+from myDevices.devices.i2c import I2C, PRIORITY_READ
 from myDevices.devices.analog import DAC, ADC
 
 
@@ -30,9 +31,11 @@ class PCF8591(DAC, I2C):
     def __family__(self):
         return [DAC.__family__(self), ADC.__family__(self)]
 
-    def __command__(self, adChannel=0):
+    def __command__(self, adChannel=0, autoIncrement=False):
         d = bytearray(2)
         d[0]  = 0x40           # enable output
+        if autoIncrement:
+            d[0] |= 0x04
         d[0] |= adChannel & 0x03
         d[1]  = self.daValue
         return d
@@ -42,8 +45,19 @@ class PCF8591(DAC, I2C):
         if (channel == 0):
             return self.daValue
         else:
-            self.writeBytes(self.__command__(channel-1))
-            return self.readBytes(3)[2]
+            with self.adapter.transaction(self.slave, PRIORITY_READ):
+                self.writeBytes(self.__command__(channel-1))
+                return self.readBytes(3)[2]
+
+    def __analogReadAll__(self, channels):
+        self._analogValues[0] = self.daValue
+        if any(channel > 0 for channel in channels):
+            # In auto-increment mode the four inputs are converted in turn, the first byte read
+            # is the result of the previous conversion so it is skipped
+            with self.adapter.transaction(self.slave, PRIORITY_READ):
+                self.writeBytes(self.__command__(0, True))
+                d = self.readBytes(5)
+            self._analogValues[1:5] = array('l', d[1:5])
                 
     
     def __analogWrite__(self, channel, value):
@@ -159,6 +159,11 @@ class Bus():
     def readByte(self):
         return self.readBytes()[0]
 
+    def readInto(self, buff):
+        if self.fd > 0:
+            return os.readv(self.fd, [buff])
+        raise Exception("Device %s not open" % self.device)
+
     def writeDevice(self, string):
         if self.fd > 0:
             return os.write(self.fd, string)
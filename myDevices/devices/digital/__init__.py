@@ -128,6 +128,25 @@ class GPIOPort():
         self.__portWrite__(value)
         return self.portRead()
 
+    def digitalWriteGroup(self, writes):
+        # Write all (channel, value) pairs in order before reading the channels back, -1 for failed writes
+        written = []
+        for channel, value in writes:
+            try:
+                self.checkDigitalChannel(channel)
+                self.checkDigitalValue(value)
+                self.__digitalWrite__(channel, value)
+                written.append(channel)
+            except Exception:
+                written.append(None)
+        values = []
+        for channel in written:
+            try:
+                values.append(int(self.digitalRead(channel)) if channel is not None else -1)
+            except Exception:
+                values.append(-1)
+        return values
+
 
 DRIVERS = {}
 DRIVERS["helper"] = ["DigitalSensor", "DigitalActuator", "LightSwitch", "MotorSwitch", "RelaySwitch", "ValveSwitch", "MotionSensor"]
@@ -12,7 +12,14 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import os
 import fcntl
+import ctypes
+from contextlib import contextmanager
+from heapq import heappush, heappop
+from itertools import count
+from threading import Condition, Lock, get_ident
+from time import time
 
 from myDevices.system.hardware import BOARD_REVISION, Hardware
 from myDevices.devices.bus import Bus
@@ -42,7 +49,168 @@ I2C_RDWR        = 0x0707    # Combined R/W transfer (one STOP only)
 I2C_PEC         = 0x0708    # != 0 to use PEC with SMBus
 I2C_SMBUS       = 0x0720    # SMBus transfer */
 
+# i2c_msg flags
+I2C_M_RD        = 0x0001    # read data, from slave to master
+
+# I2C_FUNCS adapter functionality bits
+I2C_FUNC_I2C                    = 0x00000001
+I2C_FUNC_SMBUS_READ_BYTE_DATA   = 0x00080000
+I2C_FUNC_SMBUS_READ_I2C_BLOCK   = 0x04000000
+
+# i2c_smbus_ioctl_data read_write and size values
+I2C_SMBUS_READ              = 1
+I2C_SMBUS_WRITE             = 0
+I2C_SMBUS_BYTE_DATA         = 2
+I2C_SMBUS_I2C_BLOCK_DATA    = 8
+I2C_SMBUS_BLOCK_MAX         = 32
+
+class i2c_msg(ctypes.Structure):
+    _fields_ = [("addr", ctypes.c_uint16),
+                ("flags", ctypes.c_uint16),
+                ("len", ctypes.c_uint16),
+                ("buf", ctypes.c_void_p)]
+
+class i2c_rdwr_ioctl_data(ctypes.Structure):
+    _fields_ = [("msgs", ctypes.POINTER(i2c_msg)),
+                ("nmsgs", ctypes.c_uint32)]
+
+class i2c_smbus_data(ctypes.Union):
+    _fields_ = [("byte", ctypes.c_uint8),
+                ("word", ctypes.c_uint16),
+                ("block", ctypes.c_uint8 * (I2C_SMBUS_BLOCK_MAX + 2))]
+
+class i2c_smbus_ioctl_data(ctypes.Structure):
+    _fields_ = [("read_write", ctypes.c_uint8),
+                ("command", ctypes.c_uint8),
+                ("size", ctypes.c_uint32),
+                ("data", ctypes.POINTER(i2c_smbus_data))]
+
 SLAVES = [None for i in range(128)]
+ADAPTERS = {}
+ADAPTERS_LOCK = Lock()
+
+# Transaction priorities, lower values are scheduled first
+PRIORITY_WRITE = 0
+PRIORITY_READ = 1
+
+class I2CAdapter():
+    """Shared /dev/i2c-N adapter used by all I2C devices on the same bus.
+
+    The adapter owns the file descriptor and serializes transactions from all threads. Waiting
+    transactions are granted the bus in priority order so actuator writes go ahead of polling reads.
+    """
+    def __init__(self, device):
+        self.device = device
+        self.fd = os.open(device, os.O_RDWR)
+        self.slave = None
+        self.refCount = 0
+        self.funcs = self.readFunctions()
+        self.condition = Condition(Lock())
+        self.owner = None
+        self.depth = 0
+        self.waiting = []
+        self.sequence = count()
+        self.resetStats()
+
+    def __str__(self):
+        return "I2CAdapter(%s)" % self.device
+
+    def readFunctions(self):
+        funcs = ctypes.c_ulong()
+        try:
+            fcntl.ioctl(self.fd, I2C_FUNCS, funcs)
+        except OSError:
+            return 0
+        return funcs.value
+
+    def close(self):
+        if self.fd > 0:
+            os.close(self.fd)
+            self.fd = 0
+
+    def acquire(self, priority=PRIORITY_READ):
+        thread = get_ident()
+        with self.condition:
+            if self.owner == thread:
+                self.depth += 1
+                return
+            ticket = (priority, next(self.sequence))
+            heappush(self.waiting, ticket)
+            requested = time()
+            while self.owner is not None or self.waiting[0] != ticket:
+                self.condition.wait()
+            heappop(self.waiting)
+            self.owner = thread
+            self.depth = 1
+            self.acquired = time()
+            self.waitTime += self.acquired - requested
+
+    def release(self, failed=False):
+        with self.condition:
+            self.depth -= 1
+            if self.depth > 0:
+                return
+            self.owner = None
+            self.busyTime += time() - self.acquired
+            self.transactions += 1
+            if failed:
+                self.errors += 1
+            self.condition.notify_all()
+
+    def selectSlave(self, slave):
+        if self.slave != slave:
+            self.slave = None
+            if fcntl.ioctl(self.fd, I2C_SLAVE, slave):
+                raise Exception("Error binding I2C slave 0x%02X" % slave)
+            self.slave = slave
+
+    @contextmanager
+    def transaction(self, slave, priority=PRIORITY_READ):
+        self.acquire(priority)
+        failed = False
+        try:
+            self.selectSlave(slave)
+            yield self
+        except:
+            failed = self.depth == 1
+            raise
+        finally:
+            self.release(failed)
+
+    def resetStats(self):
+        self.statsStart = time()
+        self.transactions = 0
+        self.errors = 0
+        self.busyTime = 0.0
+        self.waitTime = 0.0
+
+    def getStats(self):
+        elapsed = time() - self.statsStart
+        return {"transactions": self.transactions,
+                "errors": self.errors,
+                "utilization": self.busyTime / elapsed if elapsed > 0 else 0.0,
+                "wait": self.waitTime / self.transactions if self.transactions else 0.0,
+                "queued": len(self.waiting)}
+
+def openAdapter(device):
+    with ADAPTERS_LOCK:
+        adapter = ADAPTERS.get(device)
+        if adapter is None:
+            adapter = I2CAdapter(device)
+            ADAPTERS[device] = adapter
+        adapter.refCount += 1
+        return adapter
+
+def closeAdapter(adapter):
+    with ADAPTERS_LOCK:
+        adapter.refCount -= 1
+        if adapter.refCount <= 0:
+            adapter.close()
+            del ADAPTERS[adapter.device]
+
+def adapterStats():
+    with ADAPTERS_LOCK:
+        return {device: adapter.getStats() for device, adapter in ADAPTERS.items()}
 
 class I2C(Bus):
     def __init__(self, slave, allow_duplicates=False):
@@ -58,10 +226,28 @@ class I2C(Bus):
         elif hardware.isBeagleBone():
             self.channel = 2
 
-        Bus.__init__(self, "I2C", "/dev/i2c-%d" % self.channel)
         self.slave = slave
-        if fcntl.ioctl(self.fd, I2C_SLAVE, self.slave):
-            raise Exception("Error binding I2C slave 0x%02X" % self.slave)
+        Bus.__init__(self, "I2C", "/dev/i2c-%d" % self.channel)
+        try:
+            with self.adapter.transaction(self.slave):
+                pass
+        except:
+            self.close()
+            raise
+        self.funcs = self.adapter.funcs
+
+        # Transfer structs are allocated once and reused for every combined transaction
+        self._register = ctypes.c_uint8()
+        self._msgs = (i2c_msg * 2)()
+        self._msgs[0].addr = self.slave
+        self._msgs[0].flags = 0
+        self._msgs[0].len = 1
+        self._msgs[0].buf = ctypes.addressof(self._register)
+        self._msgs[1].addr = self.slave
+        self._msgs[1].flags = I2C_M_RD
+        self._rdwr = i2c_rdwr_ioctl_data(self._msgs, 2)
+        self._smbusData = i2c_smbus_data()
+        self._smbus = i2c_smbus_ioctl_data(I2C_SMBUS_READ, 0, 0, ctypes.pointer(self._smbusData))
         
         # Since we now allow duplicates, e.g. BMP180_TEMPERATURE & BMP180_PRESSURE, we might need to 
         # change the SLAVES list to store a reference count or base class name as a way of making sure
@@ -73,18 +259,76 @@ class I2C(Bus):
     def __str__(self):
         return "I2C(slave=0x%02X)" % self.slave
     
+    def open(self):
+        self.adapter = openAdapter(self.device)
+        self.fd = self.adapter.fd
+
     def close(self):
         global SLAVES
-        Bus.close(self)
-        SLAVES[self.slave] = None
-    
+        if self.fd > 0:
+            closeAdapter(self.adapter)
+            self.fd = 0
+        if SLAVES[self.slave] == self:
+            SLAVES[self.slave] = None
+
+    def readDevice(self, size=1):
+        with self.adapter.transaction(self.slave, PRIORITY_READ):
+            return Bus.readDevice(self, size)
+
+    def readInto(self, buff):
+        with self.adapter.transaction(self.slave, PRIORITY_READ):
+            return Bus.readInto(self, buff)
+
+    def writeDevice(self, string):
+        with self.adapter.transaction(self.slave, PRIORITY_WRITE):
+            return Bus.writeDevice(self, string)
+
+    def hasFunction(self, func):
+        return (self.funcs & func) == func
+
+    def smbusRead(self, command, size, length=0):
+        # The shared transfer structs are only used while the bus is held, the result is returned as a copy
+        with self.adapter.transaction(self.slave, PRIORITY_READ):
+            self._smbus.command = command
+            self._smbus.size = size
+            if size == I2C_SMBUS_I2C_BLOCK_DATA:
+                self._smbusData.block[0] = length
+            fcntl.ioctl(self.fd, I2C_SMBUS, self._smbus)
+            return i2c_smbus_data.from_buffer_copy(self._smbusData)
+
+    def writeRead(self, addr, buff):
+        # Register address write followed by a repeated start read, with a single STOP at the end
+        rx = (ctypes.c_uint8 * len(buff)).from_buffer(buff)
+        with self.adapter.transaction(self.slave, PRIORITY_READ):
+            self._register.value = addr
+            self._msgs[1].len = len(buff)
+            self._msgs[1].buf = ctypes.addressof(rx)
+            fcntl.ioctl(self.fd, I2C_RDWR, self._rdwr)
+        return buff
+
     def readRegister(self, addr):
-        self.writeByte(addr)
-        return self.readByte()
+        with self.adapter.transaction(self.slave, PRIORITY_READ):
+            if self.hasFunction(I2C_FUNC_SMBUS_READ_BYTE_DATA):
+                return self.smbusRead(addr, I2C_SMBUS_BYTE_DATA).byte
+            self.writeByte(addr)
+            return self.readByte()
     
     def readRegisters(self, addr, count):
-        self.writeByte(addr)
-        return self.readBytes(count)
+        return self.readRegistersInto(addr, bytearray(count))
+
+    def readRegistersInto(self, addr, buff):
+        """Read len(buff) bytes starting at register addr into buff, which must be a writable bytearray or memoryview"""
+        count = len(buff)
+        if self.hasFunction(I2C_FUNC_I2C):
+            return self.writeRead(addr, buff)
+        if count <= I2C_SMBUS_BLOCK_MAX and self.hasFunction(I2C_FUNC_SMBUS_READ_I2C_BLOCK):
+            data = self.smbusRead(addr, I2C_SMBUS_I2C_BLOCK_DATA, count)
+            buff[:] = bytes(data.block[1:count+1])
+            return buff
+        with self.adapter.transaction(self.slave, PRIORITY_READ):
+            self.writeByte(addr)
+            self.readInto(buff)
+        return buff
     
     def writeRegister(self, addr, byte):
         self.writeBytes([addr, byte])
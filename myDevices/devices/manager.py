@@ -1,12 +1,14 @@
 import imp
 import os.path
 import json as JSON
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep, time
 from threading import RLock
 from myDevices.utils import logger
 from myDevices.utils import types
 from myDevices.utils.config import Config
 from myDevices.devices import serial, digital, analog, sensor
+from myDevices.devices.bus import Bus
 from myDevices.devices.instance import DEVICES
 from myDevices.devices.onewire import detectOneWireDevices, deviceExists, FAMILIES
 
@@ -69,11 +71,15 @@ def saveDevice(name, install_date=None):
         DYNAMIC_DEVICES[name] = DEVICES[name]
         if install_date:
             DEVICES[name]['install_date'] = install_date
+        saveDevices()
+
+def saveDevices():
+    with mutex:
         json_devices = getJSON(DYNAMIC_DEVICES)
         with open(DEVICES_JSON_FILE, 'w') as outfile:
             outfile.write(json_devices)
 
-def removeDevice(name):
+def removeDevice(name, save=True):
     with mutex:
         if name in DEVICES:
             if name in DYNAMIC_DEVICES:
@@ -81,9 +87,8 @@ def removeDevice(name):
                     DEVICES[name]["device"].close()
                 del DEVICES[name]
                 del DYNAMIC_DEVICES[name]
-                json_devices = getJSON(DYNAMIC_DEVICES)
-                with open(DEVICES_JSON_FILE, 'w') as outfile:
-                    outfile.write(json_devices)
+                if save:
+                    saveDevices()
                 logger.debug("Deleted device %s" % name)
                 return (200, None, None)
             logger.error("Cannot delete %s, found but not added via REST" % name)
@@ -188,6 +193,119 @@ def addDevice(name, device, description, args, origin):
             removeDevice(name)
         return 0
 
+def getDeviceBus(constructor):
+    # Return the bus class a driver is built on, or None if it does not use a bus directly
+    for cls in constructor.__mro__:
+        if Bus in cls.__bases__:
+            return cls
+    return None
+
+def createDeviceInstance(name, device, constructor, args):
+    try:
+        if len(args) > 0:
+            return constructor(**args)
+        return constructor()
+    except Exception as e:
+        logger.error("Error while adding device %s(%s) : %s" % (name, device, e))
+    return None
+
+def applyDeviceChanges(changes, origin="rest"):
+    # Apply a list of (action, json) changes, action is 'add', 'edit' or 'delete' and json is the device json
+    # as used by addDeviceJSON. Every change is validated before any device is changed. Drivers on different buses
+    # are instantiated in parallel, devices on the same bus one at a time. Drivers without a bus, e.g. helpers that
+    # refer to other devices, are instantiated after the bus devices have been added. If the new driver of an edited
+    # device fails the previous device is restored. devices.json is only written once. Returns the status code for
+    # each change.
+    results = [None] * len(changes)
+    pending = []
+    with mutex:
+        names = set(DEVICES)
+        for index, (action, json) in enumerate(changes):
+            name = json.get("name")
+            if not name or action not in ('add', 'edit', 'delete'):
+                results[index] = 400
+                continue
+            if name in [entry[2] for entry in pending if entry[1] != 'delete']:
+                logger.error("Device <%s> changed more than once" % name)
+                results[index] = 409
+                continue
+            if action in ('edit', 'delete'):
+                if name not in names:
+                    logger.error("Cannot change %s, not found" % name)
+                    results[index] = 404
+                    continue
+                if name not in DYNAMIC_DEVICES:
+                    logger.error("Cannot change %s, found but not added via REST" % name)
+                    results[index] = 403
+                    continue
+                if action == 'delete':
+                    names.discard(name)
+                    pending.append((index, action, name, None, None, None, None))
+                    continue
+            device = json.get("device")
+            args = json.get("args", {})
+            description = json.get("description", name)
+            if (action == 'add' and name in names) or missingOneWireDevice({'class': device, 'args': args}):
+                logger.error("Device <%s> already exists" % name)
+                results[index] = 409
+                continue
+            try:
+                constructor = findDeviceClass(device)
+            except Exception as ex:
+                logger.debug('findDeviceClass failure:' + str(ex))
+                constructor = None
+            if constructor == None:
+                logger.error("Device driver not found for %s" % device)
+                results[index] = 500
+                continue
+            names.add(name)
+            pending.append((index, action, name, device, description, args, constructor))
+
+        # Removed devices are only closed once the changes are applied, so edited devices can be restored
+        removed = {}
+        for (index, action, name, device, description, args, constructor) in pending:
+            if action in ('edit', 'delete'):
+                removed[name] = DEVICES.pop(name)
+                del DYNAMIC_DEVICES[name]
+                results[index] = 200
+        buses = {}
+        helpers = []
+        for entry in pending:
+            if entry[1] == 'delete':
+                continue
+            bus = getDeviceBus(entry[6])
+            if bus:
+                buses.setdefault(bus, []).append(entry)
+            else:
+                helpers.append(entry)
+        createGroup = lambda entries: [(entry, createDeviceInstance(entry[2], entry[3], entry[6], entry[5])) for entry in entries]
+        created = []
+        if buses:
+            with ThreadPoolExecutor(max_workers=len(buses)) as executor:
+                for group in executor.map(createGroup, buses.values()):
+                    created += group
+        def addInstances(group):
+            for (index, action, name, device, description, args, constructor), instance in group:
+                if instance is None:
+                    if action == 'edit':
+                        logger.info("Restoring device %s" % name)
+                        DEVICES[name] = DYNAMIC_DEVICES[name] = removed.pop(name)
+                    results[index] = 500
+                    continue
+                addDeviceInstance(name, device, description, instance, args, origin)
+                DEVICES[name]['install_date'] = int(time())
+                if origin != 'manual':
+                    DYNAMIC_DEVICES[name] = DEVICES[name]
+                results[index] = 200
+        addInstances(created)
+        addInstances(createGroup(helpers))
+        for name, entry in removed.items():
+            if hasattr(entry["device"], 'close'):
+                entry["device"].close()
+            logger.debug("Deleted device %s" % name)
+        saveDevices()
+    return results
+
 def addDeviceConf(devices, origin):
     for (name, params) in devices:
         values = params.split(" ")
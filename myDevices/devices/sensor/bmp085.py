@@ -13,6 +13,7 @@
 #   limitations under the License.
 
 import time
+import struct
 from myDevices.utils.types import signInteger
 from myDevices.devices.i2c import I2C
 from myDevices.devices.sensor import Temperature, Pressure
@@ -25,17 +26,12 @@ class BMP085(I2C, Temperature, Pressure):
         if self.pressure:
             Pressure.__init__(self, altitude, external)
         
-        self.ac1 = self.readSignedInteger(0xAA)
-        self.ac2 = self.readSignedInteger(0xAC)
-        self.ac3 = self.readSignedInteger(0xAE)
-        self.ac4 = self.readUnsignedInteger(0xB0)
-        self.ac5 = self.readUnsignedInteger(0xB2)
-        self.ac6 = self.readUnsignedInteger(0xB4)
-        self.b1  = self.readSignedInteger(0xB6)
-        self.b2  = self.readSignedInteger(0xB8)
-        self.mb  = self.readSignedInteger(0xBA)
-        self.mc  = self.readSignedInteger(0xBC)
-        self.md  = self.readSignedInteger(0xBE)
+        # Register buffer reused by every read, it is only used while the bus is held
+        self._word = bytearray(2)
+        # Calibration coefficients are read in one 22 byte transaction starting at 0xAA
+        calibration = self.readRegisters(0xAA, 22)
+        (self.ac1, self.ac2, self.ac3, self.ac4, self.ac5, self.ac6,
+         self.b1, self.b2, self.mb, self.mc, self.md) = struct.unpack(">hhhHHHhhhhh", bytes(calibration))
         
     def __str__(self):
         return "BMP085"
@@ -49,8 +45,9 @@ class BMP085(I2C, Temperature, Pressure):
         return family
 
     def readUnsignedInteger(self, address):
-        d = self.readRegisters(address, 2)
-        return d[0] << 8 | d[1]
+        with self.adapter.transaction(self.slave):
+            d = self.readRegistersInto(address, self._word)
+            return d[0] << 8 | d[1]
     
     def readSignedInteger(self, address):
         d = self.readUnsignedInteger(address)
@@ -22,6 +22,8 @@ class HYT221(I2C, Temperature, Humidity):
     
     def __init__(self, slave=0x28):
         I2C.__init__(self, toint(slave))
+        # Data buffer reused by every read, it is only used while the bus is held
+        self._data = bytearray(4)
         self.__startMeasuring__()
         
     def __str__(self):
@@ -40,12 +42,14 @@ class HYT221(I2C, Temperature, Humidity):
             # no to get the very last measurement shoudn't be a problem -> wait 10ms
             # try a read every 10 ms for maximum VAL_RETRIES times
             sleep(.01)
-            data_bytes=self.readBytes(4)
-            stale_bit = (data_bytes[0] & 0b01000000) >> 6
-            if (stale_bit == 0):    
-                raw_t = ((data_bytes[2] << 8) | data_bytes[3]) >> 2
-                raw_h = ((data_bytes[0] & 0b00111111) << 8) | data_bytes[1]
-                return (raw_t, raw_h)
+            with self.adapter.transaction(self.slave):
+                self.readInto(self._data)
+                data_bytes = self._data
+                stale_bit = (data_bytes[0] & 0b01000000) >> 6
+                if (stale_bit == 0):    
+                    raw_t = ((data_bytes[2] << 8) | data_bytes[3]) >> 2
+                    raw_h = ((data_bytes[0] & 0b00111111) << 8) | data_bytes[1]
+                    return (raw_t, raw_h)
 
         #Stale was never 0, so datas are not actual
         raise Exception("HYT221(slave=0x%02X): data fetch timeout" % self.slave)
@@ -41,7 +41,9 @@ class TSL_LIGHT_X(I2C, Luminosity):
 
     def __init__(self, slave, time, name="TSL_LIGHT_X"):
         I2C.__init__(self, toint(slave))
-        self.name = name  
+        self.name = name
+        # Register buffer reused by every read, it is only used while the bus is held
+        self._data = bytearray(2)
         self.wake() # devices are powered down after power reset, wake them
         self.setTime(toint(time))
 
@@ -82,10 +84,11 @@ class TSL2561X(TSL_LIGHT_X):
         self.setGain(toint(gain))
 
     def __getLux__(self):
-        ch0_bytes = self.readRegisters(self.REG_CHANNEL_0_LOW, 2)
-        ch1_bytes = self.readRegisters(self.REG_CHANNEL_1_LOW, 2)
-        ch0_word = ch0_bytes[1] << 8 | ch0_bytes[0]
-        ch1_word = ch1_bytes[1] << 8 | ch1_bytes[0]
+        with self.adapter.transaction(self.slave):
+            ch0_bytes = self.readRegistersInto(self.REG_CHANNEL_0_LOW, self._data)
+            ch0_word = ch0_bytes[1] << 8 | ch0_bytes[0]
+            ch1_bytes = self.readRegistersInto(self.REG_CHANNEL_1_LOW, self._data)
+            ch1_word = ch1_bytes[1] << 8 | ch1_bytes[0]
         scaling = self.time_multiplier * self.gain_multiplier
         value = self.__calculateLux__(scaling * ch0_word, scaling * ch1_word)
         if value != self.VAL_INVALID:
@@ -240,8 +243,9 @@ class TSL4531(TSL_LIGHT_X):
         return t
 
     def __getLux__(self):
-        data_bytes = self.readRegisters(self.REG_DATA_LOW, 2)
-        return self.time_multiplier * (data_bytes[1] << 8 | data_bytes[0])
+        with self.adapter.transaction(self.slave):
+            data_bytes = self.readRegistersInto(self.REG_DATA_LOW, self._data)
+            return self.time_multiplier * (data_bytes[1] << 8 | data_bytes[0])
 
 class TSL45311(TSL4531):
     def __init__(self, slave=0x39, time=400):
@@ -56,6 +56,8 @@ class VCNL4000(I2C, Luminosity, Distance):
         self.luminosity = luminosity
         self.distance = distance
         I2C.__init__(self, toint(slave), True)
+        # Register buffer reused by every read, it is only used while the bus is held
+        self._data = bytearray(2)
         self.setCurrent(toint(current))
         self.setFrequency(toint(frequency))
         self.prox_threshold = toint(prox_threshold)
@@ -160,8 +162,9 @@ class VCNL4000(I2C, Luminosity, Distance):
                 time.sleep(0.05)
                 if count >= 5:
                     raise ex
-        light_bytes = self.readRegisters(self.REG_AMB_RESULT_HIGH, 2)
-        light_word = light_bytes[0] << 8 | light_bytes[1]
+        with self.adapter.transaction(self.slave):
+            light_bytes = self.readRegistersInto(self.REG_AMB_RESULT_HIGH, self._data)
+            light_word = light_bytes[0] << 8 | light_bytes[1]
         return self.__calculateLux__(light_word)
          
     def __calculateLux__(self, light_word):
@@ -221,9 +224,11 @@ class VCNL4000(I2C, Luminosity, Distance):
         self.writeRegister(self.REG_COMMAND, self.VAL_START_PROX)
         while not (self.readRegister(self.REG_COMMAND) & self.MASK_PROX_READY):
             time.sleep(0.001)
-        proximity_bytes = self.readRegisters(self.REG_PROX_RESULT_HIGH, 2)
-        debug("VCNL4000: prox raw value = %d" % (proximity_bytes[0] << 8 | proximity_bytes[1]))
-        return (proximity_bytes[0] << 8 | proximity_bytes[1])
+        with self.adapter.transaction(self.slave):
+            proximity_bytes = self.readRegistersInto(self.REG_PROX_RESULT_HIGH, self._data)
+            proximity_word = proximity_bytes[0] << 8 | proximity_bytes[1]
+        debug("VCNL4000: prox raw value = %d" % proximity_word)
+        return proximity_word
     
 class VCNL4000_LUMINOSITY(VCNL4000):
     def __init__(self):
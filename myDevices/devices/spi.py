@@ -16,8 +16,8 @@ import fcntl
 import array
 import ctypes
 import struct
+from threading import Lock
 
-from sys import version_info
 from myDevices.devices.bus import Bus
 from myDevices.system.hardware import Hardware
 
@@ -84,6 +84,34 @@ SPI_IOC_WR_BITS_PER_WORD    = _IOW(SPI_IOC_MAGIC, 3, 1)
 SPI_IOC_RD_MAX_SPEED_HZ     = _IOR(SPI_IOC_MAGIC, 4, 4)
 SPI_IOC_WR_MAX_SPEED_HZ     = _IOW(SPI_IOC_MAGIC, 4, 4)
 
+class spi_ioc_transfer(ctypes.Structure):
+    _fields_ = [("tx_buf", ctypes.c_uint64),
+                ("rx_buf", ctypes.c_uint64),
+                ("len", ctypes.c_uint32),
+                ("speed_hz", ctypes.c_uint32),
+                ("delay_usecs", ctypes.c_uint16),
+                ("bits_per_word", ctypes.c_uint8),
+                ("cs_change", ctypes.c_uint8),
+                ("tx_nbits", ctypes.c_uint8),
+                ("rx_nbits", ctypes.c_uint8),
+                ("word_delay_usecs", ctypes.c_uint8),
+                ("pad", ctypes.c_uint8)]
+
+def _bufferAddress(buff, writable=False):
+    # Address of the buffer contents and the object that must stay referenced until the transfer is done.
+    # bytes and writable buffers are not copied, other read-only buffers are copied to bytes.
+    if len(buff) == 0:
+        return 0, buff
+    if writable or not isinstance(buff, bytes):
+        try:
+            view = ctypes.c_char.from_buffer(buff)
+            return ctypes.addressof(view), view
+        except TypeError:
+            if writable:
+                raise
+            buff = bytes(buff)
+    return ctypes.cast(ctypes.c_char_p(buff), ctypes.c_void_p).value, buff
+
 class SPI(Bus):
     def __init__(self, chip=0, mode=0, bits=8, speed=0, init=True):
         bus = 0
@@ -121,31 +149,50 @@ class SPI(Bus):
             raise Exception("Cannot read SPI Max speed")
         self.speed = struct.unpack('I', val32)[0]
         assert((self.speed == speed) or (speed == 0))
+        self._transfers = {}
+        self._lock = Lock()
 
     def __str__(self):
         return "SPI(chip=%d, mode=%d, speed=%dHz)" % (self.chip, self.mode, self.speed)
         
     def xfer(self, txbuff=None):
-        length = len(txbuff)
-        if version_info.major >= 3:
-            _txbuff = bytes(txbuff)
-            _txptr = ctypes.create_string_buffer(_txbuff)
-        else:
-            _txbuff = str(bytearray(txbuff))
-            _txptr = ctypes.create_string_buffer(_txbuff)
-        _rxptr = ctypes.create_string_buffer(length)
-        
-        data = struct.pack("QQLLHBBL",  #64 64 32 32 16 8 8 32 b = 32B
-                    ctypes.addressof(_txptr),
-                    ctypes.addressof(_rxptr),
-                    length,
-                    self.speed,
-                    0, #delay
-                    self.bits,
-                    0, # cs_change,
-                    0  # pad
-                    )
-        
-        fcntl.ioctl(self.fd, SPI_IOC_MESSAGE(len(data)), data)
-        _rxbuff = ctypes.string_at(_rxptr, length)
-        return bytearray(_rxbuff)
+        rxbuff = bytearray(len(txbuff))
+        self.xfer_into(bytes(txbuff), rxbuff)
+        return rxbuff
+
+    def xfer_into(self, tx, rx):
+        """Full duplex transfer of tx, clocking the received bytes into rx.
+
+        tx can be bytes, bytearray or memoryview, read-only buffers other than bytes are copied. rx must be a
+        writable buffer of the same length.
+        """
+        self.xfer_multi(((tx, rx),))
+        return rx
+
+    def xfer_multi(self, transfers):
+        """Submit several (tx, rx) transfers as one SPI_IOC_MESSAGE(n) ioctl.
+
+        Chip select is released between transfers so each one is a separate message to the device.
+        """
+        count = len(transfers)
+        for tx, rx in transfers:
+            if len(tx) != len(rx):
+                raise ValueError("SPI transfer tx and rx lengths differ (%d != %d)" % (len(tx), len(rx)))
+        # The cached transfer structs are shared by all threads using this instance
+        with self._lock:
+            messages = self._transfers.get(count)
+            if messages is None:
+                messages = (spi_ioc_transfer * count)()
+                for message in messages:
+                    message.speed_hz = self.speed
+                    message.bits_per_word = self.bits
+                for message in messages[:-1]:
+                    message.cs_change = 1
+                self._transfers[count] = messages
+            buffers = []
+            for message, (tx, rx) in zip(messages, transfers):
+                message.tx_buf, txref = _bufferAddress(tx)
+                message.rx_buf, rxref = _bufferAddress(rx, True)
+                message.len = len(tx)
+                buffers.append((txref, rxref))
+            fcntl.ioctl(self.fd, SPI_IOC_MESSAGE(ctypes.sizeof(messages)), messages)
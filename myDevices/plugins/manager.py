@@ -145,10 +145,12 @@ class PluginManager(Singleton):
             args = args.replace('$channel', plugin['channel'])
         return json.loads(args)
 
-    def get_plugin_readings(self):
-        """Return a list with current readings for all plugins."""
+    def get_plugin_readings(self, plugin_id=None):
+        """Return a list with current readings for all plugins, or only the plugin with the specified id."""
         readings = []
         for key, plugin in self.plugins.items():
+            if plugin_id is not None and key != plugin_id:
+                continue
             try:
                 if 'channel' in plugin:
                     read_args = self.get_args(plugin, 'read_args')
@@ -0,0 +1,166 @@
+"""
+This module provides a report-by-exception policy that decides which channel values are published.
+Each channel has a deadband, a minimum interval between updates and a heartbeat interval after which
+the value is re-sent even if it has not changed.
+
+Policies are read from the app settings. The [Publish] section sets the defaults and sections named
+[Publish:<channel prefix>] override them for matching channels. A prefix matches whole channel name parts,
+so [Publish:dev:temp] applies to dev:temp:1 but not to dev:temp2, and the longest matching prefix wins:
+
+    [Publish]
+    Heartbeat = 60
+
+    [Publish:dev:thermistor1]
+    Deadband = 0.5
+    Percent = false
+    MinInterval = 30
+"""
+from threading import RLock
+from time import time
+from myDevices.utils.logger import debug
+
+DEFAULT_HEARTBEAT = 60 #seconds
+SECTION = 'Publish'
+
+
+class ChannelPolicy():
+    """Publish settings for a channel"""
+
+    def __init__(self, deadband=0, percent=False, min_interval=0, heartbeat=DEFAULT_HEARTBEAT):
+        """Initialize the policy
+
+        Args:
+            deadband: Minimum change in value for it to be published, absolute or in percent of the last sent value
+            percent: True if deadband is a percentage
+            min_interval: Minimum time in seconds between updates of the channel
+            heartbeat: Maximum time in seconds the channel can be silent before the value is re-sent
+        """
+        self.deadband = deadband
+        self.percent = percent
+        self.min_interval = min_interval
+        self.heartbeat = heartbeat
+
+    def IsChanged(self, value, last_value):
+        """Return True if value differs from last_value by more than the deadband"""
+        if value == last_value:
+            return False
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(last_value, (int, float)):
+            return True
+        deadband = abs(last_value) * self.deadband / 100.0 if self.percent else self.deadband
+        return abs(value - last_value) > deadband
+
+
+class ChannelState():
+    """Last published item and counters for a channel"""
+
+    def __init__(self):
+        self.item = None
+        self.time = 0
+        self.sent = 0
+        self.suppressed = 0
+
+
+class PublishPolicy():
+    """Class for filtering channel data so only changed values and heartbeats are published"""
+
+    def __init__(self, config=None):
+        """Initialize the channel policies from the config
+
+        Args:
+            config: Config object containing [Publish] sections, or None to use the default policy
+        """
+        self.mutex = RLock()
+        self.policies = {}
+        self.states = {}
+        self.default = ChannelPolicy()
+        if config:
+            self.LoadPolicies(config)
+
+    def LoadPolicies(self, config):
+        """Load the channel policies from the config"""
+        for section in config.sections():
+            if section == SECTION:
+                self.default = self.ReadPolicy(config, section, ChannelPolicy())
+        for section in config.sections():
+            if section.startswith(SECTION + ':'):
+                prefix = section[len(SECTION) + 1:]
+                self.policies[prefix] = self.ReadPolicy(config, section, self.default)
+
+    def ReadPolicy(self, config, section, default):
+        """Return a ChannelPolicy read from a config section, using default for missing settings"""
+        return ChannelPolicy(float(config.get(section, 'Deadband', default.deadband)),
+                             config.get(section, 'Percent', str(default.percent)).lower() in ('1', 'true', 'yes'),
+                             float(config.get(section, 'MinInterval', default.min_interval)),
+                             float(config.get(section, 'Heartbeat', default.heartbeat)))
+
+    def SetPolicy(self, prefix, policy):
+        """Set the policy for the channel prefix, or for the channels under it"""
+        self.policies[prefix] = policy
+
+    def GetPolicy(self, channel):
+        """Return the policy for a channel"""
+        match = None
+        for prefix in self.policies:
+            # The prefix must end at a channel delimiter, so dev:temp matches dev:temp:2 and dev:temp;c but not dev:temp2
+            if channel.startswith(prefix) and channel[len(prefix):len(prefix) + 1] in ('', ':', ';') and (match is None or len(prefix) > len(match)):
+                match = prefix
+        return self.policies[match] if match is not None else self.default
+
+    def Filter(self, data, now=None):
+        """Return the items in data that should be published and update the channel states
+
+        Channels missing from data are forgotten, so data should contain the full current state.
+
+        Args:
+            data: List of channel data dicts
+            now: Current time, defaults to time()
+        """
+        if now is None:
+            now = time()
+        publish = []
+        states = {}
+        with self.mutex:
+            for item in data:
+                channel = item['channel']
+                state = self.states.get(channel) or ChannelState()
+                states[channel] = state
+                if self.ShouldPublish(item, state, now):
+                    state.item = item
+                    state.time = now
+                    state.sent += 1
+                    publish.append(item)
+                else:
+                    state.suppressed += 1
+            self.states = states
+        debug('PublishPolicy sent {}, suppressed {}'.format(len(publish), len(data) - len(publish)))
+        return publish
+
+    def MarkSent(self, data, now=None):
+        """Record items that were published outside of Filter, so they are not sent again by the next Filter call"""
+        if now is None:
+            now = time()
+        with self.mutex:
+            for item in data:
+                state = self.states.setdefault(item['channel'], ChannelState())
+                state.item = item
+                state.time = now
+                state.sent += 1
+
+    def ShouldPublish(self, item, state, now):
+        """Return True if item should be published given the last published state of its channel"""
+        if state.item is None:
+            return True
+        policy = self.GetPolicy(item['channel'])
+        elapsed = now - state.time
+        if elapsed >= policy.heartbeat:
+            return True
+        if elapsed < policy.min_interval:
+            return False
+        if any(item.get(key) != state.item.get(key) for key in ('type', 'unit', 'name')):
+            return True
+        return policy.IsChanged(item['value'], state.item['value'])
+
+    def GetCounters(self):
+        """Return a dict with the number of sent and suppressed values for each channel"""
+        with self.mutex:
+            return {channel: {'sent': state.sent, 'suppressed': state.suppressed} for channel, state in self.states.items()}
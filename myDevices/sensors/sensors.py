@@ -10,12 +10,15 @@ from threading import Event, RLock
 from myDevices.cloud import cayennemqtt
 from myDevices.cloud.dbmanager import DbManager
 from myDevices.cloud.download_speed import DownloadSpeed
+from myDevices.cloud.outboundqueue import LANE_BULK
 from myDevices.devices import instance, manager
 from myDevices.devices.bus import BUSLIST, checkAllBus
 from myDevices.devices.digital.gpio import NativeGPIO as GPIO
 from myDevices.system import services
+from myDevices.system.network import NetworkMonitor
 from myDevices.system.systeminfo import SystemInfo
 from myDevices.plugins.manager import PluginManager
+from myDevices.sensors.publishpolicy import PublishPolicy
 from myDevices.utils.config import Config, APP_SETTINGS
 from myDevices.utils.daemon import Daemon
 from myDevices.utils.logger import debug, error, exception, info, logJson, warn
@@ -34,6 +37,7 @@ class SensorsClient():
         self.realTimeMutex = RLock()
         self.exiting = Event()
         self.onDataChanged = None
+        self.rulesEngine = None
         self.systemData = []
         self.currentSystemState = []
         self.currentRealTimeData = {}                                
@@ -42,7 +46,11 @@ class SensorsClient():
         self.disabledSensorTable = "disabled_sensors"
         checkAllBus()
         self.gpio = GPIO()
-        self.downloadSpeed = DownloadSpeed(Config(APP_SETTINGS))
+        config = Config(APP_SETTINGS)
+        self.publishPolicy = PublishPolicy(config)
+        self.downloadSpeed = DownloadSpeed(config)
+        self.topProcesses = config.getInt('Agent', 'TopProcesses', 0)
+        self.processManager = services.ProcessManager()
         self.downloadSpeed.getDownloadSpeed()
         manager.addDeviceInstance("GPIO", "GPIO", "GPIO", self.gpio, [], "system")
         manager.loadJsonDevices("rest")
@@ -54,16 +62,37 @@ class SensorsClient():
         self.pluginManager = PluginManager(self.OnPluginChange)
         self.pluginManager.load_plugins()
         self.InitCallbacks()
+        NetworkMonitor().AddCallback(self.OnNetworkChange)
         self.StartMonitoring()
 
     def SetDataChanged(self, onDataChanged=None):
         """Set callback to call when data has changed
         
         Args:
-            onDataChanged: Function to call when sensor data changes
+            onDataChanged: Function to call when sensor data changes, periodic snapshots are passed with lane=LANE_BULK
         """
         self.onDataChanged = onDataChanged
 
+    def SetRulesEngine(self, rulesEngine=None):
+        """Set the rules engine to evaluate new readings with
+
+        Args:
+            rulesEngine: RulesEngine to call with new readings from the polling and real-time paths
+        """
+        self.rulesEngine = rulesEngine
+
+    def EvaluateRules(self, data):
+        """Evaluate the local rules with new readings
+
+        Args:
+            data: List of channel data dicts
+        """
+        if self.rulesEngine and data:
+            try:
+                self.rulesEngine.evaluate(data)
+            except:
+                exception('Evaluating rules failed')
+
     def QueueRealTimeData(self, name, data):
         """Add real-time data to queue to be sent on thread
 
@@ -85,6 +114,10 @@ class SensorsClient():
             value: The new data value
         """
         debug('OnSensorChange: {}, {}'.format(device, value))
+        # Rules are evaluated on every change, sending is rate limited by the real-time monitor
+        rule_data = []
+        cayennemqtt.DataChannel.add(rule_data, cayennemqtt.DEV_SENSOR, device['name'], value=value)
+        self.EvaluateRules(rule_data)
         with self.realTimeMutex:
             data = {'name': device['description'], 'value': value, 'type': 'digital_sensor', 'unit': 'd'}
             if 'args' in device:
@@ -98,6 +131,10 @@ class SensorsClient():
             data: The new data value
         """
         debug('OnPluginChange: {}'.format(data))
+        if 'value' in data:
+            rule_data = []
+            cayennemqtt.DataChannel.add(rule_data, cayennemqtt.DEV_SENSOR, data['id'], value=data['value'])
+            self.EvaluateRules(rule_data)
         self.QueueRealTimeData(data['id'], data)
         with self.realTimeMutex:
             if not self.realTimeMonitorRunning:
@@ -113,15 +150,45 @@ class SensorsClient():
         debug('OnGpioStateChange: channel {}, value {}'.format(channel, value))
         data = []
         cayennemqtt.DataChannel.add_unique(data, cayennemqtt.SYS_GPIO, channel, cayennemqtt.VALUE, value)
+        self.EvaluateRules(data)
         if not self.realTimeMonitorRunning:
             self.onDataChanged(data)
         else:
             self.QueueRealTimeData(data[0]['channel'], data[0])
 
-    def InitCallbacks(self):
-        """Set callback function for any digital devices that support them"""
+    def OnNetworkChange(self, network_info):
+        """Send updated network info as soon as it has changed
+
+        Args:
+            network_info: The new NetworkMonitor info dict
+        """
+        debug('OnNetworkChange: {}'.format(network_info))
+        data = SystemInfo().formatNetworkInfo(network_info)
+        if self.onDataChanged and data:
+            self.publishPolicy.MarkSent(data)
+            self.onDataChanged(data)
+
+    def EchoState(self, data):
+        """Send the state read back after an actuator write immediately and record it as sent, so the next
+        Monitor cycle only sends it again if it changes
+
+        Args:
+            data: List of channel data dicts
+        """
+        if self.onDataChanged and data:
+            self.publishPolicy.MarkSent(data)
+            self.onDataChanged(data)
+
+    def InitCallbacks(self, names=None):
+        """Set callback function for any digital devices that support them
+
+        Args:
+            names: Names of the devices to set callbacks for, or None for all devices
+        """
         devices = manager.getDeviceList()
         for device in devices:
+            if names is not None and device['name'] not in names:
+                continue
             sensor = instance.deviceInstance(device['name'])
             if 'DigitalSensor' in device['type'] and hasattr(sensor, 'setCallback'):
                 debug('Set callback for {}'.format(sensor))
@@ -149,7 +216,6 @@ class SensorsClient():
     def Monitor(self):
         """Monitor bus/sensor states and system info and report changed data via callbacks"""
         debug('Monitoring sensors and os resources started')
-        sendAllDataCount = 0
         nextTime = datetime.now()
         while not self.exiting.is_set():
             try:
@@ -163,16 +229,12 @@ class SensorsClient():
                     self.MonitorSensors()
                     self.MonitorPlugins()
                     self.MonitorBus()
-                    if self.currentSystemState != self.systemData:
-                        data = self.currentSystemState
-                        if self.systemData and not sendAllDataCount == 0:
-                            data = [x for x in self.currentSystemState if x not in self.systemData]
-                        if self.onDataChanged and data:
-                            self.onDataChanged(data)
-                    sendAllDataCount += 1
-                    if sendAllDataCount >= 4:
-                        sendAllDataCount = 0
+                    data = self.publishPolicy.Filter(self.currentSystemState)
+                    if self.onDataChanged and data:
+                        self.onDataChanged(data, lane=LANE_BULK)
                     self.systemData = self.currentSystemState
+                    # Rules run after the snapshot is queued, so the state echoed by their actions is sent after it
+                    self.EvaluateRules(self.currentSystemState)
             except:
                 exception('Monitoring sensors and os resources failed')
         debug('Monitoring sensors and os resources finished')
@@ -247,6 +309,14 @@ class SensorsClient():
             download_speed = self.downloadSpeed.getDownloadSpeed()
             if download_speed:
                 cayennemqtt.DataChannel.add(newSystemInfo, cayennemqtt.SYS_NET, suffix=cayennemqtt.SPEEDTEST, value=download_speed, type='bw', unit='mbps')
+            latency = self.downloadSpeed.getLatency()
+            if latency:
+                cayennemqtt.DataChannel.add(newSystemInfo, cayennemqtt.SYS_NET, suffix=cayennemqtt.LATENCY, value=round(latency, 1), unit='ms')
+            if self.topProcesses:
+                self.processManager.Run(usage=True)
+                for rank, process in enumerate(self.processManager.GetTopProcesses(self.topProcesses), 1):
+                    cayennemqtt.DataChannel.add(newSystemInfo, cayennemqtt.SYS_PROCESS, rank, cayennemqtt.LOAD, process.CpuPercent, type='cpuload', unit='p', name=process.Name)
+                    cayennemqtt.DataChannel.add(newSystemInfo, cayennemqtt.SYS_PROCESS, rank, cayennemqtt.USAGE, process.Rss, type='memory', unit='b', name=process.Name)
         except Exception:
             exception('SystemInformation failed')
         return newSystemInfo
@@ -290,53 +360,63 @@ class SensorsClient():
         if devices is None:
             return sensors_info
         for device in devices:
-            sensor = instance.deviceInstance(device['name'])
             if 'enabled' not in device or device['enabled'] == 1:
-                sensor_types = {'Temperature': {'function': 'getCelsius', 'data_args': {'type': 'temp', 'unit': 'c'}},
-                                'Humidity': {'function': 'getHumidityPercent', 'data_args': {'type': 'rel_hum', 'unit': 'p'}},
-                                'Pressure': {'function': 'getPascal', 'data_args': {'type': 'bp', 'unit': 'pa'}},
-                                'Luminosity': {'function': 'getLux', 'data_args': {'type': 'lum', 'unit': 'lux'}},
-                                'Distance': {'function': 'getCentimeter', 'data_args': {'type': 'prox', 'unit': 'cm'}},
-                                'ServoMotor': {'function': 'readAngle', 'data_args': {'type': 'analog_actuator'}},
-                                'DigitalSensor': {'function': 'read', 'data_args': {'type': 'digital_sensor', 'unit': 'd'}},
-                                'DigitalActuator': {'function': 'read', 'data_args': {'type': 'digital_actuator', 'unit': 'd'}},
-                                'AnalogSensor': {'function': 'readFloat', 'data_args': {'type': 'analog_sensor'}},
-                                'AnalogActuator': {'function': 'readFloat', 'data_args': {'type': 'analog_actuator'}}}
-                # extension_types = {'ADC': {'function': 'analogReadAllFloat'},
-                #                     'DAC': {'function': 'analogReadAllFloat'},
-                #                     'PWM': {'function': 'pwmWildcard'},
-                #                     'GPIOPort': {'function': 'wildcard'}}
-                for device_type in device['type']:
-                    try:
-                        display_name = device['description']
-                    except:
-                        display_name = None
-                    if device_type in sensor_types:
-                        try:
-                            sensor_type = sensor_types[device_type]
-                            func = getattr(sensor, sensor_type['function'])
-                            if len(device['type']) > 1:
-                                channel = '{}:{}'.format(device['name'], device_type.lower())
-                            else:
-                                channel = device['name']
-                            value = self.CallDeviceFunction(func)
-                            cayennemqtt.DataChannel.add(sensors_info, cayennemqtt.DEV_SENSOR, channel, value=value, name=display_name, **sensor_type['data_args'])
-                            if 'DigitalActuator' == device_type and value in (0, 1):
-                                manager.updateDeviceState(device['name'], value)
-                        except:
-                            exception('Failed to get sensor data: {} {}'.format(device_type, device['name']))
-                    # else:
-                    #     try:
-                    #         extension_type = extension_types[device_type]
-                    #         func = getattr(sensor, extension_type['function'])
-                    #         values = self.CallDeviceFunction(func)
-                    #         for pin, value in values.items():
-                    #             cayennemqtt.DataChannel.add(sensors_info, cayennemqtt.DEV_SENSOR, device['name'] + ':' + str(pin), cayennemqtt.VALUE, value, name=display_name)
-                    #     except:
-                    #         exception('Failed to get extension data: {} {}'.format(device_type, device['name']))
+                sensors_info += self.SensorInfo(device)
         info('Sensors info: {}'.format(sensors_info))
         return sensors_info
 
+    def SensorInfo(self, device):
+        """Return a list with the current states of a sensor
+
+        Args:
+            device: Device dict from the device manager
+        """
+        sensors_info = []
+        sensor = instance.deviceInstance(device['name'])
+        sensor_types = {'Temperature': {'function': 'getCelsius', 'data_args': {'type': 'temp', 'unit': 'c'}},
+                        'Humidity': {'function': 'getHumidityPercent', 'data_args': {'type': 'rel_hum', 'unit': 'p'}},
+                        'Pressure': {'function': 'getPascal', 'data_args': {'type': 'bp', 'unit': 'pa'}},
+                        'Luminosity': {'function': 'getLux', 'data_args': {'type': 'lum', 'unit': 'lux'}},
+                        'Distance': {'function': 'getCentimeter', 'data_args': {'type': 'prox', 'unit': 'cm'}},
+                        'ServoMotor': {'function': 'readAngle', 'data_args': {'type': 'analog_actuator'}},
+                        'DigitalSensor': {'function': 'read', 'data_args': {'type': 'digital_sensor', 'unit': 'd'}},
+                        'DigitalActuator': {'function': 'read', 'data_args': {'type': 'digital_actuator', 'unit': 'd'}},
+                        'AnalogSensor': {'function': 'readFloat', 'data_args': {'type': 'analog_sensor'}},
+                        'AnalogActuator': {'function': 'readFloat', 'data_args': {'type': 'analog_actuator'}}}
+        # extension_types = {'ADC': {'function': 'analogReadAllFloat'},
+        #                     'DAC': {'function': 'analogReadAllFloat'},
+        #                     'PWM': {'function': 'pwmWildcard'},
+        #                     'GPIOPort': {'function': 'wildcard'}}
+        for device_type in device['type']:
+            try:
+                display_name = device['description']
+            except:
+                display_name = None
+            if device_type in sensor_types:
+                try:
+                    sensor_type = sensor_types[device_type]
+                    func = getattr(sensor, sensor_type['function'])
+                    if len(device['type']) > 1:
+                        channel = '{}:{}'.format(device['name'], device_type.lower())
+                    else:
+                        channel = device['name']
+                    value = self.CallDeviceFunction(func)
+                    cayennemqtt.DataChannel.add(sensors_info, cayennemqtt.DEV_SENSOR, channel, value=value, name=display_name, **sensor_type['data_args'])
+                    if 'DigitalActuator' == device_type and value in (0, 1):
+                        manager.updateDeviceState(device['name'], value)
+                except:
+                    exception('Failed to get sensor data: {} {}'.format(device_type, device['name']))
+            # else:
+            #     try:
+            #         extension_type = extension_types[device_type]
+            #         func = getattr(sensor, extension_type['function'])
+            #         values = self.CallDeviceFunction(func)
+            #         for pin, value in values.items():
+            #             cayennemqtt.DataChannel.add(sensors_info, cayennemqtt.DEV_SENSOR, device['name'] + ':' + str(pin), cayennemqtt.VALUE, value, name=display_name)
+            #     except:
+            #         exception('Failed to get extension data: {} {}'.format(device_type, device['name']))
+        return sensors_info
+
     def AddSensor(self, name, description, device, args):
         """Add a new sensor/actuator
    
@@ -434,6 +514,50 @@ class SensorsClient():
             bVal = False
         return bVal
 
+    def ApplySensorChanges(self, changes):
+        """Add, edit and remove a group of sensors/actuators, saving the device list once
+
+        Args:
+            changes: List of (action, name, description, device, args) tuples, action is 'add', 'edit' or 'delete'
+
+        Returns:
+            List with True for each change that succeeded, False otherwise
+        """
+        info('ApplySensorChanges: {} changes'.format(len(changes)))
+        results = [False] * len(changes)
+        device_changes = []
+        indexes = []
+        for index, (action, name, description, device, args) in enumerate(changes):
+            if action == 'delete' and self.pluginManager.is_plugin(name):
+                results[index] = self.pluginManager.disable(name)
+                continue
+            if action in ('edit', 'delete'):
+                try:
+                    sensor = instance.deviceInstance(name)
+                    if hasattr(sensor, 'removeCallback'):
+                        sensor.removeCallback()
+                except:
+                    pass
+            json = {'name': name}
+            if action != 'delete':
+                json['device'] = device
+                json['description'] = description or name
+                json['args'] = args or {}
+            device_changes.append((action, json))
+            indexes.append(index)
+        with self.sensorMutex:
+            try:
+                codes = manager.applyDeviceChanges(device_changes)
+                info('Apply device changes returned: {}'.format(codes))
+                for index, code in zip(indexes, codes):
+                    results[index] = code == 200
+            except Exception:
+                exception('Error applying sensor changes')
+            finally:
+                # Restore the callbacks of devices whose changes failed as well as setting those of new devices
+                self.InitCallbacks([json['name'] for action, json in device_changes if instance.deviceInstance(json['name'])])
+        return results
+
     def EnableSensor(self, sensor, enable):
         """Enable a sensor/actuator
 
@@ -489,11 +613,39 @@ class SensorsClient():
             new_state = self.gpio.digitalRead(channel)
             if new_state != old_state:
                 self.OnGpioStateChange(channel, new_state)
+            if result != 'failure':
+                data = []
+                cayennemqtt.DataChannel.add(data, cayennemqtt.SYS_GPIO, channel, cayennemqtt.FUNCTION, result)
+                self.EchoState(data)
+                return result
         elif command in ('value', ''):
-            return self.gpio.digitalWrite(channel, int(value))
+            result = self.gpio.digitalWrite(channel, int(value))
+            if result != -1:
+                data = []
+                cayennemqtt.DataChannel.add(data, cayennemqtt.SYS_GPIO, channel, cayennemqtt.VALUE, int(result))
+                self.EchoState(data)
+            return result
         debug('GPIO command failed')
         return result
 
+    def GpioWriteGroup(self, writes):
+        """Write a group of onboard GPIO values, reading the pins back once all the writes are done
+
+        Args:
+            writes: List of (channel, value) tuples, written in order
+
+        Returns:
+            List containing the new value of each written pin, or 'failure' if the write failed
+        """
+        info('GpioWriteGroup {}'.format(writes))
+        results = [value if value != -1 else 'failure' for value in self.gpio.digitalWriteGroup(writes)]
+        data = []
+        for (channel, value), result in zip(writes, results):
+            if result != 'failure':
+                cayennemqtt.DataChannel.add_unique(data, cayennemqtt.SYS_GPIO, channel, cayennemqtt.VALUE, result)
+        self.EchoState(data)
+        return results
+
     def SensorCommand(self, command, sensorId, channel, value):
         """Execute sensor/actuator command
 
@@ -510,7 +662,10 @@ class SensorsClient():
         info('SensorCommand: {}, sensor {}, channel {}, value {}'.format(command, sensorId, channel, value))
         try:
             if self.pluginManager.is_plugin(sensorId, channel):
-                return self.pluginManager.write_value(sensorId, channel, value)
+                result = self.pluginManager.write_value(sensorId, channel, value)
+                if result:
+                    self.EchoState(self.pluginManager.get_plugin_readings('{}:{}'.format(sensorId, channel)))
+                return result
             commands = {'integer': {'function': 'write', 'value_type': int},
                         'value': {'function': 'write', 'value_type': int},
                         'function': {'function': 'setFunctionString', 'value_type': str},
@@ -536,6 +691,8 @@ class SensorsClient():
                         result = self.CallDeviceFunction(func, value)
                     if 'DigitalActuator' in device['type']:
                         manager.updateDeviceState(sensorId, value)
+                    if result is not False:
+                        self.EchoState(self.SensorInfo(device))
                     return result
                 warn('Command not implemented: {}'.format(command))
                 return result
@@ -1,8 +1,77 @@
+import errno
 import psutil
 import os
+import re
 from glob import glob
+from threading import RLock
 from time import sleep
-from myDevices.utils.logger import exception
+from myDevices.utils.logger import exception, debug
+from myDevices.system.sampler import SystemSampler
+
+
+class ThermalZones(object):
+    """Class caching the thermal zones with their temp files kept open"""
+
+    path = '/sys/class/thermal'
+    mutex = RLock()
+    zones = None
+
+    @classmethod
+    def discover(cls):
+        """Find the thermal zones and open their temp files"""
+        cls.close()
+        zones = []
+        names = set()
+        thermal_dirs = glob(cls.path + '/thermal_zone*')
+        thermal_dirs.sort(key=lambda thermal_dir: int(re.sub(r'\D', '', os.path.basename(thermal_dir)) or 0))
+        for thermal_dir in thermal_dirs:
+            try:
+                with open(thermal_dir + '/type', 'r') as type_file:
+                    name = type_file.read().strip()
+                if name in names:
+                    name = '{}{}'.format(name, os.path.basename(thermal_dir).replace('thermal_zone', ''))
+                names.add(name)
+                zones.append((name, os.open(thermal_dir + '/temp', os.O_RDONLY)))
+            except:
+                pass
+        debug('Thermal zones: {}'.format([name for name, fd in zones]))
+        cls.zones = zones
+
+    @classmethod
+    def close(cls):
+        """Close the open temp files"""
+        if cls.zones:
+            for name, fd in cls.zones:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        cls.zones = None
+
+    @classmethod
+    def read_temps(cls):
+        """Return a list of (zone type, temperature in Celsius) tuples for the zones that could be read
+
+        If a zone's temp file is no longer valid the zones are discovered again on the next read, a zone
+        that fails to return a reading, e.g. a sensor that is not ready, is only skipped for this read."""
+        with cls.mutex:
+            if cls.zones is None:
+                cls.discover()
+            temps = []
+            rediscover = False
+            for name, fd in cls.zones:
+                try:
+                    temps.append((name, int(os.pread(fd, 16, 0)) / 1000.0))
+                except OSError as ex:
+                    if ex.errno in (errno.EBADF, errno.ENODEV, errno.ENOENT):
+                        debug('Thermal zone {} no longer valid: {}'.format(name, ex))
+                        rediscover = True
+                except ValueError:
+                    pass
+            if rediscover or not cls.zones:
+                cls.close()
+            return temps
+
 
 class CpuInfo(object):
     """Class for retrieving CPU info"""
@@ -29,15 +98,19 @@ class CpuInfo(object):
         return usage
     
     @staticmethod
-    def get_cpu_load(interval = 1):
+    def get_cpu_load(interval = None):
         """Return CPU load
 
-        :param interval: time interval in seconds to wait when calculating CPU usage
+        :param interval: time interval in seconds to wait when calculating CPU usage, if None the load
+            since the previous shared sample is returned without waiting
         :returns: dict containing overall CPU load, as a percentage
         """
         cpu_load = {}
         try:
-            cpu_load['cpu'] = psutil.cpu_percent(interval)
+            if interval is None:
+                cpu_load['cpu'] = SystemSampler().Sample()['cpu']
+            else:
+                cpu_load['cpu'] = psutil.cpu_percent(interval)
         except:
             exception('Error getting CPU load info')
         return cpu_load
@@ -45,27 +118,25 @@ class CpuInfo(object):
     @staticmethod
     def get_cpu_temp():
         """Get CPU temperature"""
-        info = {}
-        thermal_dirs = glob('/sys/class/thermal/thermal_zone*')
-        thermal_dirs.sort()
         temp = 0.0
         try:
-            for thermal_dir in thermal_dirs:
-                try:
-                    thermal_type = ''
-                    with open(thermal_dir + '/type', 'r') as type_file:
-                        thermal_type = type_file.read().strip()
-                    if thermal_type != 'gpu_thermal':
-                        with open(thermal_dir + '/temp', 'r') as temp_file:
-                            content = int(temp_file.read().strip())
-                            temp = content / 1000.0
-                            break
-                except:
-                    pass
+            for thermal_type, zone_temp in ThermalZones.read_temps():
+                if thermal_type != 'gpu_thermal':
+                    temp = zone_temp
+                    break
         except Exception:
             exception('Error getting CPU temperature')
         return temp
 
+    @staticmethod
+    def get_thermal_zone_temps():
+        """Get a list of (zone type, temperature) tuples for all thermal zones, e.g. CPU, GPU and PMIC"""
+        try:
+            return ThermalZones.read_temps()
+        except Exception:
+            exception('Error getting thermal zone temperatures')
+        return []
+
     @staticmethod
     def get_load_avg():
         """Get CPU average load for the last one, five, and 10 minute periods"""
@@ -2,112 +2,128 @@
 This module provides constants for the board revision info and pin mapping as well as
 a class for getting hardware info, including manufacturer, model and MAC address.
 """
-import re
-import sys
+from collections import namedtuple
 from myDevices.utils.logger import exception, info, warn, error, debug
+from myDevices.utils.singleton import Singleton
 
 BOARD_REVISION = 0
 CPU_REVISION = "0"
 CPU_HARDWARE = ""
 
+MODELS = {
+    'Beta': 'Raspberry Pi Model B (Beta)',
+    '0002': 'Raspberry Pi Model B', '0003': 'Raspberry Pi Model B', '0004': 'Raspberry Pi Model B', '0005': 'Raspberry Pi Model B',
+    '0006': 'Raspberry Pi Model B', '000d': 'Raspberry Pi Model B', '000e': 'Raspberry Pi Model B', '000f': 'Raspberry Pi Model B',
+    '0007': 'Raspberry Pi Model A', '0008': 'Raspberry Pi Model A', '0009': 'Raspberry Pi Model A',
+    '0010': 'Raspberry Pi Model B +', '0013': 'Raspberry Pi Model B +', '900032': 'Raspberry Pi Model B +',
+    '0011': 'Raspberry Pi Compute Module', '0014': 'Raspberry Pi Compute Module',
+    '0012': 'Raspberry Pi Model A+', '0015': 'Raspberry Pi Model A+',
+    'a01040': 'Raspberry Pi 2 Model B', 'a01041': 'Raspberry Pi 2 Model B', 'a21041': 'Raspberry Pi 2 Model B', 'a22042': 'Raspberry Pi 2 Model B',
+    '900092': 'Raspberry Pi Zero', '900093': 'Raspberry Pi Zero', '920093': 'Raspberry Pi Zero',
+    '9000c1': 'Raspberry Pi Zero W',
+    'a02082': 'Raspberry Pi 3 Model B', 'a22082': 'Raspberry Pi 3 Model B', 'a32082': 'Raspberry Pi 3 Model B',
+    'a020d3': 'Raspberry Pi 3 Model B+',
+    'a020a0': 'Raspberry Pi Compute Module 3',
+}
+
+MANUFACTURERS = {
+    'a01041': 'Sony, UK', '900092': 'Sony, UK', 'a02082': 'Sony, UK', '0012': 'Sony, UK', '0011': 'Sony, UK', '0010': 'Sony, UK',
+    '000e': 'Sony, UK', '0008': 'Sony, UK', '0004': 'Sony, UK', 'a020d3': 'Sony, UK', 'a01040': 'Sony, UK', 'a020a0': 'Sony, UK',
+    'a32082': 'Sony, Japan',
+    '0014': 'Embest, China', '0015': 'Embest, China', 'a21041': 'Embest, China', 'a22082': 'Embest, China', '920093': 'Embest, China',
+    '0005': 'Qisda', '0009': 'Qisda', '000f': 'Qisda',
+    '0006': 'Egoman', '0007': 'Egoman', '000d': 'Egoman',
+}
+
+HardwareInfo = namedtuple('HardwareInfo', 'revision serial model manufacturer')
+
+
+def readCpuInfo():
+    """Return a dict of the fields in /proc/cpuinfo, using the first value of repeated fields"""
+    fields = {}
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                key, separator, value = line.partition(':')
+                if separator:
+                    fields.setdefault(key.strip(), value.strip())
+    except:
+        exception("Error reading cpuinfo")
+    return fields
+
+
+CPU_INFO = readCpuInfo()
 try:
-    with open("/proc/cpuinfo") as f:
-        cpuinfo = f.read()
-        rc = re.compile("Revision\s*:\s(.*)\n")
-        result = rc.search(cpuinfo)
-        if result:
-            CPU_REVISION = result.group(1)
-            if CPU_REVISION.startswith("1000"):
-                CPU_REVISION = CPU_REVISION[-4:]
-            if CPU_REVISION != "0000":
-                cpurev = int(CPU_REVISION, 16)
-                if cpurev < 0x04:
-                    BOARD_REVISION = 1
-                elif cpurev < 0x10:
-                    BOARD_REVISION = 2
-                else:
-                    BOARD_REVISION = 3
-        rc = re.compile("Hardware\s*:\s(.*)\n")
-        result = rc.search(cpuinfo)
-        CPU_HARDWARE = result.group(1)
+    if 'Revision' in CPU_INFO:
+        CPU_REVISION = CPU_INFO['Revision']
+        if CPU_REVISION.startswith("1000"):
+            CPU_REVISION = CPU_REVISION[-4:]
+        if CPU_REVISION != "0000":
+            cpurev = int(CPU_REVISION, 16)
+            if cpurev < 0x04:
+                BOARD_REVISION = 1
+            elif cpurev < 0x10:
+                BOARD_REVISION = 2
+            else:
+                BOARD_REVISION = 3
+    CPU_HARDWARE = CPU_INFO.get('Hardware', CPU_HARDWARE)
 except:
     exception("Error reading cpuinfo")
 
 
-class Hardware:
-    """Class for getting hardware info, including manufacturer, model and MAC address."""
+def readHardwareInfo():
+    """Return a HardwareInfo record with the board revision, serial number, model and manufacturer"""
+    revision = CPU_INFO.get('Revision', '0')
+    serial = CPU_INFO.get('Serial')
+    if serial == len(serial or '') * '0':
+        serial = None
+    model = MODELS.get(revision, 'Unknown')
+    if 'Rockchip' in CPU_HARDWARE:
+        model = 'Tinker Board'
+    manufacturer = MANUFACTURERS.get(revision, 'Element14/Premier Farnell')
+    if revision == '0000':
+        if 'Rockchip' in CPU_HARDWARE:
+            manufacturer = 'ASUS'
+        else:
+            try:
+                with open('/proc/device-tree/model', 'r') as model_file:
+                    for line in model_file:
+                        if 'BeagleBone' in line:
+                            index = line.index('BeagleBone')
+                            manufacturer = line[:index - 1].strip(' \n\t\0')
+                            model = line[index:].strip(' \n\t\0')
+                            break
+            except:
+                exception ("Error reading model")
+    return HardwareInfo(revision, serial, model, manufacturer)
+
+
+class Hardware(Singleton):
+    """Singleton class for getting hardware info, including manufacturer, model and MAC address."""
 
     def __init__(self):
         """Initialize board revision and model info"""
-        self.Revision = '0'
-        self.Serial = None
-        try:
-            with open('/proc/cpuinfo','r') as f:
-                for line in f:
-                    splitLine = line.split(':')
-                    if len(splitLine) < 2:
-                        continue
-                    key = splitLine[0].strip()
-                    value = splitLine[1].strip()
-                    if key == 'Revision':
-                        self.Revision = value
-                    if key == 'Serial' and value != len(value) * '0':
-                        self.Serial = value
-        except:
-            exception ("Error reading cpuinfo")
-        self.model = 'Unknown'
-        if self.Revision == 'Beta':
-            self.model = 'Raspberry Pi Model B (Beta)'
-        if self.Revision in ('000d', '000e', '000f', '0002', '0003', '0004', '0005', '0006'):
-            self.model = 'Raspberry Pi Model B'
-        if self.Revision in ('0007', '0008', '0009'):
-            self.model = 'Raspberry Pi Model A'
-        if self.Revision in ('0010', '0013', '900032'):
-            self.model = 'Raspberry Pi Model B +'
-        if self.Revision in ('0011', '0014'):
-            self.model = 'Raspberry Pi Compute Module'
-        if self.Revision in ('0012', '0015'):
-            self.model = 'Raspberry Pi Model A+'
-        if self.Revision in ('a01040', 'a01041', 'a21041', 'a22042'):
-            self.model = 'Raspberry Pi 2 Model B'
-        if self.Revision in ('900092', '900093', '920093'):
-            self.model = 'Raspberry Pi Zero'
-        if self.Revision in ('9000c1',):
-            self.model = 'Raspberry Pi Zero W'
-        if self.Revision in ('a02082', 'a22082', 'a32082'):
-            self.model = 'Raspberry Pi 3 Model B'            
-        if self.Revision in ('a020d3'):
-            self.model = 'Raspberry Pi 3 Model B+'
-        if self.Revision in ('a020a0'):
-            self.model = 'Raspberry Pi Compute Module 3'
-        if 'Rockchip' in CPU_HARDWARE:
-            self.model = 'Tinker Board'
-        self.manufacturer = 'Element14/Premier Farnell'
-        if self.Revision in ('a01041', '900092', 'a02082', '0012', '0011', '0010', '000e', '0008', '0004', 'a020d3', 'a01040', 'a020a0'):
-            self.manufacturer = 'Sony, UK'
-        if self.Revision in ('a32082'):
-            self.manufacturer = 'Sony, Japan'
-        if self.Revision in ('0014', '0015', 'a21041', 'a22082', '920093'):
-            self.manufacturer = 'Embest, China'
-        if self.Revision in ('0005', '0009', '000f'):
-            self.manufacturer = 'Qisda'
-        if self.Revision in ('0006', '0007', '000d'):
-            self.manufacturer = 'Egoman'
-        if self.Revision == '0000':
-            if 'Rockchip' in CPU_HARDWARE:
-                self.manufacturer = 'ASUS'
-            else:
-                try:
-                    with open('/proc/device-tree/model', 'r') as model_file:
-                        for line in model_file:
-                            if 'BeagleBone' in line:
-                                index = line.index('BeagleBone')
-                                self.manufacturer = line[:index - 1].strip(' \n\t\0')
-                                self.model = line[index:].strip(' \n\t\0')
-                                break
-                except:
-                    exception ("Error reading model")
+        self.info = readHardwareInfo()
 
+    @property
+    def Revision(self):
+        """Board revision string from /proc/cpuinfo"""
+        return self.info.revision
+
+    @property
+    def Serial(self):
+        """Board serial number, or None if it is not set"""
+        return self.info.serial
+
+    @property
+    def model(self):
+        """Model name"""
+        return self.info.model
+
+    @property
+    def manufacturer(self):
+        """Manufacturer name"""
+        return self.info.manufacturer
 
     def getManufacturer(self):
         """Return manufacturer name as string"""
@@ -119,20 +135,15 @@ class Hardware:
 
     def getMac(self):
         """Return MAC address as a string or None if no MAC address is found"""
-        # Import netifaces here to prevent error importing this module in setup.py
-        import netifaces
-        interfaces = ['eth0', 'wlan0']
+        # Import here to prevent error importing netifaces in setup.py
+        from myDevices.system.network import NetworkMonitor
         try:
-            interfaces.append(netifaces.gateways()['default'][netifaces.AF_INET][1])
+            network_info = NetworkMonitor().GetInfo()
+            for interface in ('eth0', 'wlan0', network_info.get('interface')):
+                if interface in network_info['macs']:
+                    return network_info['macs'][interface]
         except:
-            pass
-        for interface in interfaces:
-            try:
-                return netifaces.ifaddresses(interface)[netifaces.AF_LINK][0]['addr']
-            except ValueError:
-                pass
-            except:
-                exception('Error getting MAC address')
+            exception('Error getting MAC address')
         return None
 
     def isRaspberryPi(self):
@@ -0,0 +1,231 @@
+"""
+This module provides a cache of network info that is kept up to date by listening for RTNETLINK
+link, address and route events, so the info only has to be queried when the network changes.
+"""
+import ctypes
+import socket
+import struct
+from fcntl import ioctl
+from threading import Event, RLock, Thread
+from time import time
+from myDevices.utils.logger import debug, exception, info, warn
+from myDevices.utils.singleton import Singleton
+
+# From linux/rtnetlink.h
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+NETLINK_EVENTS = (RTM_NEWLINK, RTM_DELLINK, RTM_NEWADDR, RTM_DELADDR, RTM_NEWROUTE, RTM_DELROUTE)
+NLMSGHDR = struct.Struct('=IHHII')
+
+# From linux/wireless.h, struct iwreq is the interface name followed by a struct iw_param or a struct iw_point
+SIOCGIWRATE = 0x8B21
+SIOCGIWESSID = 0x8B1B
+IW_ESSID_MAX_SIZE = 32
+IWREQ = struct.Struct('=16si4x')
+IWREQ_POINT = struct.Struct('16sPHH')
+IWREQ_SIZE = 32
+
+POLL_INTERVAL = 15 #seconds between refreshes if netlink events are not available
+SETTLE_TIME = 0.5 #seconds without netlink events before a burst is considered finished
+MAX_SETTLE_TIME = 5 #maximum seconds to wait for a burst to finish, so continuous events still cause refreshes
+
+
+def readWireless(path='/proc/net/wireless'):
+    """Return a dict of Wi-Fi interfaces with their link quality, signal level (dBm) and noise level"""
+    wireless = {}
+    try:
+        with open(path, 'r') as wireless_file:
+            for line in wireless_file.readlines()[2:]:
+                interface, values = line.split(':', 1)
+                fields = values.split()
+                wireless[interface.strip()] = {'link': float(fields[1]), 'level': float(fields[2]), 'noise': float(fields[3])}
+    except FileNotFoundError:
+        pass
+    except:
+        exception('Error reading wireless info')
+    return wireless
+
+
+def readBitrate(interface):
+    """Return the Wi-Fi transmit bitrate of interface in bits per second, or None if it is not available"""
+    request = bytearray(IWREQ.pack(interface.encode(), 0))
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as iw_socket:
+            ioctl(iw_socket, SIOCGIWRATE, request)
+    except OSError:
+        return None
+    return IWREQ.unpack(request)[1]
+
+
+def readEssid(interface):
+    """Return the SSID of the network a Wi-Fi interface is connected to, or None if it is not connected"""
+    essid = ctypes.create_string_buffer(IW_ESSID_MAX_SIZE + 1)
+    request = bytearray(IWREQ_SIZE)
+    IWREQ_POINT.pack_into(request, 0, interface.encode(), ctypes.addressof(essid), len(essid), 0)
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as iw_socket:
+            ioctl(iw_socket, SIOCGIWESSID, request)
+    except OSError:
+        return None
+    length = IWREQ_POINT.unpack_from(request)[2]
+    return essid.raw[:min(length, IW_ESSID_MAX_SIZE)].decode(errors='replace') or None
+
+
+def receiveEvents(netlink_socket):
+    """Receive a netlink datagram and return True if it contains link, address or route events"""
+    try:
+        data = netlink_socket.recv(65536)
+    except socket.timeout:
+        return False
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, message_type, flags, sequence, pid = NLMSGHDR.unpack_from(data, offset)
+        if message_type in NETLINK_EVENTS:
+            return True
+        if length < NLMSGHDR.size:
+            break
+        offset += (length + 3) & ~3
+    return False
+
+
+def settle(netlink_socket):
+    """Wait for a burst of netlink events to finish, e.g. a DHCP lease generates several events, so it causes a single refresh"""
+    timeout = netlink_socket.gettimeout()
+    deadline = time() + MAX_SETTLE_TIME
+    try:
+        while time() < deadline:
+            netlink_socket.settimeout(min(SETTLE_TIME, max(0.01, deadline - time())))
+            netlink_socket.recv(65536)
+    except socket.timeout:
+        pass
+    finally:
+        netlink_socket.settimeout(timeout)
+
+
+class NetworkMonitor(Singleton):
+    """Singleton class caching the default interface, IP, MAC addresses and Wi-Fi SSID and signal"""
+
+    def __init__(self):
+        """Read the current network info and start listening for changes"""
+        self.mutex = RLock()
+        self.callbacks = []
+        self.info = {}
+        self.refreshTime = 0
+        self.listening = False
+        self.exiting = Event()
+        self.Refresh()
+        self.Start()
+
+    def Start(self):
+        """Start the netlink listener thread, falling back to polling if netlink is not available"""
+        try:
+            self.socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            self.socket.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+            self.socket.settimeout(1)
+            self.listening = True
+            thread = Thread(target=self.Listen, name='network')
+            thread.daemon = True
+            thread.start()
+        except (AttributeError, OSError) as ex:
+            warn('Netlink not available, polling network info: {}'.format(ex))
+
+    def Stop(self):
+        """Stop the netlink listener thread"""
+        self.exiting.set()
+
+    def AddCallback(self, callback):
+        """Add a function to call with the new network info dict when it changes"""
+        with self.mutex:
+            self.callbacks.append(callback)
+
+    def GetInfo(self):
+        """Return a dict with the cached network info
+
+        Returned dict example::
+
+            {
+                'interface': 'wlan0',
+                'gateway': '192.168.0.1',
+                'ip': '192.168.0.2',
+                'mac': 'b8:27:eb:00:00:01',
+                'macs': {'eth0': 'b8:27:eb:00:00:00', 'wlan0': 'b8:27:eb:00:00:01'},
+                'ssid': 'MyNetwork',
+                'rssi': -52.0
+            }
+        """
+        if not self.listening and time() - self.refreshTime >= POLL_INTERVAL:
+            self.Refresh()
+        network_info = self.info
+        if 'rssi' in network_info:
+            # The signal level changes without netlink events so it is read from /proc/net/wireless each time
+            wireless = readWireless()
+            if network_info['interface'] in wireless:
+                network_info = dict(network_info, rssi=wireless[network_info['interface']]['level'])
+        return network_info
+
+    def Listen(self):
+        """Wait for netlink events and refresh the network info when they occur"""
+        debug('Listening for network changes')
+        while not self.exiting.is_set():
+            try:
+                if receiveEvents(self.socket):
+                    settle(self.socket)
+                    self.Refresh()
+            except socket.timeout:
+                pass
+            except:
+                exception('Error listening for network changes')
+                self.exiting.wait(POLL_INTERVAL)
+        self.socket.close()
+        self.listening = False
+
+    def Refresh(self):
+        """Query the network info and call the callbacks if it has changed"""
+        # Import netifaces here to prevent error importing this module in setup.py
+        import netifaces
+        network_info = {}
+        try:
+            gateway, interface = netifaces.gateways()['default'][netifaces.AF_INET][:2]
+            network_info['interface'] = interface
+            network_info['gateway'] = gateway
+            network_info['ip'] = netifaces.ifaddresses(interface)[netifaces.AF_INET][0]['addr']
+        except (KeyError, IndexError, ValueError):
+            pass
+        except:
+            exception('Error getting network info')
+        macs = {}
+        for interface in netifaces.interfaces():
+            try:
+                macs[interface] = netifaces.ifaddresses(interface)[netifaces.AF_LINK][0]['addr']
+            except (KeyError, IndexError, ValueError):
+                pass
+        network_info['macs'] = macs
+        if 'interface' in network_info:
+            network_info['mac'] = macs.get(network_info['interface'])
+            wireless = readWireless()
+            if network_info['interface'] in wireless:
+                ssid = readEssid(network_info['interface'])
+                if ssid:
+                    network_info['ssid'] = ssid
+                network_info['rssi'] = wireless[network_info['interface']]['level']
+        with self.mutex:
+            self.refreshTime = time()
+            previous = self.info
+            self.info = network_info
+            # The signal level changes constantly, so it does not count as a network change
+            changed = {key: value for key, value in network_info.items() if key != 'rssi'} != {key: value for key, value in previous.items() if key != 'rssi'}
+            callbacks = list(self.callbacks) if previous and changed else []
+        if callbacks:
+            info('Network info changed: {}'.format({key: value for key, value in network_info.items() if key != 'macs'}))
+        for callback in callbacks:
+            try:
+                callback(network_info)
+            except:
+                exception('Network change callback failed')
@@ -0,0 +1,167 @@
+"""
+This module provides a shared sampler for system metrics computed from consecutive /proc reads.
+Percentages are computed from the difference between the current and previous sample, so no
+sampling interval has to be waited for and all consumers share a single read per refresh.
+"""
+from threading import RLock
+from time import time
+from myDevices.utils.logger import exception
+from myDevices.system.network import readBitrate, readWireless
+from myDevices.utils.singleton import Singleton
+
+MAX_AGE = 1.0 #seconds a sample is reused for before it is refreshed
+# Indexes of the /proc/net/dev counters used for the interface metrics
+RX_BYTES, RX_PACKETS, RX_ERRORS, RX_DROPS = 0, 1, 2, 3
+TX_BYTES, TX_PACKETS, TX_ERRORS, TX_DROPS = 8, 9, 10, 11
+
+
+class SystemSampler(Singleton):
+    """Singleton class that samples CPU load, per-core load, iowait and load average"""
+
+    stat_path = '/proc/stat'
+    loadavg_path = '/proc/loadavg'
+
+    def __init__(self):
+        """Initialize the sampler"""
+        self.mutex = RLock()
+        self.sampleTime = 0
+        self.cpuTimes = {}
+        self.metrics = {'cpu': 0.0, 'cores': [], 'iowait': 0.0, 'loadavg': (0.0, 0.0, 0.0)}
+
+    def Sample(self, maxAge=MAX_AGE):
+        """Return the metrics dict, refreshing it first if it is older than maxAge seconds
+
+        Returned dict example::
+
+            {
+                'cpu': 12.8,
+                'cores': [10.1, 15.5, 12.0, 13.6],
+                'iowait': 0.4,
+                'loadavg': (0.52, 0.48, 0.45)
+            }
+        """
+        with self.mutex:
+            if time() - self.sampleTime >= maxAge:
+                self.Refresh()
+            return self.metrics
+
+    def Refresh(self):
+        """Read /proc/stat and /proc/loadavg and update the metrics"""
+        try:
+            with open(self.stat_path, 'r') as stat_file:
+                cpu_times = {}
+                for line in stat_file:
+                    if not line.startswith('cpu'):
+                        break
+                    fields = line.split()
+                    # user, nice, system, idle, iowait, irq, softirq, steal. Guest time is included in user time.
+                    cpu_times[fields[0]] = [int(value) for value in fields[1:9]]
+            loads = {cpu: self.GetLoad(times, self.cpuTimes.get(cpu)) for cpu, times in cpu_times.items()}
+            self.cpuTimes = cpu_times
+            metrics = {}
+            metrics['cpu'], metrics['iowait'] = loads.pop('cpu')
+            # Offline CPUs are not listed in /proc/stat so the core numbers can have gaps
+            metrics['cores'] = [loads[cpu][0] for cpu in sorted(loads, key=lambda cpu: int(cpu[3:]))]
+            with open(self.loadavg_path, 'r') as loadavg_file:
+                metrics['loadavg'] = tuple(float(value) for value in loadavg_file.read().split()[:3])
+            self.metrics = metrics
+        except:
+            exception('Error sampling system metrics')
+        self.sampleTime = time()
+
+    @staticmethod
+    def GetLoad(times, previous_times):
+        """Return the (load, iowait) percentages between two samples of /proc/stat CPU times"""
+        if previous_times:
+            times = [current - previous for current, previous in zip(times, previous_times)]
+        total = sum(times)
+        if total <= 0:
+            return (0.0, 0.0)
+        idle = times[3] + times[4]
+        return (round(100.0 * (total - idle) / total, 1), round(100.0 * times[4] / total, 1))
+
+
+class NetworkSampler(Singleton):
+    """Singleton class that samples per-interface throughput, packet, error and drop counts and Wi-Fi signal"""
+
+    netdev_path = '/proc/net/dev'
+    wireless_path = '/proc/net/wireless'
+
+    def __init__(self):
+        """Initialize the sampler"""
+        self.mutex = RLock()
+        self.sampleTime = 0
+        self.counters = {}
+        self.metrics = {}
+
+    def Sample(self, maxAge=MAX_AGE):
+        """Return a dict of interface metrics, refreshing it first if it is older than maxAge seconds
+
+        Rates are in bytes or packets per second, errors and drops are counts since the previous sample.
+
+        Returned dict example::
+
+            {
+                'wlan0': {
+                    'rxrate': 1520.4,
+                    'txrate': 812.0,
+                    'rxpackets': 12.2,
+                    'txpackets': 9.8,
+                    'errors': 0,
+                    'drops': 0,
+                    'signal': -52.0,
+                    'quality': 58.0,
+                    'bitrate': 72200000
+                }
+            }
+        """
+        with self.mutex:
+            if time() - self.sampleTime >= maxAge:
+                self.Refresh()
+            return self.metrics
+
+    def Refresh(self):
+        """Read /proc/net/dev and /proc/net/wireless and update the metrics"""
+        now = time()
+        try:
+            counters = {}
+            with open(self.netdev_path, 'r') as netdev_file:
+                for line in netdev_file.readlines()[2:]:
+                    interface, values = line.split(':', 1)
+                    interface = interface.strip()
+                    values = [int(value) for value in values.split()]
+                    # Skip loopback and interfaces that have never carried traffic, e.g. unused tunnels
+                    if interface != 'lo' and (values[RX_BYTES] or values[TX_BYTES]):
+                        counters[interface] = values
+            elapsed = now - self.sampleTime
+            wireless = readWireless(self.wireless_path)
+            metrics = {}
+            for interface, values in counters.items():
+                metrics[interface] = self.GetRates(values, self.counters.get(interface), elapsed)
+                if interface in wireless:
+                    metrics[interface]['signal'] = wireless[interface]['level']
+                    metrics[interface]['quality'] = wireless[interface]['link']
+                    bitrate = readBitrate(interface)
+                    if bitrate:
+                        metrics[interface]['bitrate'] = bitrate
+            self.counters = counters
+            self.metrics = metrics
+        except:
+            exception('Error sampling network metrics')
+        self.sampleTime = now
+
+    @staticmethod
+    def GetRates(values, previous_values, elapsed):
+        """Return the rates and counts between two samples of /proc/net/dev interface counters"""
+        if not previous_values or elapsed <= 0 or any(current < previous for current, previous in zip(values, previous_values)):
+            # First sample or the counters were reset, so there is nothing to compare against yet
+            previous_values = values
+            elapsed = 1
+        delta = [current - previous for current, previous in zip(values, previous_values)]
+        rate = lambda index: round(delta[index] / elapsed, 1)
+        return {'rxrate': rate(RX_BYTES),
+                'txrate': rate(TX_BYTES),
+                'rxpackets': rate(RX_PACKETS),
+                'txpackets': rate(TX_PACKETS),
+                'errors': delta[RX_ERRORS] + delta[TX_ERRORS],
+                'drops': delta[RX_DROPS] + delta[TX_DROPS]}
@@ -1,12 +1,19 @@
 """
 This module provides classes for retrieving process and service info, as well as managing processes and services.
 """
+import json
+import os
 from subprocess import Popen, PIPE
 from enum import Enum, unique
-from threading import RLock
-from psutil import Process, process_iter, virtual_memory, cpu_percent
+from threading import RLock, Thread
+from psutil import Process, process_iter, virtual_memory
 from myDevices.utils.logger import exception, info, warn, error, debug
+from myDevices.system.sampler import SystemSampler
 from myDevices.utils.subprocess import executeCommand
+try:
+    import dbus
+except:
+    dbus = None
 
 
 class ProcessInfo:
@@ -18,6 +25,9 @@ class ProcessInfo:
         self.Pid = None
         self.Username = None
         self.Cmdline = None
+        self.CpuPercent = 0.0
+        self.Rss = 0
+        self.Process = None
 
     def Terminate(self):
         """Terminate the process"""
@@ -58,31 +68,53 @@ class ProcessManager:
         self.totalProcessorCount = 0
         self.mutex = RLock()
 
-    def Run(self):
-        """Get running process info"""
+    def Run(self, usage=False):
+        """Update running process info, only reading the details of processes started since the last run
+
+        Args:
+            usage: True to also update the CPU and memory usage of each process
+        """
         debug('')
+        added = []
+        removed = []
         try:
-            running_processes = []
             with self.mutex:
+                running_processes = set()
                 for p in process_iter():
-                    running_processes.append(p.pid)
+                    running_processes.add(p.pid)
                     try:
-                        if p.pid not in self.mapProcesses or self.mapProcesses[p.pid].Name != p.name:
-                            processInfo = ProcessInfo()
-                            processInfo.Pid = p.pid
-                            processInfo.Name = p.name() if callable(p.name) else p.name
-                            processInfo.Username = p.username() if callable(p.username) else p.username
-                            processInfo.Cmdline = p.cmdline() if callable(p.cmdline) else p.cmdline
+                        processInfo = self.mapProcesses.get(p.pid)
+                        # process_iter returns a new Process object if the PID has been reused
+                        new = processInfo is None or processInfo.Process is not p
+                        if not new and not usage:
+                            continue
+                        with p.oneshot():
+                            if new:
+                                processInfo = ProcessInfo()
+                                processInfo.Process = p
+                                processInfo.Pid = p.pid
+                                processInfo.Name = p.name()
+                                processInfo.Username = p.username()
+                                processInfo.Cmdline = p.cmdline()
+                            if usage:
+                                processInfo.CpuPercent = p.cpu_percent(None)
+                                processInfo.Rss = p.memory_info().rss
+                        if new:
                             self.mapProcesses[p.pid] = processInfo
+                            added.append(p.pid)
                     except Exception:
                         pass
-                remove = [key for key in self.mapProcesses.keys() if key not in running_processes]
-                for key in remove:
+                removed = list(self.mapProcesses.keys() - running_processes)
+                for key in removed:
                     del self.mapProcesses[key]
-                debug('ProcessManager::Run retrieved {} processes'.format(len(self.mapProcesses)))
         except:
             exception('ProcessManager::Run failed')
-        debug('ProcessManager::Run retrieved {} processes'.format(len(self.mapProcesses)))
+        debug('ProcessManager::Run retrieved {} processes, {} added, {} removed'.format(len(self.mapProcesses), len(added), len(removed)))
+
+    def GetTopProcesses(self, count):
+        """Return list of the count processes using the most CPU, based on the usage from the last Run(usage=True)"""
+        with self.mutex:
+            return sorted(self.mapProcesses.values(), key=lambda process: (process.CpuPercent, process.Rss), reverse=True)[:count]
 
     def GetProcessList(self):
         """Return list of running processes"""
@@ -131,7 +163,7 @@ class ProcessManager:
             if self.PercentProcessorTime:
                 del self.PercentProcessorTime
                 self.PercentProcessorTime = None
-            self.PercentProcessorTime = cpu_percent()
+            self.PercentProcessorTime = SystemSampler().Sample()['cpu']
             self.totalMemoryCount += 1
             self.totalProcessorCount += 1
             self.AverageProcessorUsage = (self.AverageProcessorUsage * (self.totalProcessorCount - 1) + self.PercentProcessorTime) / self.totalProcessorCount
@@ -150,41 +182,178 @@ class ServiceState(Enum):
     NotRunning = 2
     NotAvailable = 3
 
+SYSTEMD_PATH = '/run/systemd/system'
+SYSTEMD_BUS_NAME = 'org.freedesktop.systemd1'
+SYSTEMD_OBJECT_PATH = '/org/freedesktop/systemd1'
+SYSTEMD_MANAGER = 'org.freedesktop.systemd1.Manager'
+SYSTEMD_UNIT = 'org.freedesktop.systemd1.Unit'
+SERVICE_SUFFIX = '.service'
+UNAVAILABLE_LOAD_STATES = ('not-found', 'masked', 'error', 'bad-setting')
+ACTIVE_STATES = {'active': ServiceState.Running, 'reloading': ServiceState.Running, 'deactivating': ServiceState.Running,
+                 'inactive': ServiceState.NotRunning, 'failed': ServiceState.NotRunning, 'activating': ServiceState.NotRunning}
+
+BACKEND_DBUS = 'dbus'
+BACKEND_SYSTEMCTL = 'systemctl'
+BACKEND_SYSV = 'sysv'
+
 class ServiceManager:
-    """Class for retrieving service info and managing services"""
+    """Class for retrieving service info and managing services
+
+    On systemd the unit states are read in bulk over D-Bus and kept up to date by PropertiesChanged signals.
+    If D-Bus is not available they are read with a single systemctl call, and on SysV systems by parsing the
+    output of service --status-all.
+    """
 
     def __init__(self):
         """Initialize service info"""
         self.Init = True
         self.mapServices = {}
+        self.unitPaths = {}
+        self.backend = None
         self.mutex = RLock()
 
     def Run(self):
         """Get info about services"""
         debug('ServiceManager::Run')
         with self.mutex:
-            (output, returnCode) = executeCommand("service --status-all")
-            servicesList = output.split("\n")
-            service_names = []
-            for line in servicesList:
-                splitLine = line.strip().split(' ')
-                if len(splitLine) == 5:
-                    name = splitLine[4]
-                    status = None
-                    if splitLine[1] == '?':
-                        status = ServiceState.NotAvailable.value
-                    if splitLine[1] == '+':
-                        status = ServiceState.Running.value
-                    if splitLine[1] == '-':
-                        status = ServiceState.NotRunning.value
-                    self.mapServices[name] = status
-                    service_names.append(name)
-            remove = [key for key in self.mapServices.keys() if key not in service_names]
-            for key in remove:
-                del self.mapServices[key]
+            if self.backend is None:
+                self.backend = BACKEND_SYSV
+                if os.path.isdir(SYSTEMD_PATH):
+                    self.backend = BACKEND_DBUS if self.Subscribe() else BACKEND_SYSTEMCTL
+            if self.backend == BACKEND_DBUS:
+                # After the initial read the states are updated by D-Bus signals
+                if self.Init:
+                    self.RunDBus()
+            elif self.backend == BACKEND_SYSTEMCTL:
+                self.RunSystemctl()
+            if self.backend == BACKEND_SYSV:
+                self.RunSysV()
+            self.Init = False
         debug('ServiceManager::Run retrieved ' + str(len(self.mapServices)) + ' services')
+
+    def RunDBus(self):
+        """Get the state of all loaded systemd services over D-Bus"""
+        try:
+            # ListUnits returns (name, description, load state, active state, sub state, followed, path, job id, job type, job path)
+            units = self.manager.ListUnits()
+            self.UpdateServices((str(unit[0]), str(unit[2]), str(unit[3]), str(unit[6])) for unit in units)
+        except:
+            exception('ServiceManager::RunDBus failed, falling back to systemctl')
+            self.backend = BACKEND_SYSTEMCTL
+            self.RunSystemctl()
+
+    def RunSystemctl(self):
+        """Get the state of all loaded systemd services with a single systemctl call"""
+        (output, returnCode) = executeCommand('systemctl list-units --type=service --all --output=json --no-pager')
+        try:
+            units = json.loads(output)
+            self.UpdateServices((unit['unit'], unit['load'], unit['active'], None) for unit in units)
+        except ValueError:
+            # systemctl versions before 246 don't support JSON output
+            warn('ServiceManager::RunSystemctl unable to parse output, falling back to service --status-all')
+            self.backend = BACKEND_SYSV
+
+    def RunSysV(self):
+        """Get the state of all SysV services by parsing the output of service --status-all"""
+        (output, returnCode) = executeCommand("service --status-all")
+        servicesList = output.split("\n")
+        service_names = set()
+        for line in servicesList:
+            splitLine = line.strip().split(' ')
+            if len(splitLine) == 5:
+                name = splitLine[4]
+                status = None
+                if splitLine[1] == '?':
+                    status = ServiceState.NotAvailable.value
+                if splitLine[1] == '+':
+                    status = ServiceState.Running.value
+                if splitLine[1] == '-':
+                    status = ServiceState.NotRunning.value
+                self.mapServices[name] = status
+                service_names.add(name)
+        for key in self.mapServices.keys() - service_names:
+            del self.mapServices[key]
         del output
 
+    def UpdateServices(self, units):
+        """Replace the service states with the states of systemd units
+
+        Args:
+            units: Iterable of (unit name, load state, active state, object path) tuples, the path can be None
+        """
+        services = {}
+        paths = {}
+        for unit, load, active, path in units:
+            if unit.endswith(SERVICE_SUFFIX):
+                name = unit[:-len(SERVICE_SUFFIX)]
+                services[name] = self.GetState(load, active)
+                if path:
+                    paths[path] = name
+        with self.mutex:
+            self.mapServices = services
+            self.unitPaths = paths
+
+    @staticmethod
+    def GetState(load, active):
+        """Return the ServiceState value for systemd unit load and active states"""
+        if load in UNAVAILABLE_LOAD_STATES:
+            return ServiceState.NotAvailable.value
+        return ACTIVE_STATES.get(active, ServiceState.Unknown).value
+
+    def Subscribe(self):
+        """Subscribe to systemd unit signals over D-Bus, return True if successful"""
+        if dbus is None:
+            return False
+        try:
+            from dbus.mainloop.glib import DBusGMainLoop
+            from gi.repository import GLib
+            DBusGMainLoop(set_as_default=True)
+            self.bus = dbus.SystemBus()
+            systemd = self.bus.get_object(SYSTEMD_BUS_NAME, SYSTEMD_OBJECT_PATH)
+            self.manager = dbus.Interface(systemd, SYSTEMD_MANAGER)
+            self.manager.Subscribe()
+            self.bus.add_signal_receiver(self.OnPropertiesChanged, 'PropertiesChanged', dbus.PROPERTIES_IFACE, SYSTEMD_BUS_NAME, path_keyword='path')
+            self.bus.add_signal_receiver(self.OnUnitNew, 'UnitNew', SYSTEMD_MANAGER, SYSTEMD_BUS_NAME)
+            self.bus.add_signal_receiver(self.OnUnitRemoved, 'UnitRemoved', SYSTEMD_MANAGER, SYSTEMD_BUS_NAME)
+            thread = Thread(target=GLib.MainLoop().run, name='systemd')
+            thread.daemon = True
+            thread.start()
+            return True
+        except Exception as ex:
+            warn('systemd D-Bus signals not available, polling services: {}'.format(ex))
+            return False
+
+    def OnPropertiesChanged(self, interface, changed, invalidated, path=None):
+        """Update the service state when the ActiveState of a systemd unit changes"""
+        if interface != SYSTEMD_UNIT or 'ActiveState' not in changed:
+            return
+        with self.mutex:
+            name = self.unitPaths.get(str(path))
+            if name:
+                self.mapServices[name] = ACTIVE_STATES.get(str(changed['ActiveState']), ServiceState.Unknown).value
+                debug('ServiceManager service {} changed to {}'.format(name, changed['ActiveState']))
+
+    def OnUnitNew(self, unit, path):
+        """Add a systemd service that has been loaded"""
+        unit = str(unit)
+        if not unit.endswith(SERVICE_SUFFIX):
+            return
+        try:
+            properties = self.bus.get_object(SYSTEMD_BUS_NAME, path).GetAll(SYSTEMD_UNIT, dbus_interface=dbus.PROPERTIES_IFACE)
+            with self.mutex:
+                name = unit[:-len(SERVICE_SUFFIX)]
+                self.unitPaths[str(path)] = name
+                self.mapServices[name] = self.GetState(str(properties['LoadState']), str(properties['ActiveState']))
+        except:
+            exception('ServiceManager::OnUnitNew failed')
+
+    def OnUnitRemoved(self, unit, path):
+        """Remove a systemd service that has been unloaded"""
+        with self.mutex:
+            name = self.unitPaths.pop(str(path), None)
+            if name:
+                self.mapServices.pop(name, None)
+
     def GetServiceList(self):
         """Return list of services"""
         service_list = []
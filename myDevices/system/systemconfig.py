@@ -1,6 +1,10 @@
 """
 This module provides a class for modifying system configuration settings.
 """
+import ctypes
+import os
+import re
+from threading import RLock
 from time import sleep
 from myDevices.utils.logger import exception, info, warn, error, debug
 from myDevices.utils.subprocess import executeCommand
@@ -8,10 +12,32 @@ from myDevices.utils.threadpool import ThreadPool
 from myDevices.system.hardware import Hardware
 
 CUSTOM_CONFIG_SCRIPT = "/etc/myDevices/scripts/config.sh"
+BOOT_CONFIG = "/boot/config.txt"
+SERIAL_DEVICE = "/dev/serial0"
+
+# Patterns matching the get_* functions in the config script
+I2C_PATTERN = re.compile(r'^(device_tree_param|dtparam)=([^,]*,)*i2c(_arm)?(=(on|true|yes|1))?(,.*)?$', re.MULTILINE)
+SPI_PATTERN = re.compile(r'^(device_tree_param|dtparam)=([^,]*,)*spi(=(on|true|yes|1))?(,.*)?$', re.MULTILINE)
+ONEWIRE_PATTERN = re.compile(r'^dtoverlay=w1-gpio', re.MULTILINE)
+UART_ENABLED_PATTERN = re.compile(r'^enable_uart=1', re.MULTILINE)
+UART_DISABLED_PATTERN = re.compile(r'^enable_uart=0', re.MULTILINE)
+
+# From sys/inotify.h
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
 
 class SystemConfig:
     """Class for modifying configuration settings"""
 
+    path = BOOT_CONFIG
+    mutex = RLock()
+    config = None
+    mtime = None
+    watch = None
+
     @staticmethod
     def ExpandRootfs():
         """Expand the filesystem"""
@@ -37,6 +63,7 @@ class SystemConfig:
             return SystemConfig.ExpandRootfs()
         command = "sudo " + CUSTOM_CONFIG_SCRIPT + " " + str(config_id) + " " + str(parameters)
         (output, returnCode) = executeCommand(command)        
+        SystemConfig.invalidateConfig()
         debug('ExecuteConfigCommand '+ str(config_id) + ' args: ' + str(parameters) + ' retCode: ' + str(returnCode) + ' output: ' + output )
         if "reboot required" in output:
             ThreadPool.Submit(SystemConfig.RestartDevice)
@@ -51,17 +78,83 @@ class SystemConfig:
 
     @staticmethod
     def getConfig():
-        """Return dict containing configuration settings"""
-        config = {}
+        """Return dict containing configuration settings
+
+        The settings are cached until the boot config changes or a config command is executed.
+        """
         if not Hardware().isRaspberryPi():
+            return {}
+        with SystemConfig.mutex:
+            modified = SystemConfig.isModified()
+            if SystemConfig.config is None or modified:
+                SystemConfig.config = SystemConfig.readConfig()
+                debug('SystemConfig: {}'.format(SystemConfig.config))
+            return dict(SystemConfig.config)
+
+    @staticmethod
+    def invalidateConfig():
+        """Clear the cached configuration settings so they are read again on the next getConfig call"""
+        with SystemConfig.mutex:
+            SystemConfig.config = None
+
+    @staticmethod
+    def readConfig():
+        """Read the configuration settings from the boot config, using 1 for enabled and 0 for disabled"""
+        config = {}
+        try:
+            with open(SystemConfig.path, 'r') as config_file:
+                SystemConfig.mtime = os.fstat(config_file.fileno()).st_mtime
+                boot_config = config_file.read()
+        except FileNotFoundError:
+            boot_config = ''
+        except:
+            exception('Get config')
             return config
-        commands = {10: 'DeviceTree', 18: 'Serial', 20: 'OneWire', 21: 'I2C', 22: 'SPI'}
-        for command, name in commands.items():
-            try:
-                (returnCode, output) = SystemConfig.ExecuteConfigCommand(command)
-                if output:
-                    config[name] = 1 - int(output.strip()) #Invert the value since the config script uses 0 for enable and 1 for disable
-            except:
-                exception('Get config')
-        debug('SystemConfig: {}'.format(config))
+        config['DeviceTree'] = 1 #Recent kernels don't allow disabling the device tree
+        config['I2C'] = int(bool(I2C_PATTERN.search(boot_config)))
+        config['SPI'] = int(bool(SPI_PATTERN.search(boot_config)))
+        config['OneWire'] = int(bool(ONEWIRE_PATTERN.search(boot_config)))
+        if UART_ENABLED_PATTERN.search(boot_config):
+            config['Serial'] = 1
+        elif UART_DISABLED_PATTERN.search(boot_config):
+            config['Serial'] = 0
+        else:
+            config['Serial'] = int(os.path.exists(SERIAL_DEVICE))
         return config
+
+    @staticmethod
+    def isModified():
+        """Return True if the boot config has changed since it was last checked
+
+        The boot config directory is watched with inotify since the config script replaces the file
+        rather than writing to it. If inotify is not available the modification time is compared instead.
+        """
+        if SystemConfig.watch is None:
+            SystemConfig.watch = SystemConfig.addWatch(os.path.dirname(SystemConfig.path))
+        if SystemConfig.watch >= 0:
+            modified = False
+            try:
+                while os.read(SystemConfig.watch, 4096):
+                    modified = True
+            except BlockingIOError:
+                pass
+            return modified
+        try:
+            return os.stat(SystemConfig.path).st_mtime != SystemConfig.mtime
+        except OSError:
+            return SystemConfig.mtime is not None
+
+    @staticmethod
+    def addWatch(path):
+        """Return a non-blocking inotify fd watching path for changes, or -1 if inotify is not available"""
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return -1
+            if libc.inotify_add_watch(fd, path.encode(), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE) < 0:
+                os.close(fd)
+                return -1
+            return fd
+        except (AttributeError, OSError):
+            return -1
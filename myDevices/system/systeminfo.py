@@ -3,9 +3,10 @@ This module retrieves information about the system, including CPU, RAM, disk and
 """
 
 import psutil
-import netifaces
 from myDevices.utils.logger import exception
 from myDevices.system.cpu import CpuInfo
+from myDevices.system.network import NetworkMonitor
+from myDevices.system.sampler import NetworkSampler, SystemSampler
 from myDevices.cloud import cayennemqtt
 
 
@@ -20,6 +21,7 @@ class SystemInfo():
             system_info += self.getMemoryInfo((cayennemqtt.USAGE,))
             system_info += self.getDiskInfo((cayennemqtt.USAGE,))
             system_info += self.getNetworkInfo()
+            system_info += self.getInterfaceInfo()
         except:
             exception('Error retrieving system info')
         return system_info
@@ -39,12 +41,19 @@ class SystemInfo():
                 'value': 50.843,
                 'type': 'temp',
                 'unit': 'c'                
+            }, {
+                'channel': 'sys:thermal:gpu_thermal;temp',
+                'value': 50.305,
+                'type': 'temp',
+                'unit': 'c'
             }]
         """
         cpu_info = []
         try:
-            cayennemqtt.DataChannel.add(cpu_info, cayennemqtt.SYS_CPU, suffix=cayennemqtt.LOAD, value=psutil.cpu_percent(1), type='cpuload', unit='p')
+            cayennemqtt.DataChannel.add(cpu_info, cayennemqtt.SYS_CPU, suffix=cayennemqtt.LOAD, value=SystemSampler().Sample()['cpu'], type='cpuload', unit='p')
             cayennemqtt.DataChannel.add(cpu_info, cayennemqtt.SYS_CPU, suffix=cayennemqtt.TEMPERATURE, value=CpuInfo.get_cpu_temp(), type='temp', unit='c')
+            for thermal_type, temp in CpuInfo.get_thermal_zone_temps():
+                cayennemqtt.DataChannel.add(cpu_info, cayennemqtt.SYS_THERMAL, thermal_type, cayennemqtt.TEMPERATURE, temp, type='temp', unit='c')
         except:
             exception('Error getting CPU info')
         return cpu_info
@@ -135,14 +144,55 @@ class SystemInfo():
             [{
                 'channel': 'sys:net;ip',
                 'value': '192.168.0.2'
+            }, {
+                'channel': 'sys:net;ssid',
+                'value': 'MyNetwork'
+            }]
+        """
+        return self.formatNetworkInfo(NetworkMonitor().GetInfo())
+
+    def getInterfaceInfo(self):
+        """Get per-interface throughput, packet, error and drop metrics and Wi-Fi signal as a list formatted for Cayenne MQTT
+
+        Rates are in bytes or packets per second, errors and drops are counts since the previous sample
+        and the Wi-Fi bitrate is in bits per second.
+
+        Returned list example::
+
+            [{
+                'channel': 'sys:net:wlan0;rxrate',
+                'value': 1520.4
+            }, {
+                'channel': 'sys:net:wlan0;errors',
+                'value': 0
+            }, {
+                'channel': 'sys:net:wlan0;signal',
+                'value': -52.0,
+                'type': 'rssi',
+                'unit': 'dbm'
             }]
         """
+        interface_info = []
+        try:
+            for interface, metrics in NetworkSampler().Sample().items():
+                for suffix in (cayennemqtt.RX_RATE, cayennemqtt.TX_RATE, cayennemqtt.RX_PACKETS, cayennemqtt.TX_PACKETS, cayennemqtt.ERRORS, cayennemqtt.DROPS):
+                    cayennemqtt.DataChannel.add(interface_info, cayennemqtt.SYS_NET, interface, suffix, metrics[suffix])
+                if cayennemqtt.SIGNAL in metrics:
+                    cayennemqtt.DataChannel.add(interface_info, cayennemqtt.SYS_NET, interface, cayennemqtt.SIGNAL, metrics[cayennemqtt.SIGNAL], type='rssi', unit='dbm')
+                    cayennemqtt.DataChannel.add(interface_info, cayennemqtt.SYS_NET, interface, cayennemqtt.QUALITY, metrics[cayennemqtt.QUALITY])
+                if cayennemqtt.BITRATE in metrics:
+                    cayennemqtt.DataChannel.add(interface_info, cayennemqtt.SYS_NET, interface, cayennemqtt.BITRATE, metrics[cayennemqtt.BITRATE], unit='bps')
+        except:
+            exception('Error getting interface info')
+        return interface_info
+
+    def formatNetworkInfo(self, info):
+        """Format a NetworkMonitor info dict as a list for Cayenne MQTT"""
         network_info = []
         try:
-            default_interface = netifaces.gateways()['default'][netifaces.AF_INET][1]
-            addresses = netifaces.ifaddresses(default_interface)
-            addr = addresses[netifaces.AF_INET][0]['addr']
-            cayennemqtt.DataChannel.add(network_info, cayennemqtt.SYS_NET, suffix=cayennemqtt.IP, value=addr)
+            cayennemqtt.DataChannel.add(network_info, cayennemqtt.SYS_NET, suffix=cayennemqtt.IP, value=info['ip'])
+            if 'ssid' in info:
+                cayennemqtt.DataChannel.add(network_info, cayennemqtt.SYS_NET, suffix=cayennemqtt.SSID, value=info['ssid'])
         except:
             exception('Error getting network info')
         return network_info
@@ -0,0 +1,105 @@
+import unittest
+from myDevices.utils.logger import setInfo
+from myDevices.devices.analog import ADC
+from myDevices.devices.analog.filter import AnalogFilter, RingBuffer
+from myDevices.devices.analog.helper import AnalogSensor
+from myDevices.devices.instance import DEVICES
+
+
+class TestADC(ADC):
+    def __init__(self):
+        ADC.__init__(self, 4, 10, 3.3)
+        self.reads = 0
+        self.offset = 0
+
+    def __analogRead__(self, channel, diff=False):
+        self.reads += 1
+        return channel * 100 + self.offset
+
+
+class AnalogTest(unittest.TestCase):
+    def setUp(self):
+        self.adc = TestADC()
+
+    def testSampledChannels(self):
+        self.adc.addSampleChannel(1)
+        self.adc.addSampleChannel(3)
+        self.assertEqual(100, self.adc.analogReadSampled(1))
+        self.assertEqual(300, self.adc.analogReadSampled(3))
+        self.assertEqual(2, self.adc.reads)
+        self.adc.analogReadSampled(1, 0)
+        self.assertEqual(4, self.adc.reads)
+        self.assertEqual(200, self.adc.analogReadSampled(2))
+        self.assertEqual(7, self.adc.reads)
+        self.assertEqual({1, 2, 3}, self.adc._analogSampleChannels)
+        self.adc.addSampleChannel(0)
+        self.adc.addSampleChannel(3)
+        self.assertEqual(0, self.adc.analogReadSampled(0))
+        self.assertEqual(11, self.adc.reads)
+
+    def testReadAll(self):
+        self.assertEqual({0: 0, 1: 100, 2: 200, 3: 300}, self.adc.analogReadAll())
+        self.assertEqual({0: 0.0, 1: 0.1, 2: 0.2, 3: 0.29}, self.adc.analogReadAllFloat())
+        self.assertEqual({0: 0.0, 1: 0.32, 2: 0.65, 3: 0.97}, self.adc.analogReadAllVolt())
+
+
+class AnalogFilterTest(unittest.TestCase):
+    def testRingBuffer(self):
+        buffer = RingBuffer(3)
+        for value in range(5):
+            buffer.append(value)
+        self.assertCountEqual([2, 3, 4], buffer.items())
+
+    def testPassThrough(self):
+        analog_filter = AnalogFilter()
+        self.assertEqual([1, 5, 2], [analog_filter.update(value) for value in (1, 5, 2)])
+
+    def testMedian(self):
+        analog_filter = AnalogFilter(median=3)
+        self.assertEqual([1, 5.5, 2, 3, 3], [analog_filter.update(value) for value in (1, 10, 2, 3, 4)])
+
+    def testAverage(self):
+        analog_filter = AnalogFilter(average=2)
+        self.assertEqual([2, 3, 5, 7], [analog_filter.update(value) for value in (2, 4, 6, 8)])
+
+    def testAverageDrift(self):
+        analog_filter = AnalogFilter(average=4)
+        for value in range(10000):
+            analog_filter.update(value * 1e6 + 0.1)
+        self.assertEqual(0.1, [analog_filter.update(0.1) for value in range(4)][-1])
+
+    def testEWMA(self):
+        analog_filter = AnalogFilter(ewma=0.5)
+        self.assertEqual([0, 5, 7.5], [analog_filter.update(value) for value in (0, 10, 10)])
+
+    def testDeadband(self):
+        analog_filter = AnalogFilter(deadband=0.5)
+        self.assertEqual([20, 20, 20, 20.6], [analog_filter.update(value) for value in (20, 20.2, 19.7, 20.6)])
+
+    def testSensorFilter(self):
+        DEVICES['testadc'] = {'device': TestADC()}
+        try:
+            adc = DEVICES['testadc']['device']
+            sensor = AnalogSensor('testadc', 1, average=2)
+            self.assertEqual(100, sensor.read())
+            self.assertEqual(1, adc.reads)
+            self.assertEqual(100, sensor.read())
+            self.assertEqual(1, adc.reads)
+            adc.offset = 200
+            self.assertEqual(100, sensor.read())
+            adc.analogSample(0)
+            self.assertEqual(200, sensor.read())
+            self.assertEqual(200, sensor.read())
+            oversampled = AnalogSensor('testadc', 2, oversample=3)
+            adc.offset = 0
+            adc.reads = 0
+            self.assertEqual(200, oversampled.read())
+            self.assertEqual(4, adc.reads)
+            self.assertEqual({1, 2}, adc._analogSampleChannels)
+        finally:
+            del DEVICES['testadc']
+
+
+if __name__ == '__main__':
+    setInfo()
+    unittest.main()
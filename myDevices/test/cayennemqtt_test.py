@@ -1,7 +1,13 @@
+import os
+import socket
+import ssl
 import unittest
 import warnings
 import myDevices.cloud.cayennemqtt as cayennemqtt
 import paho.mqtt.client as mqtt
+from subprocess import DEVNULL, check_call
+from tempfile import TemporaryDirectory
+from threading import Thread
 from time import sleep
 from json import dumps, loads
 
@@ -67,5 +73,257 @@ class CayenneMQTTTest(unittest.TestCase):
         self.assertEqual(sentMessage, self.receivedMessage['payload'])
 
 
+class ReconnectTest(unittest.TestCase):
+    def testBackoffDelay(self):
+        for attempts in range(1, 20):
+            delay = min(cayennemqtt.RECONNECT_MAX_DELAY, cayennemqtt.RECONNECT_MIN_DELAY * 2 ** (attempts - 1))
+            self.assertGreaterEqual(cayennemqtt.CayenneMQTTClient.get_backoff_delay(attempts), delay / 2)
+            self.assertLessEqual(cayennemqtt.CayenneMQTTClient.get_backoff_delay(attempts), delay)
+
+    def testConnectionFailed(self):
+        states = []
+        mqttClient = cayennemqtt.CayenneMQTTClient()
+        mqttClient.add_state_callback(states.append)
+        # Nothing should be listening on port 1 so the connection is refused
+        mqttClient.begin(TEST_USERNAME, TEST_PASSWORD, TEST_CLIENT_ID, '127.0.0.1', 1)
+        self.assertEqual([cayennemqtt.STATE_CONNECTING, cayennemqtt.STATE_BACKOFF], states)
+        mqttClient.next_attempt = 0
+        mqttClient.loop(0)
+        metrics = mqttClient.get_metrics()
+        self.assertEqual(cayennemqtt.STATE_BACKOFF, metrics['state'])
+        self.assertEqual(2, metrics['failed_attempts'])
+        self.assertEqual(2, metrics['failures'])
+        self.assertIsNone(metrics['reconnect_time'])
+
+
+class BrokerStandIn():
+    """Minimal MQTT broker that acknowledges connects, subscribes and QoS 1 publishes on a local port, optionally over TLS"""
+
+    def __init__(self, tls_context=None):
+        self.tls_context = tls_context
+        self.acknowledge = True
+        self.published = []
+        self.connections = []
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                connection, address = self.server.accept()
+                if self.tls_context:
+                    connection = self.tls_context.wrap_socket(connection, server_side=True)
+            except OSError:
+                return
+            self.connections.append(connection)
+            Thread(target=self.serve, args=(connection,), daemon=True).start()
+
+    def read_packet(self, connection):
+        header = connection.recv(1)
+        if not header:
+            return None, None
+        length, multiplier = 0, 1
+        while True:
+            byte = connection.recv(1)[0]
+            length += (byte & 0x7f) * multiplier
+            multiplier *= 0x80
+            if not byte & 0x80:
+                break
+        data = b''
+        while len(data) < length:
+            data += connection.recv(length - len(data))
+        return header[0] >> 4, data
+
+    def serve(self, connection):
+        try:
+            while True:
+                packet_type, data = self.read_packet(connection)
+                if packet_type is None:
+                    break
+                if packet_type == mqtt.CONNECT >> 4:
+                    connection.sendall(bytes((mqtt.CONNACK, 2, 0, 0)))
+                elif packet_type == mqtt.SUBSCRIBE >> 4:
+                    connection.sendall(bytes((mqtt.SUBACK, 3)) + data[:2] + b'\x00')
+                elif packet_type == mqtt.PUBLISH >> 4:
+                    topic_length = int.from_bytes(data[:2], 'big')
+                    self.published.append(data[2:2 + topic_length].decode())
+                    if self.acknowledge:
+                        connection.sendall(bytes((mqtt.PUBACK, 2)) + data[2 + topic_length:4 + topic_length])
+        except OSError:
+            pass
+        connection.close()
+
+    def drop_connections(self):
+        for connection in self.connections:
+            connection.shutdown(socket.SHUT_RDWR)
+        self.connections = []
+
+    def close(self):
+        self.server.close()
+        self.drop_connections()
+
+
+class TLSSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        cert = os.path.join(self.temp_dir.name, 'cert.pem')
+        key = os.path.join(self.temp_dir.name, 'key.pem')
+        try:
+            check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                        '-addext', 'subjectAltName=DNS:localhost', '-keyout', key, '-out', cert], stdout=DEVNULL, stderr=DEVNULL)
+        except Exception:
+            self.temp_dir.cleanup()
+            self.skipTest('openssl not available')
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_context.load_cert_chain(cert, key)
+        self.broker = BrokerStandIn(server_context)
+        self.tls_context = cayennemqtt.SessionContext()
+        self.tls_context.load_verify_locations(cert)
+
+    def tearDown(self):
+        self.broker.close()
+        self.temp_dir.cleanup()
+
+    def testSessionResumption(self):
+        mqttClient = cayennemqtt.CayenneMQTTClient()
+        mqttClient.begin(TEST_USERNAME, TEST_PASSWORD, TEST_CLIENT_ID, 'localhost', self.broker.port, self.tls_context)
+        mqttClient.loop_start()
+        try:
+            for attempt in range(50):
+                if mqttClient.state == cayennemqtt.STATE_CONNECTED:
+                    break
+                sleep(0.1)
+            self.assertFalse(mqttClient.get_metrics()['session_reused'])
+            self.assertIn('localhost', self.tls_context.sessions)
+            self.broker.drop_connections()
+            mqttClient.next_attempt = 0
+            for attempt in range(50):
+                if mqttClient.get_metrics()['reconnects']:
+                    break
+                sleep(0.1)
+            self.assertEqual(1, mqttClient.get_metrics()['reconnects'])
+            self.assertTrue(mqttClient.get_metrics()['session_reused'])
+        finally:
+            mqttClient.loop_stop()
+
+
+class InFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.released = []
+        self.broker = BrokerStandIn()
+        self.mqttClient = cayennemqtt.CayenneMQTTClient()
+        self.mqttClient.begin(TEST_USERNAME, TEST_PASSWORD, TEST_CLIENT_ID, '127.0.0.1', 1883)
+        # Use the stand-in without TLS, begin() only disables TLS for the default port
+        self.mqttClient.port = self.broker.port
+        self.mqttClient.next_attempt = 0
+        self.mqttClient.loop_start()
+        self.window = cayennemqtt.InFlightWindow(2, 1, lambda mid, delivered: self.released.append(delivered))
+        self.waitFor(lambda: self.mqttClient.state == cayennemqtt.STATE_CONNECTED)
+
+    def tearDown(self):
+        self.mqttClient.loop_stop()
+        self.broker.close()
+
+    def waitFor(self, condition):
+        for attempt in range(50):
+            if condition():
+                return
+            sleep(0.1)
+        self.fail('Timed out')
+
+    def testAcknowledged(self):
+        for i in range(2):
+            self.window.add(self.mqttClient.publish_packet(cayennemqtt.DATA_TOPIC, '[]', 1))
+        self.assertTrue(self.window.is_full())
+        self.waitFor(lambda: self.window.collect() >= 0 and len(self.released) == 2)
+        self.assertEqual([True, True], self.released)
+        self.assertEqual(0, len(self.window))
+
+    def testRetransmitLimit(self):
+        self.broker.acknowledge = False
+        self.window.add(self.mqttClient.publish_packet(cayennemqtt.DATA_TOPIC, '[]', 1), cayennemqtt.DATA_TOPIC, '[]')
+        self.waitFor(lambda: len(self.broker.published) == 1)
+        self.assertEqual([(cayennemqtt.DATA_TOPIC, '[]', 1)], self.window.reset())
+        self.assertEqual(0, len(self.window))
+        self.window.add(self.mqttClient.publish_packet(cayennemqtt.DATA_TOPIC, '[]', 1), cayennemqtt.DATA_TOPIC, '[]', 1)
+        self.assertEqual([], self.window.reset())
+        self.assertEqual([False], self.released)
+
+    def testNoResendOnReconnect(self):
+        self.broker.acknowledge = False
+        self.mqttClient.publish_packet(cayennemqtt.DATA_TOPIC, '[]', 1)
+        self.waitFor(lambda: len(self.broker.published) == 1)
+        self.broker.drop_connections()
+        self.waitFor(lambda: self.mqttClient.state == cayennemqtt.STATE_BACKOFF)
+        self.mqttClient.next_attempt = 0
+        self.waitFor(lambda: self.mqttClient.state == cayennemqtt.STATE_CONNECTED)
+        sleep(0.2)
+        self.assertEqual(1, len(self.broker.published))
+
+
+class BatchCommandTest(unittest.TestCase):
+    def testCommandArray(self):
+        received = []
+        client = cayennemqtt.CayenneMQTTClient()
+        client.root_topic = 'v1/user/things/client'
+        client.on_message = received.append
+        msg = mqtt.MQTTMessage(0, client.get_topic_string(cayennemqtt.COMMAND_JSON_TOPIC).encode())
+        msg.payload = dumps([{'cmdId': '1', 'channel': 'sys:gpio:17;value', 'value': 1},
+                             {'cmdId': '2', 'channel': 'sys:gpio:18;value', 'value': 0}]).encode()
+        client.message_callback(None, None, msg)
+        self.assertEqual([[{'cmdId': '1', 'channel': 'sys:gpio:17', 'suffix': 'value', 'payload': 1},
+                           {'cmdId': '2', 'channel': 'sys:gpio:18', 'suffix': 'value', 'payload': 0}]], received)
+
+
+class SerializerTest(unittest.TestCase):
+    def setUp(self):
+        self.data = []
+        cayennemqtt.DataChannel.add(self.data, cayennemqtt.SYS_GPIO, 2, cayennemqtt.VALUE, 1)
+        cayennemqtt.DataChannel.add(self.data, cayennemqtt.DEV_SENSOR, 'temp', value=20.5, type='temp', unit='c', name='Temperature')
+
+    def testCompact(self):
+        serializer = cayennemqtt.CompactSerializer()
+        self.assertEqual([[0, 1, 'sys:gpio:2;value'], [1, 20.5, 'dev:temp', 'temp', 'c', 'Temperature']], serializer.compact(self.data))
+        self.assertTrue(serializer.requires_ack)
+        self.assertEqual([[0, 1], [1, 20.5]], serializer.compact(self.data))
+        self.assertFalse(serializer.requires_ack)
+        self.data[1]['name'] = 'Room'
+        self.assertEqual([[0, 1], [1, 20.5, 'dev:temp', 'temp', 'c', 'Room']], serializer.compact(self.data))
+        self.assertTrue(serializer.requires_ack)
+        serializer.reset()
+        self.assertEqual([[0, 20.5, 'dev:temp', 'temp', 'c', 'Room']], serializer.compact(self.data[1:]))
+        self.assertEqual([1, 1, 'sys:gpio:2;value'], serializer.compact(self.data)[0])
+
+    def testMessagePack(self):
+        try:
+            import msgpack
+        except ImportError:
+            self.skipTest('msgpack not installed')
+        serializer = cayennemqtt.get_serializer('msgpack')
+        self.assertEqual(cayennemqtt.DATA_MSGPACK_TOPIC, serializer.topic)
+        self.assertEqual([[0, 1, 'sys:gpio:2;value'], [1, 20.5, 'dev:temp', 'temp', 'c', 'Temperature']], msgpack.unpackb(serializer.encode(self.data)))
+
+    def testJSONFragments(self):
+        serializer = cayennemqtt.JSONSerializer()
+        self.assertEqual(dumps(self.data), serializer.encode(self.data))
+        for value in (0, 1, True, 1.0, 1, None, 'caf\u00e9 "on"', float('nan'), [1, 2]):
+            self.data[0]['value'] = value
+            self.assertEqual(dumps(self.data), serializer.encode(self.data))
+        self.data[1]['unit'] = 'f'
+        self.data.append({'channel': 'dev:other', 'value': 1, 'extra': 2})
+        self.assertEqual(dumps(self.data), serializer.encode(self.data))
+        for item in ({'channel': 'dev:keys', 'value': 1, 'name': None}, {'channel': 'dev:keys', 'value': 1, 'type': None},
+                     {'channel': 'dev:keys', 'type': None, 'value': 1}, {'channel': 'dev:keys', 'value': 1, 'foo': None}):
+            self.assertEqual(dumps([item]), serializer.encode([item]))
+
+    def testDefault(self):
+        serializer = cayennemqtt.get_serializer('unknown')
+        self.assertEqual(cayennemqtt.DATA_TOPIC, serializer.topic)
+        self.assertEqual(self.data, loads(serializer.encode(self.data)))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from myDevices.utils.logger import setInfo
+from myDevices.cloud import cayennemqtt
+from myDevices.cloud.client import CloudServerClient
+from myDevices.cloud.outboundqueue import OutboundQueue
+
+
+class StubSensorsClient():
+    def __init__(self):
+        self.calls = []
+        self.values = {}
+
+    def GpioCommand(self, command, channel, value):
+        self.calls.append((command, channel, value))
+        if command == 'function' and value not in ('in', 'out'):
+            return 'failure'
+        return value
+
+    def GpioWriteGroup(self, writes):
+        self.calls.append(('group', writes))
+        if any(channel == 99 for channel, value in writes):
+            raise OSError('write failed')
+        return ['failure' if channel == 98 else value for channel, value in writes]
+
+    def StopMonitoring(self):
+        pass
+
+
+class ExecuteBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.client = CloudServerClient('localhost', 1883, 'localhost')
+        self.client.sensorsClient = StubSensorsClient()
+        self.client.writeQueue = OutboundQueue(self.client.config)
+
+    def sent(self):
+        packets = []
+        while not self.client.writeQueue.empty():
+            packets.append(self.client.writeQueue.get(False))
+        return packets
+
+    def command(self, cmdId, pin, suffix, payload):
+        return {'cmdId': cmdId, 'channel': '{}:{}'.format(cayennemqtt.SYS_GPIO, pin), 'suffix': suffix, 'payload': payload}
+
+    def testOrder(self):
+        self.client.ExecuteBatch([self.command('1', 17, 'function', 'out'), self.command('2', 17, 'value', 1),
+                                  self.command('3', 18, 'value', 1), self.command('4', 17, 'function', 'in'),
+                                  self.command('5', 17, 'value', 0)])
+        self.assertEqual([('function', 17, 'out'), ('group', [(17, 1), (18, 1)]), ('function', 17, 'in'), ('group', [(17, 0)])],
+                         self.client.sensorsClient.calls)
+        self.assertEqual([(cayennemqtt.COMMAND_JSON_RESPONSE_TOPIC, ['ok,1', 'ok,2', 'ok,3', 'ok,4', 'ok,5'])], self.sent())
+
+    def testFailedCommands(self):
+        self.client.ExecuteBatch([self.command('1', 99, 'value', 1), self.command('2', 17, 'function', 'bad'),
+                                  self.command('3', 98, 'value', 1), self.command('4', 17, 'value', 1),
+                                  self.command('5', 'x', 'value', 1)])
+        self.assertEqual([('function', 17, 'bad'), ('group', [(99, 1), (98, 1), (17, 1)])], self.client.sensorsClient.calls)
+        self.assertEqual([(cayennemqtt.COMMAND_JSON_RESPONSE_TOPIC, ['error,2=GPIO command failed', "error,5=ValueError: invalid literal for int() with base 10: 'x'",
+                                                                     'error,1=OSError: write failed', 'error,3=OSError: write failed', 'error,4=OSError: write failed'])],
+                         self.sent())
+        self.client.ExecuteBatch([self.command('6', 98, 'value', 1), self.command('7', 17, 'value', 1)])
+        self.assertEqual([(cayennemqtt.COMMAND_JSON_RESPONSE_TOPIC, ['error,6=GPIO command failed', 'ok,7'])], self.sent())
+
+
+if __name__ == '__main__':
+    setInfo()
+    unittest.main()
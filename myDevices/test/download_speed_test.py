@@ -0,0 +1,58 @@
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+from time import sleep
+from myDevices.utils.logger import setInfo
+from myDevices.cloud.download_speed import measureDownload
+
+FILE_SIZE = 4*1024*1024
+CHUNK_SIZE = 16*1024
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """Serves FILE_SIZE bytes at a steady rate, ignoring range requests"""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(FILE_SIZE))
+        self.end_headers()
+        chunk = bytes(CHUNK_SIZE)
+        try:
+            for i in range(FILE_SIZE // CHUNK_SIZE):
+                self.wfile.write(chunk)
+                sleep(0.005)
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadSpeedTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FileHandler)
+        self.url = 'http://127.0.0.1:{}/test'.format(self.server.server_port)
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def testSizeCap(self):
+        result = measureDownload(self.url, maxBytes=100*1024)
+        self.assertEqual(100*1024, result['bytes'])
+        self.assertGreater(result['speed'], 0)
+        self.assertGreaterEqual(result['ttfb'], 0)
+
+    def testConvergence(self):
+        result = measureDownload(self.url, interval=0.05, tolerance=0.5)
+        self.assertTrue(result['converged'])
+        self.assertLess(result['bytes'], FILE_SIZE)
+        self.assertGreater(result['speed'], 0)
+
+
+if __name__ == '__main__':
+    setInfo()
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from tempfile import NamedTemporaryFile
+from threading import Thread
+from time import sleep
+from myDevices.utils.logger import setInfo
+from myDevices.devices.i2c import I2CAdapter, PRIORITY_READ, PRIORITY_WRITE
+
+
+class I2CAdapterTest(unittest.TestCase):
+    def setUp(self):
+        self.file = NamedTemporaryFile()
+        self.adapter = I2CAdapter(self.file.name)
+
+    def tearDown(self):
+        self.adapter.close()
+        self.file.close()
+
+    def testPriority(self):
+        order = []
+        def transaction(name, priority):
+            self.adapter.acquire(priority)
+            order.append(name)
+            self.adapter.release()
+        self.adapter.acquire()
+        threads = [Thread(target=transaction, args=('read', PRIORITY_READ)), Thread(target=transaction, args=('write', PRIORITY_WRITE))]
+        for thread in threads:
+            thread.start()
+            sleep(0.1)
+        self.adapter.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['write', 'read'], order)
+
+    def testStats(self):
+        self.adapter.acquire(PRIORITY_WRITE)
+        self.adapter.acquire(PRIORITY_READ)
+        self.adapter.release()
+        self.adapter.release(True)
+        stats = self.adapter.getStats()
+        self.assertEqual(1, stats['transactions'])
+        self.assertEqual(1, stats['errors'])
+        self.assertEqual(0, stats['queued'])
+        self.assertGreaterEqual(stats['utilization'], 0)
+
+
+if __name__ == '__main__':
+    setInfo()
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import types
+import unittest
+from tempfile import TemporaryDirectory
+from json import loads
+from myDevices.utils.logger import setInfo
+from myDevices.devices import manager
+from myDevices.devices.i2c import I2C
+from myDevices.devices.instance import DEVICES
+
+
+class I2CDevice(I2C):
+    def __init__(self, slave):
+        self.slave = slave
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def __family__(self):
+        return 'I2CDevice'
+
+
+class HelperDevice():
+    def __init__(self, device):
+        # Helpers look up the device they use when they are created
+        self.device = DEVICES[device]['device']
+
+    def __family__(self):
+        return 'HelperDevice'
+
+
+class ManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.json_file = manager.DEVICES_JSON_FILE
+        manager.DEVICES_JSON_FILE = os.path.join(self.tempdir.name, 'devices.json')
+        self.package = types.SimpleNamespace(I2CDevice=I2CDevice, HelperDevice=HelperDevice)
+        manager.PACKAGES.append(self.package)
+
+    def tearDown(self):
+        manager.PACKAGES.remove(self.package)
+        for name in ('bus', 'bus2', 'helper'):
+            manager.removeDevice(name, False)
+        manager.DEVICES_JSON_FILE = self.json_file
+        self.tempdir.cleanup()
+
+    def testDeviceBus(self):
+        self.assertIs(I2C, manager.getDeviceBus(I2CDevice))
+        self.assertIsNone(manager.getDeviceBus(HelperDevice))
+
+    def testApplyDeviceChanges(self):
+        changes = [('add', {'name': 'helper', 'device': 'HelperDevice', 'args': {'device': 'bus'}}),
+                   ('add', {'name': 'bus', 'device': 'I2CDevice', 'args': {'slave': 0x20}}),
+                   ('add', {'name': 'bus2', 'device': 'I2CDevice', 'args': {'slave': 0x21}}),
+                   ('add', {'name': 'bus', 'device': 'I2CDevice', 'args': {'slave': 0x22}}),
+                   ('add', {'name': 'other', 'device': 'UnknownDevice'}),
+                   ('delete', {'name': 'missing'})]
+        self.assertEqual([200, 200, 200, 409, 500, 404], manager.applyDeviceChanges(changes))
+        self.assertIs(DEVICES['bus']['device'], DEVICES['helper']['device'].device)
+        with open(manager.DEVICES_JSON_FILE) as json_file:
+            self.assertEqual(['bus', 'bus2', 'helper'], [device['name'] for device in loads(json_file.read())])
+        changes = [('edit', {'name': 'bus2', 'device': 'I2CDevice', 'args': {'slave': 0x23}}),
+                   ('delete', {'name': 'helper'})]
+        self.assertEqual([200, 200], manager.applyDeviceChanges(changes))
+        self.assertEqual(0x23, DEVICES['bus2']['device'].slave)
+        self.assertNotIn('helper', DEVICES)
+
+    def testFailedEdit(self):
+        self.assertEqual([200], manager.applyDeviceChanges([('add', {'name': 'bus', 'device': 'I2CDevice', 'args': {'slave': 0x20}})]))
+        device = DEVICES['bus']['device']
+        changes = [('edit', {'name': 'bus', 'device': 'UnknownDevice'}),
+                   ('edit', {'name': 'missing', 'device': 'I2CDevice', 'args': {'slave': 0x21}})]
+        self.assertEqual([500, 404], manager.applyDeviceChanges(changes))
+        self.assertIs(device, DEVICES['bus']['device'])
+        changes = [('edit', {'name': 'bus', 'device': 'I2CDevice', 'args': {'address': 0x21}}),
+                   ('add', {'name': 'bus2', 'device': 'I2CDevice', 'args': {'slave': 0x22}})]
+        self.assertEqual([500, 200], manager.applyDeviceChanges(changes))
+        self.assertIs(device, DEVICES['bus']['device'])
+        self.assertFalse(device.closed)
+        with open(manager.DEVICES_JSON_FILE) as json_file:
+            self.assertEqual([{'slave': 0x20}, {'slave': 0x22}], [device['args'] for device in loads(json_file.read())])
+        changes = [('delete', {'name': 'bus'}), ('add', {'name': 'bus', 'device': 'I2CDevice', 'args': {'slave': 0x23}})]
+        self.assertEqual([200, 200], manager.applyDeviceChanges(changes))
+        self.assertTrue(device.closed)
+        self.assertEqual(0x23, DEVICES['bus']['device'].slave)
+
+
+if __name__ == '__main__':
+    setInfo()
+    unittest.main()
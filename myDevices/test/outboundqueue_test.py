@@ -0,0 +1,74 @@
+import unittest
+from queue import Empty
+from threading import Thread
+from myDevices.utils.logger import setInfo
+from myDevices.cloud.outboundqueue import OutboundQueue, Lane, LANE_RESPONSE, LANE_EVENT, LANE_SYSTEM, LANE_BULK, DROP_NEWEST
+
+
+class OutboundQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.queue = OutboundQueue(lanes=(Lane(LANE_RESPONSE, strict=True), Lane(LANE_EVENT, weight=3), Lane(LANE_BULK, weight=1, max_depth=2)))
+
+    def testStrictPriority(self):
+        self.queue.put('bulk', LANE_BULK)
+        self.queue.put('event', LANE_EVENT)
+        self.queue.put('response', LANE_RESPONSE)
+        self.assertEqual('response', self.queue.get(False))
+
+    def testWeightedSharing(self):
+        for i in range(8):
+            self.queue.put(LANE_EVENT, LANE_EVENT)
+        self.queue.put(LANE_BULK, LANE_BULK)
+        self.queue.put(LANE_BULK, LANE_BULK)
+        sent = [self.queue.get(False) for i in range(8)]
+        self.assertEqual(6, sent.count(LANE_EVENT))
+        self.assertEqual(2, sent.count(LANE_BULK))
+        self.assertEqual(LANE_EVENT, sent[0])
+        self.assertEqual([LANE_EVENT, LANE_EVENT], [self.queue.get(False), self.queue.get(False)])
+        self.assertRaises(Empty, self.queue.get, False)
+        self.assertRaises(Empty, self.queue.get, True, 0.01)
+
+    def testDepthLimit(self):
+        for i in range(3):
+            self.queue.put(i, LANE_BULK)
+        self.assertEqual([1, 2], [self.queue.get(False), self.queue.get(False)])
+        self.queue.lanes[LANE_BULK].drop = DROP_NEWEST
+        for i in range(3):
+            self.queue.put(i, LANE_BULK)
+        self.assertEqual([0, 1], [self.queue.get(False), self.queue.get(False)])
+        metrics = self.queue.GetMetrics()[LANE_BULK]
+        self.assertEqual(2, metrics['dropped'])
+        self.assertEqual(4, metrics['sent'])
+        self.assertEqual(0, metrics['depth'])
+        self.assertEqual(0, self.queue.GetMetrics()[LANE_BULK]['sent'])
+
+    def testJoin(self):
+        for i in range(3):
+            self.queue.put(i, LANE_BULK)
+        self.queue.get(False)
+        self.assertFalse(self.queue.join(0.01))
+        thread = Thread(target=self.queue.join)
+        thread.start()
+        self.queue.task_done()
+        self.queue.get(False)
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        self.queue.task_done()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(self.queue.join(0))
+        self.assertRaises(ValueError, self.queue.task_done)
+
+    def testUpdate(self):
+        self.queue.put([1, 2, 3], LANE_BULK)
+        self.queue.update(lambda packet: [value for value in packet if value != 2], (LANE_BULK,))
+        self.assertEqual([1, 3], self.queue.get(False))
+
+    def testUnknownLane(self):
+        self.queue.put('packet', LANE_SYSTEM)
+        self.assertEqual(1, len(self.queue.lanes[LANE_BULK].packets))
+
+
+if __name__ == '__main__':
+    setInfo()
+    unittest.main()
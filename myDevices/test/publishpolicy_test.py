@@ -0,0 +1,51 @@
+import unittest
+from myDevices.utils.logger import setInfo
+from myDevices.sensors.publishpolicy import PublishPolicy, ChannelPolicy
+
+
+class PublishPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = PublishPolicy()
+        self.policy.SetPolicy('dev:temp', ChannelPolicy(deadband=0.5, heartbeat=60))
+        self.policy.SetPolicy('dev:load', ChannelPolicy(deadband=10, percent=True, min_interval=30, heartbeat=300))
+
+    def publish(self, channel, value, now):
+        return [item['value'] for item in self.policy.Filter([{'channel': channel, 'value': value}], now)]
+
+    def testDeadband(self):
+        self.assertEqual([20.0], self.publish('dev:temp', 20.0, 0))
+        self.assertEqual([], self.publish('dev:temp', 20.4, 15))
+        self.assertEqual([20.6], self.publish('dev:temp', 20.6, 30))
+        counters = self.policy.GetCounters()['dev:temp']
+        self.assertEqual(2, counters['sent'])
+        self.assertEqual(1, counters['suppressed'])
+
+    def testHeartbeat(self):
+        self.assertEqual([20.0], self.publish('dev:temp', 20.0, 0))
+        self.assertEqual([], self.publish('dev:temp', 20.0, 45))
+        self.assertEqual([20.0], self.publish('dev:temp', 20.0, 60))
+
+    def testPercentAndMinInterval(self):
+        self.assertEqual([100], self.publish('dev:load', 100, 0))
+        self.assertEqual([], self.publish('dev:load', 150, 15))
+        self.assertEqual([150], self.publish('dev:load', 150, 30))
+        self.assertEqual([], self.publish('dev:load', 160, 60))
+
+    def testMarkSent(self):
+        self.assertEqual([20.0], self.publish('dev:temp', 20.0, 0))
+        self.policy.MarkSent([{'channel': 'dev:temp', 'value': 25.0}], 10)
+        self.assertEqual([], self.publish('dev:temp', 25.0, 15))
+        self.assertEqual([25.0], self.publish('dev:temp', 25.0, 70))
+
+    def testDefaultPolicy(self):
+        self.assertEqual(['on'], self.publish('sys:gpio:2;function', 'on', 0))
+        self.assertEqual(['off'], self.publish('sys:gpio:2;function', 'off', 15))
+        self.assertIs(self.policy.default, self.policy.GetPolicy('dev:other'))
+        self.assertEqual(0.5, self.policy.GetPolicy('dev:temp:2').deadband)
+        self.assertEqual(0.5, self.policy.GetPolicy('dev:temp;c').deadband)
+        self.assertIs(self.policy.default, self.policy.GetPolicy('dev:temp2'))
+
+
+if __name__ == '__main__':
+    setInfo()
+    unittest.main()
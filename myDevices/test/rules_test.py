@@ -0,0 +1,60 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from myDevices.utils.logger import setInfo
+from myDevices.cloud.rules import RulesEngine
+
+
+class TestClient():
+    def __init__(self):
+        self.actions_ran = []
+
+    def RunAction(self, action):
+        self.actions_ran.append(action)
+        return True
+
+
+class RulesEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, 'agent.db')
+        self.client = TestClient()
+        self.engine = RulesEngine(self.client, self.path)
+        self.action = {'channel': 'sys:gpio:17;value', 'value': 1}
+        self.rule = {'id': 'fan-on',
+                     'conditions': [{'channel': 'dev:temp', 'operator': '>', 'value': 30}, {'channel': 'sys:gpio:4;value', 'operator': '==', 'value': 1}],
+                     'actions': [self.action]}
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def evaluate(self, temp=None, gpio=None):
+        data = []
+        if temp is not None:
+            data.append({'channel': 'dev:temp', 'value': temp, 'type': 'temp', 'unit': 'c'})
+        if gpio is not None:
+            data.append({'channel': 'sys:gpio:4;value', 'value': gpio})
+        return self.engine.evaluate(data)
+
+    def testFireOnce(self):
+        self.assertTrue(self.engine.add_rule(self.rule))
+        self.assertEqual(0, self.evaluate(temp=31))
+        self.assertEqual(1, self.evaluate(gpio=1))
+        self.assertEqual(0, self.evaluate(temp=32, gpio=1))
+        self.assertEqual(0, self.evaluate(temp=29))
+        self.assertEqual(1, self.evaluate(temp='30.5'))
+        self.assertEqual([self.action, self.action], self.client.actions_ran)
+
+    def testPersistence(self):
+        self.assertTrue(self.engine.add_rule(self.rule))
+        self.assertFalse(self.engine.add_rule({'id': 'invalid', 'conditions': [{'channel': 'dev:temp', 'operator': '~', 'value': 1}], 'actions': [self.action]}))
+        engine = RulesEngine(self.client, self.path)
+        self.assertEqual([self.rule], engine.get_rules())
+        self.assertTrue(engine.remove_rule({'id': 'fan-on'}))
+        self.assertFalse(engine.update_rule(self.rule))
+        self.assertEqual([], RulesEngine(self.client, self.path).get_rules())
+
+
+if __name__ == '__main__':
+    setInfo()
+    unittest.main()
@@ -23,7 +23,7 @@ class SensorsClientTest(unittest.TestCase):
         cls.client.StopMonitoring()
         del cls.client
 
-    def OnDataChanged(self, sensor_data):
+    def OnDataChanged(self, sensor_data, lane=None):
         # if len(sensor_data) < 5:
         #     info('OnDataChanged: {}'.format(sensor_data))
         # else:
@@ -145,6 +145,22 @@ class SensorsClientTest(unittest.TestCase):
         for sensor in sensors.values():
             self.assertTrue(SensorsClientTest.client.RemoveSensor(sensor['name']))
 
+    def testApplySensorChanges(self):
+        debug('testApplySensorChanges')
+        channel = GPIO().pins[8]
+        args = {'gpio': 'GPIO', 'invert': False, 'channel': channel}
+        changes = [('add', 'testdevice', 'Digital Input', 'DigitalSensor', args)]
+        self.assertEqual([True], SensorsClientTest.client.ApplySensorChanges(changes))
+        self.assertIn(channel, SensorsClientTest.client.gpio.callbacks)
+        changes = [('edit', 'testdevice', 'Digital Input', 'UnknownSensor', args), ('delete', 'missing', None, None, None)]
+        self.assertEqual([False, False], SensorsClientTest.client.ApplySensorChanges(changes))
+        self.assertIn(channel, SensorsClientTest.client.gpio.callbacks)
+        self.assertEqual(args, next(obj for obj in manager.getDeviceList() if obj['name'] == 'testdevice')['args'])
+        changes = [('delete', 'testdevice', None, None, None)]
+        self.assertEqual([True], SensorsClientTest.client.ApplySensorChanges(changes))
+        self.assertNotIn(channel, SensorsClientTest.client.gpio.callbacks)
+        self.assertNotIn('testdevice', [device['name'] for device in manager.getDeviceList()])
+
     def setSensorValue(self, sensor, value):
         SensorsClientTest.client.SensorCommand('integer', sensor['name'], None, value)
         channel = 'dev:{}'.format(sensor['name'])
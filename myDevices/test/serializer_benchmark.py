@@ -0,0 +1,65 @@
+"""
+Benchmark of the size and encoding CPU cost of data packets for each serializer.
+
+The packet is a typical 100 channel snapshot: the value and function of 40 GPIO pins, 12 sensors with
+type, unit and name, and CPU and network system channels. For each encoding it reports the size of the
+first packet on a connection, which announces the channels for the compact encodings, the size of the
+following packets and the median time to encode a packet. Encodings whose package is not installed are
+skipped.
+
+    python3 -m myDevices.test.serializer_benchmark --packets 2000
+"""
+import random
+import time
+from argparse import ArgumentParser
+from statistics import median
+
+import myDevices.cloud.cayennemqtt as cayennemqtt
+
+
+def packet():
+    """Return a 100 channel data packet with random values"""
+    data = []
+    for pin in range(40):
+        cayennemqtt.DataChannel.add(data, cayennemqtt.SYS_GPIO, pin, cayennemqtt.VALUE, random.randint(0, 1))
+        cayennemqtt.DataChannel.add(data, cayennemqtt.SYS_GPIO, pin, cayennemqtt.FUNCTION, random.choice(('in', 'out')))
+    for sensor in range(12):
+        cayennemqtt.DataChannel.add(data, cayennemqtt.DEV_SENSOR, 'sensor{}'.format(sensor), value=round(random.uniform(0, 100), 2),
+                                    type='temp', unit='c', name='Temperature {}'.format(sensor))
+    cayennemqtt.DataChannel.add(data, cayennemqtt.SYS_CPU, suffix=cayennemqtt.LOAD, value=round(random.uniform(0, 100), 1), type='cpuload', unit='p')
+    cayennemqtt.DataChannel.add(data, cayennemqtt.SYS_CPU, suffix=cayennemqtt.TEMPERATURE, value=round(random.uniform(40, 60), 1), type='temp', unit='c')
+    for suffix in (cayennemqtt.RX_RATE, cayennemqtt.TX_RATE, cayennemqtt.RX_PACKETS, cayennemqtt.TX_PACKETS, cayennemqtt.ERRORS, cayennemqtt.DROPS):
+        cayennemqtt.DataChannel.add(data, cayennemqtt.SYS_NET, 'wlan0', suffix, round(random.uniform(0, 2000), 1))
+    return data
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark data packet serializers')
+    parser.add_argument('--packets', type=int, default=2000, help='number of packets to encode per encoding')
+    args = parser.parse_args()
+    packets = [packet() for i in range(50)]
+    serializers = {}
+    for name, serializer_class in cayennemqtt.SERIALIZERS.items():
+        try:
+            serializers[name] = serializer_class()
+        except ImportError:
+            print('{} not installed, skipped'.format(name))
+    sizes = {}
+    for name, serializer in serializers.items():
+        first = len(serializer.encode(packets[0]))
+        sizes[name] = (first, median(len(serializer.encode(data)) for data in packets[1:]))
+    # Encodings are interleaved so load changes affect them equally
+    times = {name: [] for name in serializers}
+    for i in range(args.packets):
+        data = packets[i % len(packets)]
+        for name, serializer in serializers.items():
+            start = time.perf_counter()
+            serializer.encode(data)
+            times[name].append(time.perf_counter() - start)
+    print('{} channel packets, median of {} encodes'.format(len(packets[0]), args.packets))
+    for name, (first, following) in sizes.items():
+        print('  {:<8} first {:5d} B  following {:5.0f} B  {:6.1f} us/encode'.format(name, first, following, median(times[name]) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import os
+import unittest
+from subprocess import Popen
+from time import sleep
+from myDevices.utils.logger import setInfo
+from myDevices.system.services import ProcessManager, ServiceManager, ServiceState
+
+
+class ProcessManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.processManager = ProcessManager()
+
+    def testProcessChanges(self):
+        self.processManager.Run()
+        processInfo = self.processManager.mapProcesses[os.getpid()]
+        process = Popen(['sleep', '30'])
+        try:
+            self.processManager.Run()
+            self.assertEqual('sleep', self.processManager.mapProcesses[process.pid].Name)
+            self.assertIs(processInfo, self.processManager.mapProcesses[processInfo.Pid])
+        finally:
+            process.kill()
+            process.wait()
+        self.processManager.Run()
+        self.assertNotIn(process.pid, self.processManager.mapProcesses)
+
+    def testTopProcesses(self):
+        self.processManager.Run(usage=True)
+        sleep(0.1)
+        self.processManager.Run(usage=True)
+        top = self.processManager.GetTopProcesses(3)
+        self.assertLessEqual(len(top), 3)
+        self.assertEqual(sorted(top, key=lambda process: process.CpuPercent, reverse=True), top)
+        for process in top:
+            self.assertGreaterEqual(process.Rss, 0)
+
+
+class ServiceManagerTest(unittest.TestCase):
+    def testUpdateServices(self):
+        serviceManager = ServiceManager()
+        serviceManager.UpdateServices([('ssh.service', 'loaded', 'active', '/org/freedesktop/systemd1/unit/ssh_2eservice'),
+                                       ('cron.service', 'loaded', 'failed', None),
+                                       ('bluetooth.service', 'masked', 'inactive', None),
+                                       ('boot.mount', 'loaded', 'active', None)])
+        self.assertEqual({'ssh': ServiceState.Running.value, 'cron': ServiceState.NotRunning.value, 'bluetooth': ServiceState.NotAvailable.value},
+                         serviceManager.mapServices)
+        serviceManager.OnPropertiesChanged('org.freedesktop.systemd1.Unit', {'ActiveState': 'inactive'}, [], path='/org/freedesktop/systemd1/unit/ssh_2eservice')
+        self.assertEqual(ServiceState.NotRunning.value, serviceManager.mapServices['ssh'])
+
+    def testRun(self):
+        serviceManager = ServiceManager()
+        serviceManager.Run()
+        self.assertIsNotNone(serviceManager.backend)
+        for name, state in serviceManager.mapServices.items():
+            self.assertIn(state, [item.value for item in ServiceState] + [None])
+
+
+if __name__ == '__main__':
+    setInfo()
+    unittest.main()
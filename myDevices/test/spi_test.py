@@ -0,0 +1,81 @@
+import ctypes
+import os
+import unittest
+from tempfile import NamedTemporaryFile
+from threading import Thread
+from time import sleep
+from unittest.mock import patch
+from myDevices.utils.logger import setInfo
+from myDevices.devices import spi
+from myDevices.devices.bus import Bus
+
+
+class LoopbackDevice():
+    """Stand-in for the spidev ioctls, each transfer receives the bytes it sends"""
+
+    def __init__(self):
+        self.settings = {}
+        self.messages = []
+
+    def ioctl(self, fd, request, arg):
+        if request in (spi.SPI_IOC_WR_MODE, spi.SPI_IOC_WR_BITS_PER_WORD, spi.SPI_IOC_WR_MAX_SPEED_HZ):
+            self.settings[request & 0xff] = arg[0]
+        elif request in (spi.SPI_IOC_RD_MODE, spi.SPI_IOC_RD_BITS_PER_WORD, spi.SPI_IOC_RD_MAX_SPEED_HZ):
+            arg[0] = self.settings.get(request & 0xff, 0)
+        else:
+            self.messages.append(len(arg))
+            sleep(0.0001)
+            for message in arg:
+                ctypes.memmove(message.rx_buf, message.tx_buf, message.len)
+        return 0
+
+
+class SPITest(unittest.TestCase):
+    def setUp(self):
+        self.file = NamedTemporaryFile()
+        self.device = LoopbackDevice()
+        open_file = lambda bus: setattr(bus, 'fd', os.open(self.file.name, bus.flag))
+        patches = (patch('myDevices.devices.bus.enableBus'), patch.object(Bus, 'open', open_file), patch.object(spi.fcntl, 'ioctl', self.device.ioctl))
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.spi = spi.SPI(speed=1000000)
+        self.addCleanup(self.file.close)
+        self.addCleanup(self.spi.close)
+
+    def testTransfers(self):
+        self.assertEqual(bytearray(b'\x01\x02'), self.spi.xfer([1, 2]))
+        rx = bytearray(3)
+        self.assertIs(rx, self.spi.xfer_into(b'abc', rx))
+        self.assertEqual(b'abc', rx)
+        self.spi.xfer_into(memoryview(b'def'), rx)
+        self.assertEqual(b'def', rx)
+        self.spi.xfer_into(memoryview(bytearray(b'ghi')).toreadonly(), memoryview(rx))
+        self.assertEqual(b'ghi', rx)
+        rx2 = bytearray(1)
+        self.spi.xfer_multi(((bytearray(b'jkl'), rx), (b'm', rx2), (b'', bytearray())))
+        self.assertEqual((b'jkl', b'm'), (rx, rx2))
+        self.assertEqual([1, 1, 1, 1, 3], self.device.messages)
+        self.assertRaises(ValueError, self.spi.xfer_into, b'ab', rx)
+        self.assertRaises(TypeError, self.spi.xfer_into, b'abc', b'xyz')
+
+    def testThreads(self):
+        failures = []
+        def transfer(value):
+            tx = bytes([value]) * 16
+            rx = bytearray(16)
+            for i in range(200):
+                self.spi.xfer_into(tx, rx)
+                if rx != tx:
+                    failures.append(rx)
+        threads = [Thread(target=transfer, args=(value,)) for value in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], failures)
+
+
+if __name__ == '__main__':
+    setInfo()
+    unittest.main()
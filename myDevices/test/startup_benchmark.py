@@ -0,0 +1,87 @@
+"""
+Benchmark of the agent startup work that depends on hardware detection.
+
+Each run starts a new interpreter, like the agent does at boot, imports the agent modules and runs the
+startup steps that do not need a server connection: building the activation message body, reading the
+system config, creating the hardware and OS info and taking the first system info snapshot. It reports
+the median wall and CPU time of the runs and how many times /proc/cpuinfo and the device tree model were
+opened during startup, followed by the cost of the Hardware() calls made after startup.
+
+Only modules and functions that predate the Hardware singleton are used, so revisions can be compared
+by passing a checkout of each, the runs of the trees are interleaved so load changes affect them equally:
+
+    git worktree add /tmp/before <revision>~1
+    git worktree add /tmp/after <revision>
+    python3 myDevices/test/startup_benchmark.py /tmp/before /tmp/after
+"""
+import json
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+from statistics import median
+
+CHILD = r'''
+import json, sys, time
+WATCHED = ('/proc/cpuinfo', '/proc/device-tree/model')
+opens = {path: 0 for path in WATCHED}
+def audit(event, args):
+    if event == 'open' and args[0] in opens:
+        opens[args[0]] += 1
+sys.addaudithook(audit)
+wall, cpu = time.perf_counter(), time.process_time()
+from myDevices.cloud.client import OSInfo
+from myDevices.cloud.apiclient import CayenneApiClient
+from myDevices.system.hardware import Hardware
+from myDevices.system.systemconfig import SystemConfig
+from myDevices.system.systeminfo import SystemInfo
+steps = (lambda: CayenneApiClient('https://api.mydevices.com').getMessageBody('benchmark'),
+         SystemConfig.getConfig,
+         Hardware,
+         OSInfo,
+         lambda: SystemInfo().getSystemInformation())
+for step in steps:
+    try:
+        step()
+    except Exception:
+        pass
+result = {'wall': time.perf_counter() - wall, 'cpu': time.process_time() - cpu, 'opens': dict(opens)}
+calls = 1000
+start = time.perf_counter()
+for i in range(calls):
+    Hardware().isRaspberryPi()
+result['call'] = (time.perf_counter() - start) / calls
+print(json.dumps(result))
+'''
+
+
+def run(path):
+    """Run the startup steps in a new interpreter and return the measurements dict"""
+    env = dict(os.environ, PYTHONPATH=path, PYTHONDONTWRITEBYTECODE='1')
+    output = subprocess.check_output([sys.executable, '-c', CHILD], env=env, cwd=path, stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark agent startup')
+    parser.add_argument('paths', nargs='*', default=[os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))],
+                        help='roots of the agent source trees to benchmark, by default this tree')
+    parser.add_argument('--runs', type=int, default=20, help='number of interpreter starts per tree')
+    args = parser.parse_args()
+    results = {path: [] for path in args.paths}
+    for path in args.paths:
+        run(path) # warm up the file system cache
+    for i in range(args.runs):
+        for path in args.paths:
+            results[path].append(run(path))
+    print('Agent startup, median of {} runs'.format(args.runs))
+    for path, runs in results.items():
+        print(path)
+        print('  wall time {:8.1f} ms'.format(median(result['wall'] for result in runs) * 1e3))
+        print('  CPU time  {:8.1f} ms'.format(median(result['cpu'] for result in runs) * 1e3))
+        print('  opens     {}'.format(', '.join('{} {}'.format(name, count) for name, count in runs[0]['opens'].items())))
+        print('  Hardware().isRaspberryPi() after startup {:.2f} us/call'.format(median(result['call'] for result in runs) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
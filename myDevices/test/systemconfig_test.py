@@ -1,4 +1,6 @@
+import os
 import unittest
+from tempfile import TemporaryDirectory
 from myDevices.system.systemconfig import SystemConfig
 from myDevices.utils.logger import setInfo, info
 
@@ -11,7 +13,29 @@ class SystemConfigTest(unittest.TestCase):
             for item in ('DeviceTree', 'Serial', 'I2C', 'SPI', 'OneWire'):
                 self.assertIn(item, config)
 
+    def testReadConfig(self):
+        path = SystemConfig.path
+        watch = SystemConfig.watch
+        with TemporaryDirectory() as temp_dir:
+            try:
+                SystemConfig.path = os.path.join(temp_dir, 'config.txt')
+                SystemConfig.watch = None
+                with open(SystemConfig.path, 'w') as config_file:
+                    config_file.write('dtparam=audio=on,i2c_arm=on\n#dtparam=spi=on\nenable_uart=0\n')
+                SystemConfig.isModified()
+                self.assertEqual({'DeviceTree': 1, 'I2C': 1, 'SPI': 0, 'OneWire': 0, 'Serial': 0}, SystemConfig.readConfig())
+                self.assertFalse(SystemConfig.isModified())
+                with open(SystemConfig.path, 'a') as config_file:
+                    config_file.write('dtparam=spi=on\ndtoverlay=w1-gpio\n')
+                self.assertTrue(SystemConfig.isModified())
+                self.assertEqual({'DeviceTree': 1, 'I2C': 1, 'SPI': 1, 'OneWire': 1, 'Serial': 0}, SystemConfig.readConfig())
+            finally:
+                if SystemConfig.watch >= 0:
+                    os.close(SystemConfig.watch)
+                SystemConfig.path = path
+                SystemConfig.watch = watch
+
         
 if __name__ == '__main__':
     setInfo()
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -1,5 +1,12 @@
+import os
+import shutil
 import unittest
+from tempfile import TemporaryDirectory, NamedTemporaryFile
 from myDevices.system.systeminfo import SystemInfo
+from myDevices.system.sampler import NetworkSampler, SystemSampler
+from myDevices.system.cpu import CpuInfo, ThermalZones
+import socket
+from myDevices.system.network import readWireless, receiveEvents, settle, NLMSGHDR, RTM_NEWADDR
 from myDevices.utils.logger import setInfo, info
 
 
@@ -25,7 +32,109 @@ class SystemInfoTest(unittest.TestCase):
         self.assertEqual(self.info['sys:storage:/;usage']['unit'], 'b')
         self.assertIn('sys:net;ip', self.info)
         # self.assertIn('sys:net;ssid', self.info)
-        
-        
+
+    def testSampler(self):
+        metrics = SystemSampler().Sample(0)
+        self.assertGreaterEqual(metrics['cpu'], 0)
+        self.assertLessEqual(metrics['cpu'], 100)
+        self.assertGreaterEqual(len(metrics['cores']), 1)
+        self.assertEqual(3, len(metrics['loadavg']))
+        self.assertEqual((50.0, 25.0), SystemSampler.GetLoad([20, 0, 10, 30, 20, 0, 0, 0], [10, 0, 0, 20, 10, 0, 0, 0]))
+
+    def testSamplerOfflineCores(self):
+        stat_path = SystemSampler.stat_path
+        with NamedTemporaryFile('w') as stat_file:
+            stat_file.write('cpu  40 0 0 60 0 0 0 0 0 0\n'
+                'cpu0 10 0 0 10 0 0 0 0 0 0\n'
+                'cpu2 30 0 0 10 0 0 0 0 0 0\n'
+                'cpu10 0 0 0 40 0 0 0 0 0 0\n'
+                'intr 0\n')
+            stat_file.flush()
+            try:
+                SystemSampler.stat_path = stat_file.name
+                SystemSampler().cpuTimes = {}
+                self.assertEqual([50.0, 75.0, 0.0], SystemSampler().Sample(0)['cores'])
+            finally:
+                SystemSampler.stat_path = stat_path
+                SystemSampler().cpuTimes = {}
+
+
+    def testThermalZones(self):
+        path = ThermalZones.path
+        with TemporaryDirectory() as temp_dir:
+            for zone, zone_type, temp in ((0, 'cpu_thermal', 50843), (1, 'gpu_thermal', 48000), (10, 'pmic_thermal', 40500)):
+                zone_dir = os.path.join(temp_dir, 'thermal_zone{}'.format(zone))
+                os.mkdir(zone_dir)
+                with open(os.path.join(zone_dir, 'type'), 'w') as type_file:
+                    type_file.write(zone_type + '\n')
+                with open(os.path.join(zone_dir, 'temp'), 'w') as temp_file:
+                    temp_file.write('{}\n'.format(temp))
+            try:
+                ThermalZones.path = temp_dir
+                ThermalZones.close()
+                self.assertEqual(50.843, CpuInfo.get_cpu_temp())
+                self.assertEqual([('cpu_thermal', 50.843), ('gpu_thermal', 48.0), ('pmic_thermal', 40.5)], CpuInfo.get_thermal_zone_temps())
+                with open(os.path.join(temp_dir, 'thermal_zone0', 'temp'), 'w') as temp_file:
+                    temp_file.write('51000\n')
+                self.assertEqual(51.0, CpuInfo.get_cpu_temp())
+                with open(os.path.join(temp_dir, 'thermal_zone1', 'temp'), 'w') as temp_file:
+                    temp_file.write('invalid\n')
+                self.assertEqual([('cpu_thermal', 51.0), ('pmic_thermal', 40.5)], CpuInfo.get_thermal_zone_temps())
+                self.assertEqual(3, len(ThermalZones.zones))
+                os.close(ThermalZones.zones[2][1])
+                self.assertEqual([('cpu_thermal', 51.0)], CpuInfo.get_thermal_zone_temps())
+                self.assertIsNone(ThermalZones.zones)
+                self.assertEqual([('cpu_thermal', 51.0), ('pmic_thermal', 40.5)], CpuInfo.get_thermal_zone_temps())
+                self.assertEqual(['cpu_thermal', 'gpu_thermal', 'pmic_thermal'], [name for name, fd in ThermalZones.zones])
+                for zone in os.listdir(temp_dir):
+                    shutil.rmtree(os.path.join(temp_dir, zone))
+                for name, fd in ThermalZones.zones:
+                    os.close(fd)
+                self.assertEqual(0.0, CpuInfo.get_cpu_temp())
+                self.assertEqual([], CpuInfo.get_thermal_zone_temps())
+                os.mkdir(os.path.join(temp_dir, 'thermal_zone0'))
+                with open(os.path.join(temp_dir, 'thermal_zone0', 'type'), 'w') as type_file:
+                    type_file.write('cpu_thermal\n')
+                with open(os.path.join(temp_dir, 'thermal_zone0', 'temp'), 'w') as temp_file:
+                    temp_file.write('52000\n')
+                self.assertEqual(52.0, CpuInfo.get_cpu_temp())
+            finally:
+                ThermalZones.close()
+                ThermalZones.path = path
+
+    def testWireless(self):
+        with NamedTemporaryFile('w') as wireless_file:
+            wireless_file.write('Inter-| sta-|   Quality        |   Discarded packets               | Missed | WE\n'
+                ' face | tus | link level noise |  nwid  crypt   frag  retry   misc | beacon | 22\n'
+                ' wlan0: 0000   70.  -40.  -256        0      0      0      0      0        0\n')
+            wireless_file.flush()
+            self.assertEqual({'wlan0': {'link': 70.0, 'level': -40.0, 'noise': -256.0}}, readWireless(wireless_file.name))
+
+    def testNetworkEvents(self):
+        receiver, sender = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            receiver.settimeout(1)
+            sender.send(NLMSGHDR.pack(NLMSGHDR.size, 3, 0, 0, 0) + NLMSGHDR.pack(NLMSGHDR.size, RTM_NEWADDR, 0, 0, 0))
+            self.assertTrue(receiveEvents(receiver))
+            sender.send(NLMSGHDR.pack(NLMSGHDR.size, 3, 0, 0, 0))
+            self.assertFalse(receiveEvents(receiver))
+            for i in range(3):
+                sender.send(b'event')
+            settle(receiver)
+            self.assertEqual(1, receiver.gettimeout())
+            receiver.setblocking(False)
+            self.assertRaises(BlockingIOError, receiver.recv, 16)
+        finally:
+            receiver.close()
+            sender.close()
+
+    def testNetworkSampler(self):
+        self.assertEqual({'rxrate': 100.0, 'txrate': 50.0, 'rxpackets': 2.0, 'txpackets': 1.0, 'errors': 1, 'drops': 3},
+            NetworkSampler.GetRates([1200, 14, 1, 2] + [0] * 4 + [600, 7, 0, 1] + [0] * 4, [1000, 10, 0, 0] + [0] * 4 + [500, 5, 0, 0] + [0] * 4, 2))
+        self.assertEqual(0, NetworkSampler.GetRates([10] * 16, [20] * 16, 2)['rxrate'])
+        for metrics in NetworkSampler().Sample(0).values():
+            self.assertGreaterEqual(metrics['rxrate'], 0)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
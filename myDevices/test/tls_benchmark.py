@@ -0,0 +1,103 @@
+"""
+Benchmark of the client CPU cost of TLS handshakes with and without session resumption.
+
+A local TLS server stands in for the broker, using a self-signed RSA-2048 certificate generated with
+openssl. Each connection is made with the shared SessionContext used by CayenneMQTTClient. The client
+thread CPU time of the handshake is measured with full handshakes, with the saved session offered on
+every connection, and for loading the system CA bundle, which the shared context only does once.
+
+    python3 -m myDevices.test.tls_benchmark --connections 200
+"""
+import os
+import socket
+import ssl
+import subprocess
+import time
+from argparse import ArgumentParser
+from statistics import median
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+from myDevices.cloud.cayennemqtt import CA_CERTS, SessionContext
+
+
+class TLSServer():
+    """TLS server that sends one byte after the handshake, so TLS 1.3 session tickets reach the client, then waits for one byte"""
+
+    def __init__(self, cert, key):
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, address = self.server.accept()
+            except OSError:
+                return
+            try:
+                with self.context.wrap_socket(connection, server_side=True) as tls_connection:
+                    tls_connection.sendall(b'x')
+                    tls_connection.recv(1)
+            except OSError:
+                pass
+
+    def close(self):
+        self.server.close()
+
+
+def handshake(context, port, resume):
+    """Connect, returning the client CPU time of the handshake and whether the session was resumed"""
+    with socket.create_connection(('127.0.0.1', port)) as connection:
+        start = time.thread_time()
+        tls_connection = context.wrap_socket(connection, server_hostname='localhost')
+        cpu = time.thread_time() - start
+        tls_connection.recv(1)
+        reused = tls_connection.session_reused
+        if resume:
+            context.save_session('localhost', tls_connection)
+        tls_connection.sendall(b'y')
+        tls_connection.close()
+    return cpu, reused
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark TLS handshake CPU cost')
+    parser.add_argument('--connections', type=int, default=200, help='number of connections per mode')
+    args = parser.parse_args()
+    with TemporaryDirectory() as temp_dir:
+        cert = os.path.join(temp_dir, 'cert.pem')
+        key = os.path.join(temp_dir, 'key.pem')
+        subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                               '-addext', 'subjectAltName=DNS:localhost', '-keyout', key, '-out', cert],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        server = TLSServer(cert, key)
+        try:
+            # Full and resumed connections are interleaved so load changes affect both equally
+            contexts = {}
+            results = {False: [], True: []}
+            for resume in results:
+                contexts[resume] = SessionContext()
+                contexts[resume].load_verify_locations(cert)
+                handshake(contexts[resume], server.port, resume)
+            for i in range(args.connections):
+                for resume in results:
+                    results[resume].append(handshake(contexts[resume], server.port, resume))
+            print('Client CPU per handshake, median of {} connections'.format(args.connections))
+            for resume, connections in results.items():
+                print('  {:<16} {:7.0f} us  ({}/{} resumed)'.format('resumed session' if resume else 'full handshake',
+                      median(cpu for cpu, reused in connections) * 1e6, sum(reused for cpu, reused in connections), args.connections))
+        finally:
+            server.close()
+    if os.path.exists(CA_CERTS):
+        start = time.thread_time()
+        ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT).load_verify_locations(CA_CERTS)
+        print('  {:<16} {:7.1f} ms  (once per process with the shared context)'.format('CA bundle load', (time.thread_time() - start) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
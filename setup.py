@@ -50,6 +50,7 @@ setup(name             = 'myDevices',
       classifiers      = classifiers,
       packages         = ["myDevices", "myDevices.cloud", "myDevices.utils", "myDevices.system", "myDevices.sensors" , "myDevices.schedule", "myDevices.requests_futures", "myDevices.devices", "myDevices.devices.analog", "myDevices.devices.digital", "myDevices.devices.sensor", "myDevices.decorators", "myDevices.plugins"],
       install_requires = ['enum34', 'netifaces >= 0.10.5', 'psutil >= 0.7.0', 'requests', 'paho-mqtt'],
+      extras_require   = {'msgpack': ['msgpack'], 'cbor': ['cbor2']},
       data_files       = [('/etc/myDevices/scripts', ['scripts/config.sh'])]
       )
 